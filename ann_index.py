@@ -0,0 +1,259 @@
+"""
+Approximate nearest-neighbour search for "more like this".
+
+The exact engine in similarity.py touches the posting list of every query
+feature, so its cost grows with the catalog. This index gives every title a
+small dense embedding and searches only a few clusters of them (IVF):
+
+- The embedding is a sparse random projection (feature hashing) of the
+  title's TF-IDF vector. Each feature adds its weight, with a random sign, to
+  one of 64 dimensions, and the result is L2-normalized. Dot products between
+  embeddings approximate the cosine similarities of the sparse vectors.
+- A spherical k-means coarse quantizer, trained on a sample, splits the
+  embeddings into `lists` clusters. They are stored grouped by cluster, so a
+  cluster is one contiguous slice.
+- A query scores the centroids, then scans the `nprobe` closest clusters
+  exactly. Raising nprobe trades speed for recall.
+
+The arrays are saved as .npy files and opened with mmap_mode='r', so every
+worker process on a machine shares the same pages. An index is only used for
+the catalog version it was built from, so `build` indexes the catalog the app
+serves: the current version of the catalog store, or the published bundle in
+serving mode, or catalog.arrow while the store is empty.
+
+    python ann_index.py build --output ann_index
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from catalog import id_numbers, open_catalog
+from interned import csr_slices
+from similarity import SimilarityIndex
+
+ANN_PATH = 'ann_index'
+DIMENSIONS = 64
+HASHES = 1  # dimensions each feature is projected onto
+LISTS = 1024
+NPROBE = 32
+TRAIN_SAMPLE = 65536
+ITERATIONS = 10
+CHUNK_ROWS = 65536
+
+ARRAYS = ['centroids', 'offsets', 'ids', 'vectors', 'dims', 'signs']
+
+
+def catalog_fingerprint(tconst, similarity):
+    """
+    Identifies a catalog by its titles and their features, so a saved index is
+    never used with another catalog. The projection is looked up by feature
+    id, and the same titles with other genres, directors or cast have other
+    feature ids, so the ids alone do not identify the catalog.
+    """
+    digest = hashlib.sha256(id_numbers(tconst).tobytes())
+    digest.update(np.int64(len(similarity.weights)).tobytes())
+    digest.update(np.ascontiguousarray(similarity.row_offsets, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(similarity.row_features, dtype=np.int32).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def projection(num_features, dimensions=DIMENSIONS, hashes=HASHES, seed=0):
+    """Random target dimensions and signs for every feature."""
+    rng = np.random.default_rng(seed)
+    dims = rng.integers(0, dimensions, size=(num_features, hashes)).astype(np.int16)
+    signs = rng.choice(np.array([-1, 1], dtype=np.float32), size=(num_features, hashes)) / np.sqrt(hashes)
+    return dims, signs.astype(np.float32)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _project(local_rows, num_rows, features, values, dims, signs, dimensions):
+    """Sums the projected features into one embedding per local row."""
+    embeddings = np.zeros(num_rows * dimensions)
+    for j in range(dims.shape[1]):
+        embeddings += np.bincount(local_rows * dimensions + dims[features, j],
+                                  weights=values * signs[features, j], minlength=num_rows * dimensions)
+    return _normalize(embeddings.reshape(num_rows, dimensions).astype(np.float32))
+
+
+def embed_rows(similarity, rows, dims, signs, dimensions=DIMENSIONS):
+    """Embeddings of the titles `rows`, one row per title."""
+    rows = np.asarray(rows, dtype=np.int64)
+    positions, local_rows = csr_slices(similarity.row_offsets[rows], similarity.row_offsets[rows + 1])
+    features = similarity.row_features[positions]
+    values = similarity.weights[features] / similarity.norms[rows[local_rows]]
+    return _project(local_rows, len(rows), features, values, dims, signs, dimensions)
+
+
+def embed_catalog(similarity, dims, signs, dimensions=DIMENSIONS, chunk_rows=CHUNK_ROWS):
+    """Embeddings of every title, computed a chunk of rows at a time to bound memory."""
+    chunks = [embed_rows(similarity, np.arange(start, min(start + chunk_rows, similarity.num_rows)), dims, signs,
+                         dimensions)
+              for start in range(0, similarity.num_rows, chunk_rows)]
+    return np.concatenate(chunks) if chunks else np.zeros((0, dimensions), dtype=np.float32)
+
+
+def embed_query(features, values, dims, signs, dimensions=DIMENSIONS):
+    """Embedding of a query vector from SimilarityIndex.query_vector."""
+    return _project(np.zeros(len(features), dtype=np.int64), 1, features, values, dims, signs, dimensions)[0]
+
+
+def _nearest(vectors, centroids, chunk_rows=CHUNK_ROWS):
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_rows):
+        labels[start:start + chunk_rows] = np.argmax(vectors[start:start + chunk_rows] @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(vectors, lists=LISTS, iterations=ITERATIONS, sample=TRAIN_SAMPLE, seed=0):
+    """Spherical k-means on a sample of the embeddings."""
+    rng = np.random.default_rng(seed)
+    lists = min(lists, len(vectors))
+    sample = vectors[rng.choice(len(vectors), size=min(sample, len(vectors)), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _nearest(sample, centroids)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=lists)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        used = counts > 0
+        centroids[used] = np.add.reduceat(sample[order], starts[used], axis=0)
+        # Empty clusters restart from random sample points
+        centroids[~used] = sample[rng.choice(len(sample), size=int((~used).sum()))]
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class AnnIndex:
+    """IVF index over the title embeddings; arrays may be memory-mapped."""
+
+    def __init__(self, centroids, offsets, ids, vectors, dims, signs, meta):
+        self.centroids = centroids  # (lists, dimensions)
+        self.offsets = offsets      # cluster -> slice of ids/vectors
+        self.ids = ids              # catalog row of each stored vector
+        self.vectors = vectors      # embeddings grouped by cluster
+        self.dims = dims            # feature -> projected dimensions
+        self.signs = signs          # feature -> signs of those dimensions
+        self.meta = meta
+
+    @classmethod
+    def build(cls, similarity, fingerprint='', lists=LISTS, dimensions=DIMENSIONS, hashes=HASHES,
+              iterations=ITERATIONS, seed=0):
+        dims, signs = projection(len(similarity.weights), dimensions, hashes, seed)
+        embeddings = embed_catalog(similarity, dims, signs, dimensions)
+        centroids = train_centroids(embeddings, lists, iterations, seed=seed)
+        labels = _nearest(embeddings, centroids)
+        order = np.argsort(labels, kind='stable').astype(np.int32)
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(centroids)), out=offsets[1:])
+        meta = {'rows': similarity.num_rows, 'lists': len(centroids), 'dimensions': dimensions,
+                'fingerprint': fingerprint}
+        return cls(centroids, offsets, order, embeddings[order], dims, signs, meta)
+
+    def save(self, path=ANN_PATH):
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+        # Written last: an index without meta.json is incomplete and is not loaded
+        with open(meta_path, 'w') as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path=ANN_PATH, mmap_mode='r'):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in ARRAYS]
+        return cls(*arrays, meta)
+
+    def search(self, query, k=10, nprobe=NPROBE, allowed=None, exclude=()):
+        """
+        Returns (row ids, scores) of the `k` stored vectors closest to `query` in
+        the `nprobe` nearest clusters. `allowed` is an optional boolean mask over
+        catalog rows; rows in `exclude` are never returned.
+        """
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        # Scanning the probed clusters in storage order keeps memory-mapped reads sequential
+        probes.sort()
+        ids = np.concatenate([self.ids[self.offsets[c]:self.offsets[c + 1]] for c in probes])
+        scores = np.concatenate([self.vectors[self.offsets[c]:self.offsets[c + 1]] @ query for c in probes])
+        keep = ~np.isin(ids, exclude) if len(exclude) else np.ones(len(ids), dtype=bool)
+        if allowed is not None:
+            keep &= allowed[ids]
+        ids, scores = ids[keep], scores[keep]
+        k = min(k, len(ids))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.lexsort((ids[best], -scores[best]))]
+        return ids[best].astype(np.int64), scores[best]
+
+    def similar(self, similarity, rows, k=10, nprobe=NPROBE, allowed=None, row_weights=None):
+        """Approximate SimilarityIndex.similar: the `k` titles most like `rows`, leaving `rows` out."""
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        features, values = similarity.query_vector(rows, row_weights)
+        query = embed_query(features, values, self.dims, self.signs, self.meta['dimensions'])
+        return self.search(query, k, nprobe, allowed, exclude=rows)
+
+
+def load_ann_index(path=ANN_PATH, fingerprint=None, num_features=None):
+    """Opens a saved index, or returns None if there is none or it was built for another catalog."""
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    index = AnnIndex.load(path)
+    # Its projection must also cover exactly the features of the catalog's similarity index
+    if ((fingerprint is not None and index.meta['fingerprint'] != fingerprint)
+            or (num_features is not None and len(index.dims) != num_features)):
+        print(f"Not using the ANN index in {path}: it was built for another catalog version "
+              f"({index.meta.get('version', 'unknown')}); rebuild it with `python ann_index.py build`",
+              file=sys.stderr, flush=True)
+        return None
+    return index
+
+
+def build_ann_index(output=ANN_PATH, lists=LISTS, catalog_path=None):
+    """
+    Builds the index for the catalog snapshot the app serves (or for the
+    catalog file `catalog_path`) and saves it to `output`.
+    """
+    from catalog_store import CatalogSnapshot
+    from engine import open_live_catalog
+    snapshot = CatalogSnapshot.build(0, open_catalog(catalog_path)) if catalog_path else open_live_catalog().current()
+    # The same similarity index the app builds for this snapshot (engine.VersionIndexes)
+    similarity = snapshot.shared.get('similarity') or SimilarityIndex.build(snapshot.df, snapshot.filter_index)
+    index = AnnIndex.build(similarity, catalog_fingerprint(snapshot.table.column('tconst'), similarity), lists)
+    index.meta['version'] = snapshot.version
+    index.save(output)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the approximate nearest-neighbour index.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="embed and cluster every catalog title")
+    build.add_argument('--catalog', default=None,
+                       help="index this catalog file instead of the catalog the app serves")
+    build.add_argument('--output', default=ANN_PATH)
+    build.add_argument('--lists', type=int, default=LISTS, help="number of k-means clusters")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = build_ann_index(args.output, args.lists, args.catalog)
+    print(f"Indexed {index.meta['rows']} titles of catalog version {index.meta['version']} in "
+          f"{index.meta['lists']} clusters to {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Headless HTTP/JSON API over the recommendation engine.
+
+Serves the same filters and rankings as the Streamlit app, from the same
+local catalog, to other services and load tests. All endpoints but the GET
+ones take a JSON body with an optional 'filters' selection (see engine.py):
+
+    POST /recommendations  {"filters": {...}, "limit": 20, "cursor": "..."}
+         -> {"version", "total", "titles": [...], "next_cursor"}
+    POST /search           {"filters": {...}, "text": "star wa", "limit": 20}
+    POST /similar          {"filters": {...}, "tconst": "tt0076759", "limit": 20}
+    POST /facets           {"filters": {...}}  -> option counts and slider bounds
+    GET  /health, GET /stats, GET /metrics (Prometheus text, with APP_METRICS set)
+
+Recommendations are paged with an opaque cursor: pass back the next_cursor of
+one response to get the following page. A cursor only pages through the
+catalog version it came from; once the catalog is updated it is answered
+with 409, and paging starts again from the first page. Every request runs on its own thread
+(ThreadingHTTPServer with keep-alive); the engine's work is numpy, which
+releases the GIL for the heavy parts, and filter results are shared through
+the query cache.
+
+    python api.py --port 8000
+    CATALOG_SERVE=serving python api.py    # attach to a published bundle (serving.py)
+"""
+import argparse
+import json
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from engine import PAGE_SIZE, RecommendationEngine, SelectionError, StaleCursorError, open_live_catalog
+from metrics import Metrics
+
+HOST = '127.0.0.1'
+PORT = 8000
+
+# Pending connections the listening socket queues; the default of 5 drops bursts of clients
+BACKLOG = 1024
+
+# Largest request body accepted, in bytes
+MAX_BODY = 1 << 20
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        self._send(json.dumps(data).encode(), 'application/json', status)
+
+    def _send(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_internal_error(self):
+        # Every request gets an answer, even one the engine failed on; the traceback goes to stderr
+        traceback.print_exc()
+        self.close_connection = True
+        self._send_json({'error': 'internal server error'}, 500)
+
+    def do_GET(self):
+        try:
+            self._get()
+        except Exception:
+            self._send_internal_error()
+
+    def _get(self):
+        engine = self.server.engine
+        if self.path == '/health':
+            self._send_json({'status': 'ok', 'version': engine.catalog.current().version})
+        elif self.path == '/stats':
+            self._send_json({'uptime': time.monotonic() - self.server.started,
+                             'query_cache': engine.query_cache.stats(),
+                             'metrics': self.server.metrics.snapshot()})
+        elif self.path == '/metrics':
+            self._send(self.server.metrics.prometheus().encode(), 'text/plain; version=0.0.4')
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        try:
+            self._post()
+        except Exception:
+            self._send_internal_error()
+
+    def _post(self):
+        handler = ROUTES.get(self.path)
+        length = _content_length(self.headers)
+        if length is None:
+            # Without a valid length the end of the body is unknown, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json({'error': 'Content-Length must be a non-negative integer'}, 400)
+            return
+        if length > MAX_BODY:
+            self.close_connection = True
+            self._send_json({'error': 'request body too large'}, 413)
+            return
+        body = self.rfile.read(length)
+        if handler is None:
+            self._send_json({'error': 'not found'}, 404)
+            return
+        try:
+            request = json.loads(body or b'{}')
+            if not isinstance(request, dict):
+                raise SelectionError("the request body must be a JSON object")
+            engine = self.server.engine
+            # Each endpoint is one stage of the metrics, named after its handler
+            with self.server.metrics.timer(handler.__name__):
+                query = engine.query(request.get('filters'))
+                result = handler(engine, query, request)
+            self._send_json(result)
+        except StaleCursorError as error:
+            self._send_json({'error': str(error)}, 409)
+        except (SelectionError, json.JSONDecodeError) as error:
+            self._send_json({'error': str(error)}, 400)
+        except LookupError as error:
+            self._send_json({'error': str(error)}, 404)
+
+
+def _content_length(headers):
+    """The request's body length in bytes, or None if it is missing, negative or not an integer."""
+    value = headers.get('Content-Length')
+    # int() would also take signs, underscores and non-ASCII digits
+    if value is None or not value.isascii() or not value.isdigit():
+        return None
+    return int(value)
+
+
+def _limit(request):
+    try:
+        return int(request.get('limit', PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise SelectionError("'limit' must be an integer") from None
+
+
+def recommendations(engine, query, request):
+    rows, cursor = engine.page(query, request.get('cursor'), _limit(request))
+    return {'version': query.snapshot.version, 'total': len(query.rows),
+            'titles': engine.titles(query.snapshot, rows), 'next_cursor': cursor}
+
+
+def search(engine, query, request):
+    text = request.get('text')
+    if not isinstance(text, str):
+        raise SelectionError("'text' must be a string")
+    rows = engine.search(query, text, _limit(request))
+    return {'version': query.snapshot.version, 'titles': engine.titles(query.snapshot, rows)}
+
+
+def similar(engine, query, request):
+    tconst = request.get('tconst')
+    if not isinstance(tconst, str):
+        raise SelectionError("'tconst' must be an IMDb id like 'tt0076759'")
+    rows = engine.similar(query, query.indexes.row(tconst), _limit(request))
+    return {'version': query.snapshot.version, 'titles': engine.titles(query.snapshot, rows)}
+
+
+def facets(engine, query, request):
+    summary = query.snapshot.facets
+    return {
+        'version': query.snapshot.version,
+        'total': len(query.rows),
+        'options': {name: dict(zip(summary.options(name), engine.counts(query, name).tolist()))
+                    for name in ['available_languages', 'genres']},
+        'bounds': {name: list(bounds) for name, bounds in summary.bounds.items()},
+        'people': {name: {entry: None if person is None else query.indexes.name_search[name].vocabulary[person]
+                          for entry, person in entries.items()} for name, entries in query.people.items()},
+    }
+
+
+ROUTES = {'/recommendations': recommendations, '/search': search, '/similar': similar, '/facets': facets}
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = BACKLOG
+
+    def __init__(self, address, engine, metrics=None):
+        super().__init__(address, ApiHandler)
+        self.engine = engine
+        self.metrics = metrics or Metrics()
+        self.started = time.monotonic()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the recommendation engine over HTTP.")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+
+    engine = RecommendationEngine(open_live_catalog())
+    # Build the indexes before taking requests, so the first ones do not wait for them
+    engine.indexes()
+    server = ApiServer((args.host, args.port), engine)
+    print(f"Serving the recommendation API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
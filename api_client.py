@@ -0,0 +1,249 @@
+"""
+Shared HTTP client for the TMDB and OMDb APIs.
+
+One requests.Session with a keep-alive connection pool serves every call, so
+repeated requests to the same host skip the TCP/TLS handshake. Each host has a
+token-bucket rate limit and a circuit breaker. Transient failures (connection
+errors, timeouts, 429 and 5xx) are retried with jittered exponential backoff
+via tenacity. Every attempt's latency is recorded in a per-endpoint histogram.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+# Overridable so the app can run against a local stub server
+OMDB_URL = os.environ.get('OMDB_URL', 'http://www.omdbapi.com/')
+TMDB_URL = os.environ.get('TMDB_URL', 'https://api.themoviedb.org/')
+
+# (connect, read) timeouts for each attempt, in seconds
+TIMEOUT = (3.05, 10)
+
+# Requests per second and burst size per host; other hosts (poster CDNs) use DEFAULT_RATE
+RATE_LIMITS = {
+    'www.omdbapi.com': (10, 20),
+    'api.themoviedb.org': (20, 40),
+}
+DEFAULT_RATE = (50, 100)
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, with bursts of up to `burst` calls."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Stops calling a host after repeated failures, then lets one trial call through."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = None      # thread making the half-open trial call
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """True if a call may go ahead."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial is not None:
+                return False
+            # Half-open: let exactly one call probe the host
+            self._trial = threading.get_ident()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial = None
+
+    def release(self):
+        """
+        Ends this thread's trial call without a verdict on the host (e.g. the
+        request was malformed), so the next call may probe it instead.
+        """
+        with self._lock:
+            if self._trial == threading.get_ident():
+                self._trial = None
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of call durations in seconds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile."""
+        with self._lock:
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if count and seen >= rank:
+                    return bound
+        return 0.0
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.sum
+        return {
+            'count': count,
+            'sum': total,
+            'buckets': dict(zip([str(bound) for bound in self.buckets], counts)),
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+        }
+
+
+def _is_retryable(error):
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUS
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class ApiClient:
+    """Pooled, rate-limited, retrying HTTP client shared by every session of a worker."""
+
+    def __init__(self, rate_limits=RATE_LIMITS, default_rate=DEFAULT_RATE, pool_size=16,
+                 attempts=3, timeout=TIMEOUT):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.rate_limits = rate_limits
+        self.default_rate = default_rate
+        self.attempts = attempts
+        self.timeout = timeout
+        self._buckets = {}
+        self._breakers = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _per_host(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(*self.rate_limits.get(host, self.default_rate))
+                self._breakers[host] = CircuitBreaker()
+            return self._buckets[host], self._breakers[host]
+
+    def histogram(self, endpoint):
+        with self._lock:
+            if endpoint not in self._histograms:
+                self._histograms[endpoint] = LatencyHistogram()
+            return self._histograms[endpoint]
+
+    def _attempt(self, endpoint, url, kwargs):
+        bucket, breaker = self._per_host(urlparse(url).hostname)
+        if not breaker.allow():
+            raise CircuitOpenError(f"circuit open for {urlparse(url).hostname}")
+        bucket.acquire()
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=self.timeout, **kwargs)
+            if response.status_code in RETRY_STATUS:
+                response.raise_for_status()
+        except requests.RequestException as error:
+            self.histogram(endpoint).observe(time.perf_counter() - start)
+            if _is_retryable(error):
+                breaker.record_failure()
+            raise
+        else:
+            self.histogram(endpoint).observe(time.perf_counter() - start)
+            breaker.record_success()
+            return response
+        finally:
+            # A trial call that ended any other way must not keep the host's breaker open for good
+            breaker.release()
+
+    def get(self, endpoint, url, **kwargs):
+        """
+        GETs `url`, retrying transient failures, and returns the response.
+        `endpoint` names the call for the latency histograms (e.g. 'omdb').
+        """
+        retrying = Retrying(
+            stop=stop_after_attempt(self.attempts),
+            wait=wait_random_exponential(multiplier=0.2, max=2),
+            retry=retry_if_exception(_is_retryable),
+            reraise=True,
+        )
+        return retrying(self._attempt, endpoint, url, kwargs)
+
+    def get_json(self, endpoint, url, **kwargs):
+        return self.get(endpoint, url, **kwargs).json()
+
+    def stats(self):
+        """Latency histograms per endpoint and breaker state per host, for monitoring."""
+        with self._lock:
+            histograms = dict(self._histograms)
+            breakers = dict(self._breakers)
+        return {
+            'latency': {endpoint: histogram.snapshot() for endpoint, histogram in histograms.items()},
+            'circuits': {host: breaker.state for host, breaker in breakers.items()},
+        }
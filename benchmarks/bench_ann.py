@@ -0,0 +1,77 @@
+"""
+Recall and throughput of the approximate nearest-neighbour index.
+
+Builds the IVF index over a synthetic catalog (or a real one), saves it and
+reopens it memory-mapped, then compares every nprobe setting against a brute
+force scan of the same embeddings. It reports recall@k and queries per second.
+
+    python benchmarks/bench_ann.py --rows 1000000 --queries 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ann_index import LISTS, AnnIndex, catalog_fingerprint, embed_query  # noqa: E402
+from catalog import LIST_COLUMNS, catalog_frame, open_catalog  # noqa: E402
+from filter_index import FilterIndex  # noqa: E402
+from similarity import SimilarityIndex  # noqa: E402
+from synthetic import synthetic_catalog  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ANN index against brute force.")
+    parser.add_argument('--catalog', default=None, help="catalog file to use instead of a synthetic one")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--lists', type=int, default=LISTS)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    table = open_catalog(args.catalog) if args.catalog else synthetic_catalog(args.rows)
+    df = catalog_frame(table)
+    similarity = SimilarityIndex.build(df, FilterIndex.build(df, LIST_COLUMNS))
+    start = time.perf_counter()
+    built = AnnIndex.build(similarity, catalog_fingerprint(table.column('tconst'), similarity), args.lists)
+    print(f"{len(df):,} titles in {built.meta['lists']} lists, built in {time.perf_counter() - start:.1f}s")
+
+    with tempfile.TemporaryDirectory() as path:
+        built.save(path)
+        index = AnnIndex.load(path)
+
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(df), size=args.queries, replace=False)
+        queries = [embed_query(*similarity.query_vector([row]), index.dims, index.signs, index.meta['dimensions'])
+                   for row in rows]
+
+        # Brute force over the same embeddings, in catalog row order
+        embeddings = np.empty_like(index.vectors)
+        embeddings[index.ids] = index.vectors
+        start = time.perf_counter()
+        exact = []
+        for row, query in zip(rows, queries):
+            scores = embeddings @ query
+            scores[row] = -np.inf
+            exact.append(set(np.argpartition(-scores, args.k - 1)[:args.k].tolist()))
+        brute_qps = len(rows) / (time.perf_counter() - start)
+        print(f"{'method':<14}{'recall@' + str(args.k):>10}{'QPS':>10}")
+        print(f"{'brute force':<14}{1:>10.3f}{brute_qps:>10.0f}")
+
+        for nprobe in args.nprobe:
+            start = time.perf_counter()
+            found = [index.search(query, args.k, nprobe, exclude=[row])[0] for row, query in zip(rows, queries)]
+            qps = len(rows) / (time.perf_counter() - start)
+            recall = np.mean([len(exact_ids.intersection(ids.tolist())) / args.k
+                              for exact_ids, ids in zip(exact, found)])
+            print(f"{'nprobe=' + str(nprobe):<14}{recall:>10.3f}{qps:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
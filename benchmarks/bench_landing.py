@@ -0,0 +1,94 @@
+"""
+Server CPU spent on idle landing-page viewers.
+
+The trending carousel used to advance by rerunning main.py on the server
+every ROTATE_SECONDS for every open landing page (st_autorefresh); it now
+rotates in the browser. This starts a number of app sessions on the landing
+page (through Streamlit's AppTest, in this process, against the local TMDB
+stub), then leaves them open for a while in two ways:
+
+- rerun: every session reruns the script every ROTATE_SECONDS, as the
+  st_autorefresh timer made each browser do
+- client-side: the sessions stay idle, as the browser-side carousel lets them
+
+and reports the CPU the process used in each case, per viewer and in total.
+
+    python benchmarks/bench_landing.py --viewers 50 --seconds 30
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_api import start_stub_server  # noqa: E402
+
+
+def open_viewers(count):
+    from streamlit.testing.v1 import AppTest
+    viewers = []
+    for _ in range(count):
+        viewer = AppTest.from_file(os.path.join(ROOT, 'main.py'), default_timeout=60)
+        viewer.secrets['tmdb_api'] = {'api_key': 'bench'}
+        viewer.secrets['omdb_api'] = {'api_key': 'bench'}
+        viewer.run()
+        if viewer.exception:
+            raise RuntimeError(viewer.exception[0].message)
+        viewers.append(viewer)
+    return viewers
+
+
+def hold(viewers, seconds, interval):
+    """Keeps the viewers open for `seconds`, rerunning each every `interval` (never if None)."""
+    cpu, began = time.process_time(), time.perf_counter()
+    stop = began + seconds
+    reruns = 0
+    due = [began + interval * (i + 1) / len(viewers) for i in range(len(viewers))] if interval else []
+    while time.perf_counter() < stop:
+        if not due:
+            time.sleep(min(0.1, max(stop - time.perf_counter(), 0)))
+            continue
+        # The viewer whose timer fires next; viewers are spread evenly over one interval
+        viewer = min(range(len(due)), key=due.__getitem__)
+        time.sleep(max(min(due[viewer], stop) - time.perf_counter(), 0))
+        if time.perf_counter() >= stop:
+            break
+        viewers[viewer].run()
+        reruns += 1
+        due[viewer] += interval
+    return {'cpu_seconds': time.process_time() - cpu, 'seconds': time.perf_counter() - began, 'reruns': reruns}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark server CPU of idle landing-page viewers.")
+    parser.add_argument('--viewers', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--interval', type=float, default=None,
+                        help="rerun interval of the old carousel (default: trending.ROTATE_SECONDS)")
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_server()
+    # Set before the app's modules are first imported
+    os.environ['TMDB_URL'] = base_url + '/tmdb/'
+    os.environ['OMDB_URL'] = base_url + '/omdb/'
+    os.environ['POSTER_CACHE_DIR'] = tempfile.mkdtemp(prefix='bench-landing-')
+    from trending import ROTATE_SECONDS
+    interval = args.interval or ROTATE_SECONDS
+
+    start = time.perf_counter()
+    viewers = open_viewers(args.viewers)
+    print(f"{args.viewers} landing-page viewers opened in {time.perf_counter() - start:.1f}s")
+    for name, rerun_every in (('rerun', interval), ('client-side', None)):
+        result = hold(viewers, args.seconds, rerun_every)
+        load = result['cpu_seconds'] / result['seconds']
+        per_rerun = result['cpu_seconds'] / result['reruns'] * 1000 if result['reruns'] else 0.0
+        print(f"{name:<12} {result['reruns']:6d} reruns  {load * 100:7.2f}% of a core  "
+              f"{load / args.viewers * 1000:8.3f} ms CPU per viewer-second  {per_rerun:7.1f} ms CPU per rerun")
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares the cold-load cost of merged_df.zip (CSV + ast.literal_eval) against
+the memory-mapped catalog.arrow.
+
+Each loader runs in a fresh interpreter so that neither benefits from the
+other's warm imports or allocations.
+
+    python benchmarks/bench_load.py --source merged_df.zip --catalog catalog.arrow
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child process; prints one JSON line with the measurements
+CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+import catalog
+
+def rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+before = rss_mb()
+start = time.perf_counter()
+if {mode!r} == 'csv':
+    df = catalog.read_source({source!r})
+else:
+    df = catalog.catalog_frame(catalog.open_catalog({catalog!r}))
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'peak_rss_mb': rss_mb(), 'import_rss_mb': before, 'rows': len(df)}}))
+"""
+
+
+def measure(mode, source, catalog_path, repeat):
+    runs = []
+    for _ in range(repeat):
+        code = CHILD.format(root=ROOT, mode=mode, source=source, catalog=catalog_path)
+        output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run['seconds'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold catalog loading.")
+    parser.add_argument('--source', default='merged_df.zip')
+    parser.add_argument('--catalog', default='catalog.arrow')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.catalog):
+        sys.path.insert(0, ROOT)
+        import catalog
+        catalog.build_catalog(args.source, args.catalog)
+
+    results = {
+        'merged_df.zip': measure('csv', args.source, args.catalog, args.repeat),
+        'catalog.arrow': measure('arrow', args.source, args.catalog, args.repeat),
+    }
+    print(f"{'format':<16}{'rows':>10}{'cold load (s)':>16}{'peak RSS (MB)':>16}{'load RSS (MB)':>16}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['rows']:>10}{result['seconds']:>16.3f}"
+              f"{result['peak_rss_mb']:>16.1f}{result['peak_rss_mb'] - result['import_rss_mb']:>16.1f}")
+    old, new = results['merged_df.zip'], results['catalog.arrow']
+    print(f"Speed-up: {old['seconds'] / new['seconds']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Memory held by the list columns in each catalog layout.
+
+Compares three ways a worker can hold the same catalog:
+
+- python:   list columns as Python lists of str, as ast.literal_eval left them
+- arrow:    catalog_frame(table), list columns as ArrowDtype over the file
+- interned: catalog_frame(table, lists=False) plus catalog_lists(table)
+
+Each layout is loaded in a fresh interpreter. The benchmark reports the
+private resident memory (RssAnon, Linux only) the layout added, and the size and time of pickling it, which
+is what st.cache_data pays to hash and copy a cached value.
+
+    python benchmarks/bench_memory.py --rows 1000000
+    python benchmarks/bench_memory.py --catalog catalog.arrow
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from catalog import write_catalog  # noqa: E402
+from synthetic import synthetic_catalog  # noqa: E402
+
+MODES = ['python', 'arrow', 'interned']
+
+# Runs inside the child process; prints one JSON line with the measurements
+CHILD = """
+import gc, json, pickle, sys, time
+sys.path.insert(0, {root!r})
+import pandas as pd
+import catalog
+
+def rss_mb():
+    # Private memory only: pages of the memory-mapped file are shared by every worker
+    with open('/proc/self/status') as f:
+        fields = dict(line.split(':', 1) for line in f)
+    return int(fields['RssAnon'].split()[0]) / 1024
+
+table = catalog.open_catalog({catalog!r})
+gc.collect()
+before = rss_mb()
+if {mode!r} == 'python':
+    df = catalog.catalog_frame(table, lists=False)
+    for name in catalog.LIST_COLUMNS:
+        df[name] = pd.Series(table.column(name).to_pylist(), dtype=object)
+    held = df
+elif {mode!r} == 'arrow':
+    held = catalog.catalog_frame(table)
+else:
+    held = (catalog.catalog_frame(table, lists=False), catalog.catalog_lists(table))
+gc.collect()
+after = rss_mb()
+start = time.perf_counter()
+size = len(pickle.dumps(held, protocol=pickle.HIGHEST_PROTOCOL))
+print(json.dumps({{'rss_mb': after - before, 'pickle_mb': size / 2**20,
+                  'pickle_seconds': time.perf_counter() - start, 'rows': table.num_rows}}))
+"""
+
+
+def measure(mode, catalog_path):
+    code = CHILD.format(root=ROOT, mode=mode, catalog=catalog_path)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory of the catalog list columns.")
+    parser.add_argument('--catalog', default=None, help="catalog file to use instead of a synthetic one")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        catalog_path = args.catalog
+        if catalog_path is None:
+            catalog_path = os.path.join(workdir, 'synthetic.arrow')
+            write_catalog(synthetic_catalog(args.rows), catalog_path)
+        results = {mode: measure(mode, catalog_path) for mode in MODES}
+
+    print(f"{results['python']['rows']:,} titles")
+    print(f"{'layout':<12}{'private (MB)':>14}{'pickle (MB)':>14}{'pickle (s)':>13}")
+    for mode, result in results.items():
+        print(f"{mode:<12}{result['rss_mb']:>14.1f}{result['pickle_mb']:>14.1f}{result['pickle_seconds']:>13.2f}")
+    old, new = results['python'], results['interned']
+    print(f"Interned lists use {old['rss_mb'] / max(new['rss_mb'], 0.1):.1f}x less memory than Python lists")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Latency of cast/director typeahead queries.
+
+Builds the name search over a catalog's cast (or over synthetic, accented
+two-part names) and times prefix queries of 1 to 9 characters as well as
+misspelled names that fall back to trigram matching.
+
+    python benchmarks/bench_name_search.py --names 1000000
+    python benchmarks/bench_name_search.py --catalog catalog.arrow
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_similarity import percentiles  # noqa: E402
+from catalog import catalog_lists, open_catalog  # noqa: E402
+from filter_index import InvertedIndex  # noqa: E402
+from name_search import NameSearch  # noqa: E402
+
+SYLLABLES = ['an', 'ber', 'ca', 'del', 'e', 'fi', 'gor', 'ha', 'is', 'jo', 'ka', 'li', 'mo', 'na', 'o', 'pe',
+             'qui', 'ro', 'sa', 'to', 'u', 've', 'wi', 'xa', 'yo', 'zé', 'ñu', 'ö', 'lu', 'mar', 'tin', 'son']
+
+
+def synthetic_names(count, seed=0):
+    """`count` distinct 'First Last' names built from random syllables, some accented."""
+    rng = np.random.default_rng(seed)
+
+    def words(size, low, high):
+        lengths = rng.integers(low, high + 1, size=size)
+        picks = rng.integers(0, len(SYLLABLES), size=lengths.sum())
+        parts = np.split(np.asarray(SYLLABLES, dtype=object)[picks], np.cumsum(lengths)[:-1])
+        return [''.join(part).capitalize() for part in parts]
+
+    first, last = words(max(count // 250, 10), 1, 3), words(max(count // 25, 10), 2, 4)
+    names = set()
+    while len(names) < count:
+        size = count - len(names)
+        names.update(f'{first[a]} {last[b]}' for a, b in zip(rng.integers(0, len(first), size),
+                                                              rng.integers(0, len(last), size)))
+    return sorted(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cast/director name search.")
+    parser.add_argument('--catalog', default=None, help="catalog file whose cast to use instead of synthetic names")
+    parser.add_argument('--names', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.catalog:
+        index = InvertedIndex.build(catalog_lists(open_catalog(args.catalog))['cast'])
+    else:
+        index = InvertedIndex.build([[name] for name in synthetic_names(args.names)])
+    start = time.perf_counter()
+    search = NameSearch.build(index)
+    print(f"{len(index.vocabulary):,} names, {len(search.keys):,} prefix keys, {len(search.trigrams):,} trigrams; "
+          f"built in {time.perf_counter() - start:.1f}s")
+
+    rng = np.random.default_rng(1)
+    names = [index.vocabulary[i] for i in rng.integers(0, len(index.vocabulary), size=args.queries)]
+    workloads = {
+        'prefix': [name[:rng.integers(1, 10)] for name in names],
+        'misspelled': [name[:-3] + name[-2] + name[-3] + name[-1] if len(name) > 3 else name for name in names],
+    }
+    for workload, queries in workloads.items():
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            search.suggest(query)
+            timings.append(time.perf_counter() - start)
+        stats = percentiles(timings)
+        print(f"{workload:<12}" + ''.join(f"{key} {value:6.2f} ms  " for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
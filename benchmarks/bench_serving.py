@@ -0,0 +1,137 @@
+"""
+Memory and throughput of app workers on a shared, published catalog.
+
+Publishes a synthetic catalog (or a real one) with serving.py, then starts
+worker processes that each answer a stream of recommendation-page requests:
+a genre filter plus a year range, the sidebar counts, "more like this" for
+the top result, a title search and a cast typeahead. Reported are
+
+- the private memory (RssAnon, Linux only) one worker adds when it builds the
+  catalog and indexes itself, and when it attaches to the published bundle
+- requests per second with 1, 2, 4, ... attached workers running at once, up
+  to the number of cores
+
+    python benchmarks/bench_serving.py --rows 1000000
+    python benchmarks/bench_serving.py --catalog catalog.arrow --workers 1 2 4 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from catalog import open_catalog, write_catalog  # noqa: E402
+from catalog_store import CatalogSnapshot  # noqa: E402
+from serving import WORKER_ENV, publish  # noqa: E402
+from synthetic import synthetic_catalog  # noqa: E402
+
+# Runs inside each worker; prints a JSON line once loaded, waits for 'go' on stdin,
+# then serves requests for the given number of seconds and prints a second line
+WORKER = """
+import gc, json, sys, time
+sys.path.insert(0, {root!r})
+import numpy as np
+
+def rss_mb():
+    # Private memory only: pages of memory-mapped files are shared by every worker
+    with open('/proc/self/status') as f:
+        fields = dict(line.split(':', 1) for line in f)
+    return int(fields['RssAnon'].split()[0]) / 1024
+
+import catalog, catalog_store, serving
+gc.collect()
+before = rss_mb()
+if {mode!r} == 'private':
+    snapshot = catalog_store.CatalogSnapshot.build(0, catalog.open_catalog({catalog!r}))
+    shared = serving.build_shared(snapshot)
+else:
+    snapshot = serving.SharedCatalog({serve!r}).current()
+    shared = snapshot.shared
+gc.collect()
+print(json.dumps({{'rss_mb': rss_mb() - before}}), flush=True)
+sys.stdin.readline()
+
+rng = np.random.default_rng({seed})
+genres = snapshot.facets.options('genres')
+words = [title.split()[-1] for title in snapshot.df['title'].iloc[:1000].tolist()]
+similarity, title_search, cast = shared['similarity'], shared['title_search'], shared['name_search']['cast']
+requests = 0
+stop = time.perf_counter() + {seconds}
+while time.perf_counter() < stop:
+    year = int(rng.integers(1930, 2015))
+    rows = snapshot.query.run(snapshot.filter_index.match({{'genres': [genres[rng.integers(len(genres))]]}}),
+                              {{'startYear': (year, year + 10)}})
+    snapshot.facets.live_counts(snapshot.filter_index, 'genres', rows)
+    if len(rows):
+        similarity.similar(int(rows[0]), k=6, candidates=rows)
+        allowed = np.zeros(snapshot.table.num_rows, dtype=bool)
+        allowed[rows] = True
+        title_search.search(words[rng.integers(len(words))], k=6, allowed=allowed, rank=snapshot.query.rank)
+    cast.suggest('person ' + str(rng.integers(1000)))
+    requests += 1
+print(json.dumps({{'requests': requests}}), flush=True)
+"""
+
+
+def start(mode, catalog_path, serve_dir, seconds, seed):
+    code = WORKER.format(root=ROOT, mode=mode, catalog=catalog_path, serve=serve_dir, seconds=seconds, seed=seed)
+    # Same allocator settings for both modes, as `serving.py serve` gives its workers
+    return subprocess.Popen([sys.executable, '-c', code], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                            env=dict(WORKER_ENV, **os.environ))
+
+
+def run(mode, count, catalog_path, serve_dir, seconds):
+    """Starts `count` workers, lets them load, runs them together; returns (MB per worker, requests/s)."""
+    workers = [start(mode, catalog_path, serve_dir, seconds, seed) for seed in range(count)]
+    loaded = [json.loads(worker.stdout.readline()) for worker in workers]
+    for worker in workers:
+        worker.stdin.write('go\n')
+        worker.stdin.flush()
+    served = [json.loads(worker.stdout.readline()) for worker in workers]
+    for worker in workers:
+        worker.wait()
+    memory = sum(result['rss_mb'] for result in loaded) / count
+    return memory, sum(result['requests'] for result in served) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app workers on a shared catalog.")
+    parser.add_argument('--catalog', default=None, help="catalog file to use instead of a synthetic one")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help="worker counts to run (default: powers of two up to the number of cores)")
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+    cores = os.cpu_count() or 1
+    counts = args.workers or [1 << i for i in range(cores.bit_length()) if 1 << i <= cores]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        catalog_path = args.catalog
+        if catalog_path is None:
+            catalog_path = os.path.join(workdir, 'synthetic.arrow')
+            write_catalog(synthetic_catalog(args.rows), catalog_path)
+        serve_dir = os.path.join(workdir, 'serving')
+        began = time.perf_counter()
+        table = open_catalog(catalog_path)
+        path = publish(CatalogSnapshot.build(0, table), serve_dir)
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        print(f"{table.num_rows:,} titles on {cores} cores; published {size / 2**20:.0f} MB "
+              f"in {time.perf_counter() - began:.1f}s")
+
+        memory, throughput = run('private', 1, catalog_path, serve_dir, args.seconds)
+        print(f"  1 worker   {memory:6.0f} MB private, building its own indexes  {throughput:8.1f} requests/s")
+        baseline = None
+        for count in counts:
+            memory, throughput = run('shared', count, catalog_path, serve_dir, args.seconds)
+            baseline = baseline or throughput
+            print(f"{count:>3} shared   {memory:6.1f} MB private each, attached        {throughput:8.1f} requests/s "
+                  f" ({throughput / baseline:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
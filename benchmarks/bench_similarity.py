@@ -0,0 +1,65 @@
+"""
+Latency of "more like this" queries on a large catalog.
+
+Builds the similarity index over a synthetic catalog (or a real one) and times
+single-title and liked-set queries on one CPU core.
+
+    python benchmarks/bench_similarity.py --rows 1000000 --queries 500
+    python benchmarks/bench_similarity.py --catalog catalog.arrow
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from catalog import LIST_COLUMNS, catalog_frame, open_catalog  # noqa: E402
+from filter_index import FilterIndex  # noqa: E402
+from similarity import SimilarityIndex  # noqa: E402
+from synthetic import synthetic_catalog  # noqa: E402
+
+
+def percentiles(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {name: float(np.percentile(ms, q)) for name, q in (('p50', 50), ('p95', 95), ('p99', 99))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark similarity queries.")
+    parser.add_argument('--catalog', default=None, help="catalog file to use instead of a synthetic one")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--liked', type=int, default=5, help="titles per liked-set query")
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    if hasattr(os, 'sched_setaffinity'):
+        # The target is per core; keep the whole run on one
+        os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+
+    table = open_catalog(args.catalog) if args.catalog else synthetic_catalog(args.rows)
+    df = catalog_frame(table)
+    start = time.perf_counter()
+    filter_index = FilterIndex.build(df, LIST_COLUMNS)
+    index = SimilarityIndex.build(df, filter_index)
+    print(f"{len(df):,} titles, {len(index.weights):,} features, {len(index.rows):,} non-zeros; "
+          f"built in {time.perf_counter() - start:.1f}s")
+
+    rng = np.random.default_rng(0)
+    for name, size in (('like one title', 1), (f'like {args.liked} titles', args.liked)):
+        timings = []
+        for _ in range(args.queries):
+            rows = rng.choice(len(df), size=size, replace=False)
+            start = time.perf_counter()
+            index.similar(rows, k=args.k)
+            timings.append(time.perf_counter() - start)
+        stats = percentiles(timings)
+        print(f"{name:<20}" + ''.join(f"{key} {value:7.2f} ms  " for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
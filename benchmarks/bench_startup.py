@@ -0,0 +1,113 @@
+"""
+Time to the first page of a freshly started worker, cold and warm.
+
+Each run starts a new Python process, as a deploy or a restart does, and
+opens one app session in it (through Streamlit's AppTest, against the local
+TMDB/OMDb stub and a synthetic catalog). The session arrives `--delay`
+seconds after the process started, asks for the landing page and then for
+the recommendation page, and each is timed from the user's request to the
+rendered page:
+
+- cold: the process does nothing until the user arrives, so the landing
+  page pays for the trending list and the recommendation page for loading
+  the catalog and building its indexes
+- warm: the process starts warm_start's preload thread at boot, as
+  `python warm_start.py` does, and the user finds them ready (or waits only
+  for what is left of them if the delay is shorter than the preload)
+
+    python benchmarks/bench_startup.py --rows 100000 --delay 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_similarity import percentiles  # noqa: E402
+from catalog import write_catalog  # noqa: E402
+from stub_api import start_stub_server  # noqa: E402
+from synthetic import synthetic_catalog  # noqa: E402
+
+# Runs in a fresh process per start; the last line it prints is a JSON dict of seconds
+WORKER = """
+import json, sys, time
+began = time.perf_counter()
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+if {mode!r} == 'warm':
+    import warm_start
+    warm_start.start_preload()
+booted = time.perf_counter() - began
+time.sleep({delay})
+
+def page(viewer):
+    start = time.perf_counter()
+    viewer.run()
+    if viewer.exception:
+        raise RuntimeError(viewer.exception[0].message)
+    return time.perf_counter() - start
+
+viewer = AppTest.from_file({app!r}, default_timeout=120)
+viewer.secrets['tmdb_api'] = {{'api_key': 'bench'}}
+viewer.secrets['omdb_api'] = {{'api_key': 'bench'}}
+landing = page(viewer)
+viewer.session_state['show_recommendations'] = True
+recommendations = page(viewer)
+print(json.dumps({{'boot': booted, 'landing': landing, 'recommendations': recommendations}}), flush=True)
+"""
+
+# The preload thread reads the API keys from the working directory, as the server does
+SECRETS = '[tmdb_api]\\napi_key = "bench"\\n\\n[omdb_api]\\napi_key = "bench"\\n'
+
+
+def start_once(mode, workdir, delay):
+    """One fresh process in `mode`; returns its boot, landing and recommendation times in seconds."""
+    code = WORKER.format(root=ROOT, mode=mode, delay=delay, app=os.path.join(ROOT, 'main.py'))
+    # A new poster store per start, so the trending list is not already stored by the previous one
+    env = dict(os.environ, POSTER_CACHE_DIR=tempfile.mkdtemp(prefix='posters-', dir=workdir))
+    result = subprocess.run([sys.executable, '-c', code], cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the first pages of a fresh app worker.")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--delay', type=float, default=5,
+                        help="seconds from process start to the first user's request")
+    parser.add_argument('--latency', type=float, default=0.1, help="seconds the stub API takes per request")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None, help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_server(latency=args.latency)
+    os.environ['TMDB_URL'] = base_url + '/tmdb/'
+    os.environ['OMDB_URL'] = base_url + '/omdb/'
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        # The app opens catalog.arrow in its working directory
+        write_catalog(synthetic_catalog(args.rows), os.path.join(workdir, 'catalog.arrow'))
+        os.makedirs(os.path.join(workdir, '.streamlit'))
+        with open(os.path.join(workdir, '.streamlit', 'secrets.toml'), 'w') as f:
+            f.write(SECRETS)
+        print(f"{args.rows:,} titles, first user after {args.delay:g}s, stub latency {args.latency * 1000:.0f} ms")
+        for mode in ('cold', 'warm'):
+            runs = [start_once(mode, workdir, args.delay) for _ in range(args.repeat)]
+            results[mode] = {stage: percentiles([run[stage] for run in runs])
+                             for stage in ('boot', 'landing', 'recommendations')}
+            print(f"{mode:<5}" + ''.join(f"  {stage} {results[mode][stage]['p50']:8.1f} ms"
+                                         for stage in ('boot', 'landing', 'recommendations')))
+    stub.shutdown()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'rows': args.rows, 'delay': args.delay, 'latency': args.latency, 'results': results},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
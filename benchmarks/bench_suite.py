@@ -0,0 +1,394 @@
+"""
+Benchmark suite for the whole recommendation path, with results as JSON.
+
+For each catalog size it generates a synthetic catalog (see synthetic.py: skewed
+genres, languages and people, like the real one) and measures
+
+- cold_load: a fresh interpreter opening the catalog file, building the snapshot
+  and the engine's search and similarity indexes; seconds and peak RSS
+- filters: every filter type on its own and combined, through the engine with
+  the query cache turned off, plus the sidebar counts
+- paging: the first query of a broad selection, the same query again from the
+  cache, and walking its pages
+- posters: batches of GRID_SIZE posters through PosterFetcher against the local
+  OMDb stub (stub_api.py), cold, from the on-disk store and from memory
+- sessions: 1, 4, 16, ... simulated app sessions at once, each rerunning like
+  main.py does after a click (query, counts, feedback queue, "more like this",
+  titles, posters); reruns per second and p50/p99 per rerun
+
+Everything is seeded, so two runs on the same commit and machine do the same
+work. `run` writes one JSON file holding the machine, the commit and every
+measurement; `compare` lines up two of them and exits with status 1 if a latency
+got slower (or a throughput lower) by more than --threshold.
+
+    python benchmarks/bench_suite.py run --rows 100000 1000000 --output before.json
+    python benchmarks/bench_suite.py run --rows 10000000 --sections cold_load filters
+    python benchmarks/bench_suite.py compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api_client import ApiClient  # noqa: E402
+from bench_similarity import percentiles  # noqa: E402
+from catalog import open_catalog, write_catalog  # noqa: E402
+from catalog_store import CatalogSnapshot  # noqa: E402
+from engine import RecommendationEngine  # noqa: E402
+from feedback import FeedbackQueue, Preferences  # noqa: E402
+from poster_store import PosterStore  # noqa: E402
+from posters import PosterFetcher, fetch_poster  # noqa: E402
+from query_cache import QueryCache  # noqa: E402
+from stub_api import start_stub_server  # noqa: E402
+from synthetic import synthetic_catalog  # noqa: E402
+from thumbnails import ThumbnailPool  # noqa: E402
+
+SECTIONS = ['cold_load', 'filters', 'paging', 'posters', 'sessions']
+
+# Posters per batch, as in the app's grids
+GRID_SIZE = 6
+
+# One selection per filter type, on the values synthetic.py generates; people are typed loosely,
+# as users do, so name resolution is part of the timing
+FILTERS = {
+    'none': {},     # the default selection, which leaves adult titles out
+    'language': {'languages': ['fr']},
+    'languages_2': {'languages': ['en', 'fr']},
+    'genre': {'genres': ['Drama']},
+    'genres_2': {'genres': ['Drama', 'War']},
+    'cast': {'cast': ['person 12']},
+    'director': {'directors': ['Directr 3']},
+    'year': {'year': [1990, 2000]},
+    'runtime': {'runtime': [90, 120]},
+    'rating': {'rating': [7.0, 10.0]},
+    'adult': {'include_adult': True},
+    'combined': {'languages': ['en'], 'genres': ['Drama'], 'year': [1980, 2010], 'runtime': [80, 150],
+                 'rating': [6.0, 10.0]},
+}
+
+# What simulated sessions pick from: a few popular selections, so the shared cache sees
+# repeats the way it does in production
+SESSION_FILTERS = ['none', 'genre', 'language', 'year', 'combined', 'rating']
+
+# Runs in a fresh interpreter; prints one JSON line with the measurements
+COLD_LOAD = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import catalog, catalog_store, engine
+imported = time.perf_counter()
+table = catalog.open_catalog({catalog!r})
+opened = time.perf_counter()
+snapshot = catalog_store.CatalogSnapshot.build(0, table)
+built = time.perf_counter()
+engine.VersionIndexes(snapshot, {ann_path!r})
+indexed = time.perf_counter()
+print(json.dumps({{'import_seconds': imported - start, 'open_seconds': opened - imported,
+                  'snapshot_seconds': built - opened, 'indexes_seconds': indexed - built,
+                  'total_seconds': indexed - start,
+                  'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+"""
+
+
+class FixedCatalog:
+    """A catalog that never changes, in place of LiveCatalog."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def current(self):
+        return self.snapshot
+
+
+def timed(function, repeat):
+    """Calls `function` `repeat` times; returns the percentiles of its durations in ms."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return percentiles(seconds)
+
+
+def bench_cold_load(catalog_path, ann_path, repeat):
+    runs = []
+    for _ in range(repeat):
+        code = COLD_LOAD.format(root=ROOT, catalog=catalog_path, ann_path=ann_path)
+        output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    # The fastest run is the one least disturbed by the rest of the machine
+    return min(runs, key=lambda run: run['total_seconds'])
+
+
+def bench_filters(snapshot, ann_path, repeat):
+    # A cache that holds nothing, so every query does the whole filter chain and ordering
+    engine = RecommendationEngine(FixedCatalog(snapshot), QueryCache(max_bytes=0), ann_path)
+    # The search and similarity indexes are built on first use; not part of any filter
+    engine.indexes()
+    results = {}
+    for name, selection in FILTERS.items():
+        results[name] = dict(timed(lambda: engine.query(selection), repeat),
+                             matches=len(engine.query(selection).rows))
+    query = engine.query(FILTERS['genre'])
+    for name in ['available_languages', 'genres']:
+        results[f'counts_{name}'] = timed(lambda: snapshot.facets.live_counts(snapshot.filter_index, name,
+                                                                              query.rows), repeat)
+    return results
+
+
+def bench_paging(snapshot, ann_path, repeat, pages=50):
+    engine = RecommendationEngine(FixedCatalog(snapshot), QueryCache(), ann_path)
+    engine.indexes()
+    results = {'first_query': [], 'cached_query': []}
+    page_seconds = []
+    for _ in range(repeat):
+        engine.query_cache = QueryCache()
+        for key in ('first_query', 'cached_query'):
+            start = time.perf_counter()
+            query = engine.query(FILTERS['year'])
+            results[key].append(time.perf_counter() - start)
+        cursor = None
+        for _ in range(pages):
+            start = time.perf_counter()
+            rows, cursor = engine.page(query, cursor)
+            engine.titles(snapshot, rows)
+            page_seconds.append(time.perf_counter() - start)
+            if cursor is None:
+                break
+    return dict({key: percentiles(seconds) for key, seconds in results.items()}, page=percentiles(page_seconds))
+
+
+def poster_fetcher(client, base_url, store, thumbnails):
+    return PosterFetcher(
+        lambda imdb_id, is_cancelled: fetch_poster(imdb_id, 'bench', client, omdb_url=base_url + '/omdb/',
+                                                   is_cancelled=is_cancelled),
+        store=store, transform=thumbnails.thumbnail)
+
+
+def bench_posters(snapshot, base_url, thumbnails, workdir, batches):
+    client = ApiClient(rate_limits={}, default_rate=(1e9, 1e9))
+    store = PosterStore(os.path.join(workdir, 'posters'))
+    rng = np.random.default_rng(0)
+    ids = snapshot.df['tconst'].to_numpy()[rng.choice(len(snapshot.df), size=batches * GRID_SIZE, replace=False)]
+    groups = [ids[i:i + GRID_SIZE].tolist() for i in range(0, len(ids), GRID_SIZE)]
+
+    results = {}
+    # A new fetcher on the same store starts with an empty memory cache, but finds the thumbnails on disk
+    for name, fetcher in (('cold', poster_fetcher(client, base_url, store, thumbnails)),
+                          ('store', poster_fetcher(client, base_url, store, thumbnails))):
+        seconds = []
+        for group in groups:
+            start = time.perf_counter()
+            list(fetcher.resolve(group))
+            seconds.append(time.perf_counter() - start)
+        results[name] = percentiles(seconds)
+        if name == 'store':
+            seconds = []
+            for group in groups:
+                start = time.perf_counter()
+                list(fetcher.resolve(group))
+                seconds.append(time.perf_counter() - start)
+            results['memory'] = percentiles(seconds)
+        fetcher.shutdown()
+    results['http'] = client.stats()['latency']
+    return results
+
+
+def bench_sessions(snapshot, ann_path, base_url, thumbnails, workdir, counts, seconds):
+    engine = RecommendationEngine(FixedCatalog(snapshot), QueryCache(), ann_path)
+    indexes = engine.indexes(snapshot)
+    client = ApiClient(rate_limits={}, default_rate=(1e9, 1e9))
+    fetcher = poster_fetcher(client, base_url, PosterStore(os.path.join(workdir, 'session-posters')), thumbnails)
+    tconst = snapshot.df['tconst']
+
+    def session(seed, stop, latencies):
+        rng = np.random.default_rng(seed)
+        preferences = Preferences()
+        queue = None
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            query = engine.query(FILTERS[SESSION_FILTERS[rng.integers(len(SESSION_FILTERS))]])
+            for name in ['available_languages', 'genres']:
+                engine.counts(query, name)
+            if queue is None or queue.key != query.key:
+                queue = FeedbackQueue(query.key, query.rows, indexes.embedder, preferences)
+            queue.advance(query.rows, indexes.embedder, preferences, 'skip' if rng.random() < 0.8 else 'like')
+            row = queue.current()
+            if row is not None:
+                grid = queue.upcoming(GRID_SIZE + 1)
+                engine.titles(snapshot, grid)
+                engine.similar(query, row, k=GRID_SIZE)
+                fetcher.get(tconst.iloc[row])
+            latencies.append(time.perf_counter() - start)
+
+    results = {}
+    for count in counts:
+        latencies = []
+        stop = time.perf_counter() + seconds
+        threads = [threading.Thread(target=session, args=(seed, stop, latencies)) for seed in range(count)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        results[str(count)] = dict(percentiles(latencies), reruns=len(latencies),
+                                   reruns_per_second=len(latencies) / elapsed)
+    fetcher.shutdown()
+    return results
+
+
+def run_size(rows, args, sections, base_url, thumbnails, workdir):
+    catalog_path = os.path.join(workdir, f'synthetic-{rows}.arrow')
+    start = time.perf_counter()
+    write_catalog(synthetic_catalog(rows, seed=args.seed), catalog_path)
+    print(f"{rows:,} titles: generated in {time.perf_counter() - start:.1f}s", flush=True)
+    ann_path = os.path.join(workdir, 'no-ann')
+    results = {}
+    if 'cold_load' in sections:
+        results['cold_load'] = bench_cold_load(catalog_path, ann_path, args.repeat_load)
+        print(f"  cold load      {results['cold_load']['total_seconds']:8.2f} s  "
+              f"{results['cold_load']['peak_rss_mb']:8.0f} MB peak", flush=True)
+    snapshot = CatalogSnapshot.build(0, open_catalog(catalog_path))
+    if 'filters' in sections:
+        results['filters'] = bench_filters(snapshot, ann_path, args.repeat)
+        for name, stats in results['filters'].items():
+            print(f"  filter {name:<28} p50 {stats['p50']:8.2f} ms  p99 {stats['p99']:8.2f} ms", flush=True)
+    if 'paging' in sections:
+        results['paging'] = bench_paging(snapshot, ann_path, args.repeat)
+        for name, stats in results['paging'].items():
+            print(f"  paging {name:<28} p50 {stats['p50']:8.2f} ms  p99 {stats['p99']:8.2f} ms", flush=True)
+    if 'posters' in sections:
+        results['posters'] = bench_posters(snapshot, base_url, thumbnails, workdir, args.poster_batches)
+        for name in ('cold', 'store', 'memory'):
+            stats = results['posters'][name]
+            print(f"  posters {name:<27} p50 {stats['p50']:8.2f} ms  p99 {stats['p99']:8.2f} ms per batch",
+                  flush=True)
+    if 'sessions' in sections:
+        results['sessions'] = bench_sessions(snapshot, ann_path, base_url, thumbnails, workdir, args.sessions,
+                                             args.seconds)
+        for count, stats in results['sessions'].items():
+            print(f"  {count:>4} sessions  {stats['reruns_per_second']:8.1f} reruns/s  p50 {stats['p50']:8.2f} ms  "
+                  f"p99 {stats['p99']:8.2f} ms", flush=True)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain'], cwd=ROOT, capture_output=True, text=True,
+                                    check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    import pandas
+    import pyarrow
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pandas.__version__,
+        'pyarrow': pyarrow.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run(args):
+    sections = args.sections or SECTIONS
+    report = {'environment': environment(), 'settings': {key: value for key, value in vars(args).items()
+                                                         if key != 'func'}, 'sizes': {}}
+    # Forked before any thread starts, as in the app
+    thumbnails = ThumbnailPool()
+    stub, base_url = start_stub_server(latency=args.latency)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for rows in args.rows:
+                report['sizes'][str(rows)] = run_size(rows, args, sections, base_url, thumbnails, workdir)
+    finally:
+        stub.shutdown()
+        thumbnails.shutdown()
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"Wrote {args.output}")
+
+
+def _leaves(data, path=()):
+    """(path, value) of every number in a nested report."""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from _leaves(value, path + (key,))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        yield path, data
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"before {before['environment']['commit']}  after {after['environment']['commit']}")
+    old = dict(_leaves(before['sizes']))
+    regressions = 0
+    for path, value in _leaves(after['sizes']):
+        # Latency percentiles and load times get worse upwards, throughput downwards
+        if path[-1] in ('p50', 'p95', 'p99') or path[-1].endswith('_seconds'):
+            worse = 1
+        elif path[-1] == 'reruns_per_second':
+            worse = -1
+        else:
+            continue
+        if path not in old or 'http' in path or not old[path]:
+            continue
+        change = value / old[path] - 1
+        flag = ''
+        if worse * change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{'.'.join(path):<60}{old[path]:12.3f}{value:12.3f}{change:+9.1%}{flag}")
+    print(f"{regressions} regressions over {args.threshold:.0%}")
+    if regressions:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation path and compare runs.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="run the suite and write a JSON report")
+    run_parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000],
+                            help="catalog sizes to run, e.g. 100000 1000000 10000000")
+    run_parser.add_argument('--sections', nargs='+', choices=SECTIONS, default=None)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--repeat', type=int, default=50, help="runs of each filter and paging measurement")
+    run_parser.add_argument('--repeat-load', type=int, default=3, help="cold loads per size; the fastest counts")
+    run_parser.add_argument('--poster-batches', type=int, default=20)
+    run_parser.add_argument('--latency', type=float, default=0.05, help="seconds the stub adds to every response")
+    run_parser.add_argument('--sessions', type=int, nargs='+', default=[1, 4, 16, 64])
+    run_parser.add_argument('--seconds', type=float, default=10, help="duration of each session load step")
+    run_parser.add_argument('--output', default='bench_results.json')
+    run_parser.set_defaults(func=run)
+    compare_parser = subparsers.add_parser('compare', help="compare two JSON reports")
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type=float, default=0.2,
+                                help="relative slowdown reported as a regression")
+    compare_parser.set_defaults(func=compare)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
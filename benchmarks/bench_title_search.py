@@ -0,0 +1,84 @@
+"""
+Build time and query latency of the BM25 title search.
+
+Runs on a real catalog, ideally the full IMDb movie set from imdb_build.py, or
+on synthetic titles with IMDb-like word statistics: about 700k movies, two to
+five words each, with words drawn from a Zipf distribution so that 'the',
+'of' and 'love' are everywhere and most words are rare. Queries are one to
+three words taken from random titles. The last word is cut to a prefix in half
+of them, and half run against a filter mask keeping 10% of the catalog.
+
+    python benchmarks/bench_title_search.py
+    python benchmarks/bench_title_search.py --catalog catalog.arrow
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pyarrow as pa
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_similarity import percentiles  # noqa: E402
+from catalog import open_catalog  # noqa: E402
+from title_search import TitleSearch, tokenize  # noqa: E402
+
+LETTERS = np.array(list('abcdefghijklmnopqrstuvwxyzéñ'))
+
+
+def synthetic_titles(count, vocabulary=200_000, seed=0):
+    """`count` titles of 2-5 pseudo-words, the word of rank r drawn with probability ~ 1/r."""
+    rng = np.random.default_rng(seed)
+    words = [''.join(rng.choice(LETTERS, size=rng.integers(2, 10))).capitalize() for _ in range(vocabulary)]
+    lengths = rng.integers(2, 6, size=count)
+    weights = 1 / np.arange(1, vocabulary + 1)
+    picks = rng.choice(vocabulary, size=lengths.sum(), p=weights / weights.sum())
+    parts = np.split(np.asarray(words, dtype=object)[picks], np.cumsum(lengths)[:-1])
+    return pa.table({'title': pa.array([' '.join(part) for part in parts])})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the BM25 title search.")
+    parser.add_argument('--catalog', default=None, help="catalog file to use instead of synthetic titles")
+    parser.add_argument('--titles', type=int, default=700_000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    table = open_catalog(args.catalog) if args.catalog else synthetic_titles(args.titles)
+    start = time.perf_counter()
+    search = TitleSearch.build(table)
+    print(f"{table.num_rows:,} titles, {len(search.terms):,} words, {len(search.rows):,} postings; "
+          f"built in {time.perf_counter() - start:.2f}s")
+
+    rng = np.random.default_rng(1)
+    titles = table.column('title').to_pylist()
+    allowed = rng.random(table.num_rows) < 0.1
+    workloads = {'words': [], 'prefix': []}
+    while len(workloads['words']) < args.queries:
+        words = tokenize(titles[rng.integers(len(titles))])
+        if not words:
+            continue
+        first = rng.integers(len(words))
+        words = words[first:first + rng.integers(1, 4)]
+        workloads['words'].append(' '.join(words) + ' ')
+        workloads['prefix'].append(' '.join(words[:-1] + [words[-1][:rng.integers(1, len(words[-1]) + 1)]]))
+    workloads['words, filtered'] = workloads['words']
+    workloads['prefix, filtered'] = workloads['prefix']
+
+    for name, queries in workloads.items():
+        mask = allowed if name.endswith('filtered') else None
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            search.search(query, k=args.k, allowed=mask)
+            timings.append(time.perf_counter() - start)
+        stats = percentiles(timings)
+        print(f"{name:<18}" + ''.join(f"{key} {value:6.2f} ms  " for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
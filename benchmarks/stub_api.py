@@ -0,0 +1,115 @@
+"""
+Local stand-in for the OMDb and TMDB APIs.
+
+Serves OMDb lookups, poster images, TMDB /find and the TMDB trending list
+with a configurable delay, so the poster path can be exercised and timed without
+network access or API quota. Point the app at it with
+
+    python benchmarks/stub_api.py --port 8765 --latency 0.2
+    OMDB_URL=http://127.0.0.1:8765/omdb/ streamlit run main.py
+
+or start it in-process with start_stub_server().
+"""
+import argparse
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+# Every tenth title has no poster, like OMDb's 'Poster': 'N/A'
+MISSING_EVERY = 10
+
+
+def _poster_bytes(imdb_id, size=(500, 750)):
+    """Returns a deterministic JPEG for a title."""
+    color = zlib.crc32(imdb_id.encode()) & 0xFFFFFF
+    image = Image.new('RGB', size, ((color >> 16) & 255, (color >> 8) & 255, color & 255))
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status=200):
+        self._send(status, json.dumps(data).encode(), 'application/json')
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path.startswith('/omdb'):
+            imdb_id = query.get('i', [''])[0]
+            if int(imdb_id[2:] or 0) % MISSING_EVERY == 0:
+                self._send_json({'Response': 'True', 'imdbID': imdb_id, 'Poster': 'N/A'})
+            else:
+                poster_url = f'http://{self.headers["Host"]}/posters/{imdb_id}.jpg'
+                self._send_json({'Response': 'True', 'imdbID': imdb_id, 'Poster': poster_url})
+        elif url.path.startswith('/posters/'):
+            imdb_id = url.path.rsplit('/', 1)[-1].split('.')[0]
+            self._send(200, _poster_bytes(imdb_id), 'image/jpeg')
+        elif url.path.startswith('/tmdb/3/find/'):
+            imdb_id = url.path.rsplit('/', 1)[-1]
+            missing = int(imdb_id[2:] or 0) % MISSING_EVERY == 0
+            movie = {'id': int(imdb_id[2:] or 0), 'poster_path': None if missing else f'/{imdb_id}.jpg'}
+            self._send_json({'movie_results': [movie]})
+        elif url.path.startswith('/tmdb/3/trending/movie/'):
+            results = [{
+                'title': f'Trending Movie {rank}',
+                'poster_path': f'/trending{rank}.jpg',
+                'overview': 'A stub overview. ' * 10,
+                'vote_average': 5 + rank / 4,
+                'release_date': '2024-01-01',
+            } for rank in range(20)]
+            self._send_json({'page': 1, 'results': results})
+        else:
+            self._send_json({'Response': 'False', 'Error': 'Not found'}, status=404)
+
+
+def start_stub_server(port=0, latency=0.0):
+    """Starts the stub in a background thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local OMDb/TMDB stub.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, args.latency)
+    print(f"OMDb stub at {base_url}/omdb/, TMDB stub at {base_url}/tmdb/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Synthetic catalogs for benchmarks.
+
+Generates a table with the same columns and Arrow layout as catalog.arrow, at
+any size. Genres, languages and people are drawn with a skew, so a few values
+are very common and most are rare, as in the real catalog.
+
+    python benchmarks/synthetic.py --rows 1000000 --output synthetic.arrow
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pyarrow as pa
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from catalog import encode_table, write_catalog  # noqa: E402
+
+GENRES = ['Drama', 'Comedy', 'Documentary', 'Action', 'Romance', 'Thriller', 'Crime', 'Horror', 'Adventure',
+          'Family', 'Mystery', 'Biography', 'Fantasy', 'History', 'Animation', 'Music', 'Sci-Fi', 'War',
+          'Musical', 'Sport', 'Western', 'Adult', 'Film-Noir', 'News', 'Reality-TV', 'Talk-Show', 'Game-Show']
+LANGUAGES = ['en', 'fr', 'es', 'de', 'ja', 'it', 'pt', 'ru', 'hi', 'ko', 'zh', 'sv', 'tr', 'nl', 'pl', 'ar', 'cmn',
+             'fa', 'he', 'el', 'da', 'fi', 'no', 'cs', 'hu', 'ro', 'th', 'id', 'bg', 'uk', 'ta', 'te', 'yue',
+             'ca', 'hr', 'sr', 'sk', 'sl', 'lt', 'lv']
+
+
+def _skewed(rng, size, pool, power):
+    """Ids in [0, pool) where low ids are much more frequent than high ones."""
+    return np.minimum((pool * rng.random(size) ** power).astype(np.int64), pool - 1)
+
+
+def _list_column(rng, num_rows, names, low, high, power):
+    lengths = rng.integers(low, high + 1, size=num_rows)
+    offsets = np.zeros(num_rows + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    indices = _skewed(rng, int(offsets[-1]), len(names), power).astype(np.int32)
+    return pa.ListArray.from_arrays(pa.array(offsets), pa.DictionaryArray.from_arrays(pa.array(indices), names))
+
+
+def synthetic_catalog(num_rows, seed=0):
+    """Returns a catalog table with `num_rows` titles, encoded like catalog.arrow."""
+    rng = np.random.default_rng(seed)
+    people = pa.array([f'Person {i}' for i in range(max(num_rows // 2, 1))])
+    directors = pa.array([f'Director {i}' for i in range(max(num_rows // 10, 1))])
+    votes = np.maximum(rng.lognormal(5, 2, size=num_rows).astype(np.int64), 5)
+    ratings = np.round(np.clip(rng.normal(6.2, 1.3, size=num_rows), 1, 10), 1)
+    min_votes = np.quantile(votes, 0.9)
+    weighted = votes / (votes + min_votes) * ratings + min_votes / (votes + min_votes) * ratings.mean()
+    table = pa.table({
+        'tconst': pa.array([f'tt{i:07d}' for i in range(1, num_rows + 1)]),
+        'title': pa.array([f'Movie {i}' for i in range(1, num_rows + 1)]),
+        'isAdult': pa.array((rng.random(num_rows) < 0.02).astype(np.int8)),
+        'startYear': pa.array(rng.integers(1920, 2025, size=num_rows).astype(np.int16)),
+        'runtimeMinutes': pa.array(rng.integers(60, 200, size=num_rows).astype(np.int32)),
+        'genres': _list_column(rng, num_rows, pa.array(GENRES), 1, 3, 2),
+        'averageRating': pa.array(ratings),
+        'numVotes': pa.array(votes),
+        'weighted_rating': pa.array(weighted),
+        'available_languages': _list_column(rng, num_rows, pa.array(LANGUAGES), 1, 6, 3),
+        'cast': _list_column(rng, num_rows, people, 3, 10, 2),
+        'directors': _list_column(rng, num_rows, directors, 1, 2, 1.5),
+    })
+    return encode_table(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic catalog.")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='synthetic.arrow')
+    args = parser.parse_args()
+    write_catalog(synthetic_catalog(args.rows, args.seed), args.output)
+    print(f"Wrote {args.rows} synthetic titles to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Columnar movie catalog.
+
+`merged_df.zip` stores the list columns as Python literals, so reading it means
+running ast.literal_eval over every row. This module converts it once, offline,
+into an Arrow IPC file with real list columns whose items are dictionary-encoded
+strings. The app memory-maps that file, so opening it needs no parsing.
+
+Build the catalog with:
+
+    python catalog.py build --source merged_df.zip --output catalog.arrow
+"""
+import argparse
+import ast
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from interned import InternedLists
+
+SOURCE_PATH = 'merged_df.zip'
+CATALOG_PATH = 'catalog.arrow'
+
+# Columns stored in merged_df.zip as stringified Python lists
+LIST_COLUMNS = ['available_languages', 'genres', 'cast', 'directors']
+
+
+def read_source(path=SOURCE_PATH):
+    """Reads merged_df.zip and parses its list columns (the slow, legacy path)."""
+    df = pd.read_csv(path, compression="zip")
+    for col in LIST_COLUMNS:
+        df[col] = df[col].apply(ast.literal_eval)
+    return df
+
+
+def id_numbers(ids):
+    """'tt0111161' / 'nm0000151' -> 111161 / 151, for a whole Arrow column at once."""
+    return pc.cast(pc.utf8_slice_codeunits(ids, 2), pa.int64()).to_numpy(zero_copy_only=False)
+
+
+def _dictionary_list(array):
+    """Re-encodes a list<string> array as list<dictionary<int32, string>>."""
+    array = array.combine_chunks() if isinstance(array, pa.ChunkedArray) else array
+    if array.offset or array.null_count:
+        # from_arrays needs zero-based offsets without nulls
+        array = pa.array(array.to_pylist(), type=pa.list_(pa.string()))
+    values = pc.dictionary_encode(array.values)
+    return pa.ListArray.from_arrays(array.offsets, values)
+
+
+def to_table(df):
+    """Converts the parsed catalog dataframe into the on-disk Arrow layout."""
+    return encode_table(pa.Table.from_pandas(df, preserve_index=False))
+
+
+def encode_table(table):
+    """Dictionary-encodes the list columns of a catalog table."""
+    for name in LIST_COLUMNS:
+        if name not in table.column_names:
+            continue
+        index = table.schema.get_field_index(name)
+        column = _dictionary_list(table.column(name))
+        table = table.set_column(index, pa.field(name, column.type), column)
+    # Plain string columns stay as they are; large_string only costs extra offsets
+    for index, field in enumerate(table.schema):
+        if pa.types.is_large_string(field.type):
+            column = table.column(index).cast(pa.string())
+            table = table.set_column(index, pa.field(field.name, pa.string()), column)
+    return table.replace_schema_metadata({b'datawiz.rows': str(table.num_rows).encode()})
+
+
+def write_catalog(table, path=CATALOG_PATH):
+    """Writes the table as a single uncompressed record batch, atomically."""
+    tmp_path = f'{path}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table.combine_chunks())
+    # Readers either see the old file or the new one, never a partial write
+    os.replace(tmp_path, path)
+
+
+def build_catalog(source=SOURCE_PATH, output=CATALOG_PATH):
+    """Converts merged_df.zip into the memory-mappable catalog file."""
+    table = to_table(read_source(source))
+    write_catalog(table, output)
+    return table.num_rows
+
+
+def open_catalog(path=CATALOG_PATH):
+    """Memory-maps the catalog file and returns it as an Arrow table."""
+    source = pa.memory_map(path, 'r')
+    return pa.ipc.open_file(source).read_all()
+
+
+def _arrow_type_mapper(arrow_type):
+    # Keep strings and lists in their Arrow buffers instead of creating Python objects
+    if pa.types.is_list(arrow_type) or pa.types.is_string(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def catalog_frame(table, lists=True):
+    """
+    Wraps the Arrow table in a dataframe without copying the list columns.
+    With lists=False they are left out; catalog_lists serves them instead.
+    """
+    if not lists:
+        table = table.drop_columns([name for name in LIST_COLUMNS if name in table.column_names])
+    return table.to_pandas(types_mapper=_arrow_type_mapper)
+
+
+def catalog_lists(table):
+    """The list columns of the catalog as interned CSR arrays, one per column."""
+    return {name: InternedLists.from_arrow(table.column(name)) for name in LIST_COLUMNS}
+
+
+def prepare_catalog(path=CATALOG_PATH, source=SOURCE_PATH):
+    """Opens the catalog table, building it first if only merged_df.zip is available."""
+    if not os.path.exists(path) and os.path.exists(source):
+        build_catalog(source, path)
+    return open_catalog(path)
+
+
+def load_catalog(path=CATALOG_PATH, source=SOURCE_PATH):
+    """Opens the catalog as a dataframe, building it first if only merged_df.zip is available."""
+    return catalog_frame(prepare_catalog(path, source))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the DataWiz movie catalog.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="convert merged_df.zip into catalog.arrow")
+    build.add_argument('--source', default=SOURCE_PATH)
+    build.add_argument('--output', default=CATALOG_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        rows = build_catalog(args.source, args.output)
+        print(f"Wrote {rows} titles to {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""
+Versioned, partitioned catalog for incremental refreshes.
+
+IMDb publishes fresh dumps every day, but only a small share of titles changes
+between two of them. The store splits the catalog into partitions by IMDb id
+range and gives every row a content hash. Writing a new catalog compares it
+with the current version partition by partition, writes only the partitions
+whose rows changed, and then atomically replaces manifest.json. Partition files
+are immutable and named after their content, so readers of an older manifest
+keep working while a newer one is written.
+
+LiveCatalog is the serving side: it polls the manifest and, when a new version
+appears, opens it and patches the filter indexes from the rows that changed in
+a background thread. It then swaps the whole snapshot in at once, so requests
+never see a half-updated catalog or wait for a reload.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from catalog import CATALOG_PATH, LIST_COLUMNS, SOURCE_PATH, catalog_frame, catalog_lists, id_numbers, \
+    open_catalog, prepare_catalog, write_catalog
+from facets import FacetSummary
+from filter_index import FilterIndex
+from published import Published
+from query import CatalogQuery
+
+STORE_DIR = os.environ.get('CATALOG_STORE', 'catalog')
+MANIFEST = 'manifest.json'
+HASH_COLUMN = 'row_hash'
+
+# IMDb ids per partition; new titles get the highest ids, so they land in the last partitions
+PARTITION_SPAN = 1 << 17
+
+# Manifests (and their partition files) kept for readers that are still on an older version
+KEEP_VERSIONS = 3
+
+# Seconds between two looks at the manifest from a serving process
+CHECK_INTERVAL = 30
+
+
+def row_hashes(table):
+    """Returns a 64-bit content hash per row, over every column but the hash itself."""
+    columns = {}
+    for name in table.column_names:
+        if name == HASH_COLUMN:
+            continue
+        column = table.column(name)
+        if pa.types.is_list(column.type):
+            # Join list items with a unit separator so ['a b'] and ['a', 'b'] differ
+            column = pc.binary_join(pc.cast(column, pa.list_(pa.string())), '\x1f')
+        columns[name] = column.to_numpy(zero_copy_only=False)
+    return pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+
+
+def with_row_hashes(table):
+    """Sorts the catalog by IMDb id and adds the row hash column if it is missing."""
+    table = table.take(pa.array(np.argsort(id_numbers(table.column('tconst')), kind='stable')))
+    if HASH_COLUMN not in table.column_names:
+        table = table.append_column(HASH_COLUMN, pa.array(row_hashes(table), type=pa.uint64()))
+    return table
+
+
+class CatalogStore:
+    """A directory of immutable catalog partitions plus the manifest naming the current ones."""
+
+    def __init__(self, root=STORE_DIR, span=PARTITION_SPAN):
+        self.root = root
+        self.span = span
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def exists(self):
+        return os.path.exists(self._path(MANIFEST))
+
+    def manifest(self):
+        """Returns the current manifest, or None if nothing was written yet."""
+        try:
+            with open(self._path(MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def version(self):
+        manifest = self.manifest()
+        return manifest['version'] if manifest else 0
+
+    def open(self, manifest=None):
+        """Memory-maps every partition of a version; returns (version, table)."""
+        manifest = manifest or self.manifest()
+        if manifest is None:
+            raise FileNotFoundError(self._path(MANIFEST))
+        tables = [open_catalog(self._path(partition['file'])) for partition in manifest['partitions']]
+        # Partitions are in id order, so concatenating them keeps the catalog sorted by id
+        return manifest['version'], pa.concat_tables(tables)
+
+    def write(self, table):
+        """
+        Makes `table` the current catalog version, rewriting only the partitions
+        whose rows differ from the current version. Returns a summary of the diff.
+        """
+        current = self.manifest() or {'version': 0, 'span': self.span, 'partitions': []}
+        # Partition boundaries stay those of the existing store, so partitions can be compared
+        span = current['span']
+        table = with_row_hashes(table)
+        ids = id_numbers(table.column('tconst'))
+        hashes = table.column(HASH_COLUMN).to_numpy()
+        buckets = ids // span
+        bounds = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1], True]) if len(ids) else np.array([0])
+
+        previous = {partition['bucket']: partition for partition in current['partitions']}
+        summary = {'version': current['version'] + 1, 'written': 0, 'reused': 0,
+                   'added': 0, 'removed': 0, 'changed': 0}
+        os.makedirs(self.root, exist_ok=True)
+
+        partitions = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            bucket = int(buckets[start])
+            digest = hashlib.sha256(ids[start:stop].tobytes() + hashes[start:stop].tobytes()).hexdigest()[:16]
+            old = previous.pop(bucket, None)
+            if old is not None and old['digest'] == digest:
+                partitions.append(old)
+                summary['reused'] += 1
+                continue
+            name = f'part-{bucket:05d}-{digest}.arrow'
+            write_catalog(table.slice(start, stop - start), self._path(name))
+            partitions.append({'bucket': bucket, 'file': name, 'digest': digest, 'rows': int(stop - start)})
+            summary['written'] += 1
+            self._count_changes(summary, old, ids[start:stop], hashes[start:stop])
+        for old in previous.values():
+            summary['removed'] += old['rows']
+        if not summary['written'] and not summary['removed'] and current['partitions']:
+            # Nothing changed; keep the current version so serving processes have nothing to reload
+            summary['version'] = current['version']
+            return summary
+
+        manifest = {'version': summary['version'], 'rows': table.num_rows, 'span': span,
+                    'created_at': time.time(), 'partitions': partitions}
+        self._write_json(f'manifest-{manifest["version"]:06d}.json', manifest)
+        # Readers switch versions here, all at once
+        self._write_json(MANIFEST, manifest)
+        self._collect_garbage()
+        return summary
+
+    def _count_changes(self, summary, old, ids, hashes):
+        if old is None:
+            summary['added'] += len(ids)
+            return
+        old_table = open_catalog(self._path(old['file']))
+        old_ids = id_numbers(old_table.column('tconst'))
+        old_hashes = old_table.column(HASH_COLUMN).to_numpy()
+        common, new_at, old_at = np.intersect1d(ids, old_ids, return_indices=True)
+        summary['changed'] += int((hashes[new_at] != old_hashes[old_at]).sum())
+        summary['added'] += len(ids) - len(common)
+        summary['removed'] += len(old_ids) - len(common)
+
+    def _write_json(self, name, data):
+        tmp_path = self._path(f'{name}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(name))
+
+    def _collect_garbage(self):
+        """Deletes manifests beyond KEEP_VERSIONS and partition files none of the kept ones use."""
+        names = os.listdir(self.root)
+        versions = sorted(name for name in names if name.startswith('manifest-') and name.endswith('.json'))
+        for name in versions[:-KEEP_VERSIONS]:
+            os.remove(self._path(name))
+        referenced = set()
+        for name in versions[-KEEP_VERSIONS:]:
+            with open(self._path(name)) as f:
+                referenced.update(partition['file'] for partition in json.load(f)['partitions'])
+        for name in names:
+            if name.startswith('part-') and name not in referenced:
+                # Processes that still map an unlinked file keep reading it until they let go
+                os.remove(self._path(name))
+
+
+class CatalogSnapshot:
+    """One catalog version together with the indexes built over it."""
+
+    def __init__(self, version, table, df, lists, filter_index, query):
+        self.version = version
+        self.table = table
+        self.df = df        # scalar columns
+        self.lists = lists  # list columns, interned
+        self.filter_index = filter_index
+        self.query = query
+        # Sidebar options and bounds, taken from the indexes instead of the rows
+        self.facets = FacetSummary.build(filter_index, query.limits)
+        # Search and similarity indexes published along with the snapshot (serving.py); the app
+        # builds the ones missing here itself
+        self.shared = {}
+
+    @classmethod
+    def build(cls, version, table):
+        df = catalog_frame(table, lists=False)
+        lists = catalog_lists(table)
+        return cls(version, table, df, lists, FilterIndex.build(lists, LIST_COLUMNS), CatalogQuery.build(df))
+
+    def updated(self, version, table):
+        """Returns the snapshot of a newer version, patching the filter indexes from the rows that changed."""
+        old_ids, old_hashes = self._keys(self.table)
+        new_ids, new_hashes = self._keys(table)
+
+        # Old rows whose id is still there with the same content keep their postings
+        row_map = np.full(len(old_ids), -1, dtype=np.int64)
+        common, new_at, old_at = np.intersect1d(new_ids, old_ids, return_indices=True)
+        same = new_hashes[new_at] == old_hashes[old_at]
+        row_map[old_at[same]] = new_at[same]
+        source = np.full(len(new_ids), -1, dtype=np.int64)
+        source[new_at[same]] = old_at[same]
+        rows = np.flatnonzero(source < 0)
+
+        df = catalog_frame(table, lists=False)
+        changed = table.select(LIST_COLUMNS).take(pa.array(rows, type=pa.int64()))
+        filter_index = self.filter_index.patch(row_map, rows, changed, len(new_ids))
+        lists = {name: self.lists[name].patch(source, rows, changed.column(name)) for name in LIST_COLUMNS}
+        # The sorted range indexes are a handful of argsorts, cheaper to redo than to patch
+        return CatalogSnapshot(version, table, df, lists, filter_index, CatalogQuery.build(df))
+
+    @staticmethod
+    def _keys(table):
+        hashes = (table.column(HASH_COLUMN).to_numpy() if HASH_COLUMN in table.column_names
+                  else row_hashes(table))
+        return id_numbers(table.column('tconst')), hashes
+
+
+class LiveCatalog:
+    """
+    Serves the current catalog snapshot and moves to newer store versions in the
+    background. Falls back to the single-file catalog while the store is empty.
+    """
+
+    def __init__(self, store, path=CATALOG_PATH, source=SOURCE_PATH, check_interval=CHECK_INTERVAL):
+        self.store = store
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        if store.exists():
+            self._snapshot = Published(CatalogSnapshot.build(*store.open()))
+        else:
+            self._snapshot = Published(CatalogSnapshot.build(0, prepare_catalog(path, source)))
+
+    def current(self):
+        """Returns the newest loaded snapshot; starts loading a newer version if one was published."""
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            if self.store.version() > self._snapshot.get().version and self._lock.acquire(blocking=False):
+                threading.Thread(target=self._refresh_locked, name='catalog-refresh', daemon=True).start()
+        return self._snapshot.get()
+
+    def refresh(self):
+        """Moves to the newest store version right away; returns the snapshot in use."""
+        with self._lock:
+            self._refresh()
+        return self._snapshot.get()
+
+    def _refresh_locked(self):
+        try:
+            self._refresh()
+        finally:
+            self._lock.release()
+
+    def _refresh(self):
+        manifest = self.store.manifest()
+        if manifest is None or manifest['version'] <= self._snapshot.get().version:
+            return
+        self._snapshot.set(self._snapshot.get().updated(*self.store.open(manifest)))
@@ -0,0 +1,259 @@
+"""
+Filtering and recommendation logic, independent of Streamlit.
+
+The Streamlit app and the HTTP API (api.py) both go through one
+RecommendationEngine. It turns a filter selection into the ordered row ids of
+the matching titles and serves pages, facet counts, title search and "more
+like this" on top of them. A selection is a plain dict:
+
+    {'languages': ['en'], 'genres': ['Drama', 'War'], 'cast': ['tom hanks'],
+     'directors': [], 'include_adult': False, 'year': [1990, 2010],
+     'runtime': [60, 180], 'rating': [7.0, 10.0]}
+
+Every key is optional. Cast and director entries are free text resolved to
+the person they most likely mean; languages and genres must match exactly.
+
+Results come from the process-wide QueryCache, so a page of a popular
+selection is an array slice. The indexes of a catalog version are built (or
+taken from the published bundle, see serving.py) the first time it is used,
+and the engine moves to a newer version when the catalog does. Everything is
+safe to call from many threads at once.
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from ann_index import ANN_PATH, catalog_fingerprint, load_ann_index
+from catalog import CATALOG_PATH, id_numbers
+from catalog_store import STORE_DIR, CatalogStore, LiveCatalog
+from feedback import TitleEmbedder
+from name_search import NameSearch
+from published import Published
+from query_cache import QueryCache, filter_key
+from serving import SERVE_DIR, SharedCatalog
+from similarity import SimilarityIndex
+from title_search import TitleSearch
+
+# Selection key -> list column; a title must hold every selected value
+LIST_FILTERS = {'languages': 'available_languages', 'genres': 'genres', 'cast': 'cast', 'directors': 'directors'}
+# Selection key -> numeric column, filtered by an inclusive [low, high] range
+RANGE_FILTERS = {'year': 'startYear', 'runtime': 'runtimeMinutes', 'rating': 'weighted_rating'}
+PEOPLE_FILTERS = ['cast', 'directors']
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+# Catalog versions whose indexes stay loaded, so requests still on the old one finish
+KEEP_VERSIONS = 2
+
+
+class SelectionError(ValueError):
+    """A selection or cursor the engine cannot use; the API answers it with 400."""
+
+
+class StaleCursorError(SelectionError):
+    """A cursor issued on another catalog version; the API answers it with 409."""
+
+
+def open_live_catalog():
+    """The catalog the app and the API serve: the published bundle in serving mode, else the store."""
+    if os.environ.get('CATALOG_SERVE'):
+        return SharedCatalog(SERVE_DIR)
+    return LiveCatalog(CatalogStore(STORE_DIR), CATALOG_PATH)
+
+
+class VersionIndexes:
+    """A catalog snapshot and the search and similarity indexes built over it."""
+
+    def __init__(self, snapshot, ann_path=ANN_PATH):
+        shared = snapshot.shared
+        self.snapshot = snapshot
+        self.similarity = shared.get('similarity') or SimilarityIndex.build(snapshot.df, snapshot.filter_index)
+        self.name_search = shared.get('name_search') or {name: NameSearch.build(snapshot.filter_index[name])
+                                                         for name in PEOPLE_FILTERS}
+        self.title_search = shared.get('title_search') or TitleSearch.build(snapshot.table)
+        self.embedder = shared.get('embedder') or TitleEmbedder(self.similarity)
+        # Approximate search for large catalogs, used when an index was built for this exact catalog
+        self.ann = load_ann_index(ann_path, catalog_fingerprint(snapshot.table.column('tconst'), self.similarity),
+                                  len(self.similarity.weights))
+        # IMDb id numbers in sorted order, for finding a title's row
+        ids = id_numbers(snapshot.table.column('tconst'))
+        self.id_order = np.argsort(ids, kind='stable')
+        self.sorted_ids = ids[self.id_order]
+
+    def row(self, tconst):
+        """The catalog row of an IMDb id like 'tt0076759'; LookupError if it is not in the catalog."""
+        number = int(tconst[2:]) if tconst[:2] == 'tt' and tconst[2:].isdigit() else -1
+        position = int(np.searchsorted(self.sorted_ids, number))
+        if number < 0 or position == len(self.sorted_ids) or self.sorted_ids[position] != number:
+            raise LookupError(f"{tconst} is not in the catalog")
+        return int(self.id_order[position])
+
+
+class Query:
+    """A resolved selection on one catalog version and its ordered result."""
+
+    def __init__(self, indexes, people, list_filters, range_filters, key, rows):
+        self.indexes = indexes
+        self.snapshot = indexes.snapshot
+        self.people = people                # people filter -> {entry: vocabulary id or None}
+        self.list_filters = list_filters    # list column -> values a title must hold
+        self.range_filters = range_filters  # numeric column -> (low, high) or None
+        self.key = key                      # QueryCache key, including the version
+        self.rows = rows                    # matching row ids, best-rated first
+
+    def allowed(self):
+        """The result as a boolean mask over the catalog rows."""
+        mask = np.zeros(self.snapshot.table.num_rows, dtype=bool)
+        mask[self.rows] = True
+        return mask
+
+
+class RecommendationEngine:
+    """Answers selections against the newest version of a LiveCatalog or SharedCatalog."""
+
+    def __init__(self, catalog, query_cache=None, ann_path=ANN_PATH):
+        self.catalog = catalog
+        self.query_cache = query_cache or QueryCache()
+        self.ann_path = ann_path
+        self._versions = Published({})
+        self._lock = threading.Lock()
+
+    def indexes(self, snapshot=None):
+        """The indexes of `snapshot` (the current one by default), built on first use."""
+        snapshot = snapshot or self.catalog.current()
+        indexes = self._versions.get().get(snapshot.version)
+        if indexes is None:
+            # One thread builds a new version while the others wait for it, instead of all building it
+            with self._lock:
+                indexes = self._versions.get().get(snapshot.version)
+                if indexes is None:
+                    indexes = VersionIndexes(snapshot, self.ann_path)
+                    versions = dict(self._versions.get())
+                    versions[snapshot.version] = indexes
+                    self._versions.set({version: versions[version] for version in sorted(versions)[-KEEP_VERSIONS:]})
+        return indexes
+
+    def query(self, selection=None, snapshot=None):
+        """Resolves a selection dict (see the module docstring) to a Query on the current catalog."""
+        if selection is not None and not isinstance(selection, dict):
+            raise SelectionError("'filters' must be an object of filter names and values")
+        selection = dict(selection or {})
+        unknown = set(selection) - set(LIST_FILTERS) - set(RANGE_FILTERS) - {'include_adult'}
+        if unknown:
+            raise SelectionError(f"unknown filters: {', '.join(sorted(unknown))}")
+        indexes = self.indexes(snapshot)
+        snapshot = indexes.snapshot
+
+        people = {}
+        list_filters = {}
+        for key, name in LIST_FILTERS.items():
+            values = _string_list(selection.get(key), key)
+            if name in PEOPLE_FILTERS:
+                # Each entry stands for the person it most likely means, forgiving case, accents,
+                # partial names and typos
+                search = indexes.name_search[name]
+                people[name] = {entry: search.resolve(entry) for entry in values}
+                values = [search.vocabulary[person] for person in people[name].values() if person is not None]
+            list_filters[name] = values
+
+        range_filters = {'isAdult': None if selection.get('include_adult') else (0, 0)}
+        for key, name in RANGE_FILTERS.items():
+            bounds = selection.get(key)
+            if bounds is not None:
+                try:
+                    low, high = (float(value) for value in bounds)
+                except (TypeError, ValueError):
+                    raise SelectionError(f"'{key}' must be a [low, high] pair of numbers") from None
+                bounds = (low, high)
+            range_filters[name] = bounds
+
+        # Row ids of the matching movies, best-rated first; paging reuses the cached ids
+        query_key = (snapshot.version, filter_key(list_filters, range_filters, snapshot.query.limits))
+        rows = self.query_cache.get(
+            query_key,
+            lambda: snapshot.query.run(snapshot.filter_index.match(list_filters, mode='all'), range_filters),
+        )
+        return Query(indexes, people, list_filters, range_filters, query_key, rows)
+
+    def counts(self, query, name):
+        """How many of the query's titles hold each option of a list column, in option order."""
+        facets = query.snapshot.facets
+        # Cached with the result, so paging through it does not count again
+        return self.query_cache.get((query.key, name),
+                                    lambda: facets.live_counts(query.snapshot.filter_index, name, query.rows))
+
+    def search(self, query, text, k=PAGE_SIZE):
+        """Row ids of the `k` titles best matching `text` among the query's titles."""
+        rows, _ = query.indexes.title_search.search(text, k=k, allowed=query.allowed(),
+                                                     rank=query.snapshot.query.rank)
+        return rows
+
+    def similar(self, query, row, k=PAGE_SIZE):
+        """Row ids of the `k` titles most like `row` among the query's titles."""
+        indexes = query.indexes
+        if indexes.ann is not None:
+            rows, _ = indexes.ann.similar(indexes.similarity, row, k=k, allowed=query.allowed())
+        else:
+            rows, _ = indexes.similarity.similar(row, k=k, candidates=query.rows)
+        return rows
+
+    def page(self, query, cursor=None, limit=PAGE_SIZE):
+        """(row ids, next cursor) of one page of the query's result; the cursor is None on the last page."""
+        limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+        offset = self._offset(query, cursor)
+        rows = query.rows[offset:offset + limit]
+        end = offset + len(rows)
+        return rows, (self._cursor(query, end) if end < len(query.rows) else None)
+
+    @staticmethod
+    def _digest(query):
+        # The selection and the version: an offset into another version's result would skip or repeat titles
+        return hashlib.sha1(repr(query.key).encode()).hexdigest()[:16]
+
+    def _cursor(self, query, offset):
+        data = json.dumps({'selection': self._digest(query), 'version': query.snapshot.version,
+                           'offset': offset}).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def _offset(self, query, cursor):
+        if not cursor:
+            return 0
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            selection, version, offset = data['selection'], int(data['version']), int(data['offset'])
+        except (ValueError, KeyError, TypeError):
+            raise SelectionError("malformed cursor") from None
+        if version != query.snapshot.version:
+            raise StaleCursorError("the catalog was updated since this cursor was issued; start from the first page")
+        if selection != self._digest(query) or offset < 0:
+            raise SelectionError("the cursor belongs to a different selection")
+        return offset
+
+    def titles(self, snapshot, rows):
+        """The catalog entries of `rows` as JSON-ready dicts, in order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        records = snapshot.df.iloc[rows].to_dict('records')
+        for row, record in zip(rows.tolist(), records):
+            for name in LIST_FILTERS.values():
+                record[name] = snapshot.lists[name][row]
+            for name, value in record.items():
+                # numpy scalars and NaN do not survive json.dumps
+                if isinstance(value, np.generic):
+                    value = value.item()
+                record[name] = None if isinstance(value, float) and value != value else value
+        return records
+
+
+def _string_list(values, key):
+    if values is None:
+        return []
+    if isinstance(values, str):
+        values = values.split(',')
+    if not isinstance(values, (list, tuple)) or not all(isinstance(value, str) for value in values):
+        raise SelectionError(f"'{key}' must be a list of strings")
+    return [value.strip() for value in values if value.strip()]
@@ -0,0 +1,41 @@
+"""
+Facet summary for drawing the sidebar filters.
+
+The sidebar needs the sorted options of every multi-valued filter and the
+bounds of every slider. Computing them from the dataframe on each rerun means
+exploding millions of list items. The summary is built once per catalog from
+the filter and range indexes, which already hold both: an inverted index's
+vocabulary is sorted and its posting-list lengths are the value counts, and a
+range index knows its smallest and largest value. Drawing the sidebar is then
+O(facets) work.
+
+Counts for the current selection also come from the inverted indexes: one
+pass over a column's postings counts how many result rows hold each value.
+"""
+
+
+class FacetSummary:
+    """Sorted options, title counts and numeric bounds of one catalog."""
+
+    def __init__(self, vocabularies, counts, bounds, num_rows):
+        self.vocabularies = vocabularies  # column -> sorted distinct values
+        self.counts = counts              # column -> titles holding each value
+        self.bounds = bounds              # numeric column -> (min, max)
+        self.num_rows = num_rows
+
+    @classmethod
+    def build(cls, filter_index, bounds):
+        """Builds the summary from a FilterIndex and the (min, max) of each numeric column."""
+        vocabularies = {name: index.vocabulary for name, index in filter_index.columns.items()}
+        counts = {name: index.counts() for name, index in filter_index.columns.items()}
+        return cls(vocabularies, counts, dict(bounds), filter_index.num_rows)
+
+    def options(self, name):
+        """The sorted distinct values of a list column."""
+        return self.vocabularies[name]
+
+    def live_counts(self, filter_index, name, rows=None):
+        """Number of `rows` (every row if None) holding each option of a list column, in option order."""
+        if rows is None or len(rows) == self.num_rows:
+            return self.counts[name]
+        return filter_index[name].counts(rows)
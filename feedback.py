@@ -0,0 +1,108 @@
+"""
+Session feedback: learning from Like / Next / "Don't like this one" clicks.
+
+Each session keeps one fixed-size preference vector in the hashed embedding
+space of ann_index.py. A click decays the vector and adds the clicked title's
+embedding, weighted by the kind of click. Nothing else about the session's
+history is stored.
+
+The filter result itself stays shared and read-only. A session walks through
+it with a FeedbackQueue, which holds only the next WINDOW rows and their
+embeddings. After each click it refills that window from the result and
+re-orders it by preference, so a click costs O(WINDOW) work however long the
+result is. The result order still counts, so strong matches can move up
+within the window, but no title jumps far ahead of its place in the result.
+"""
+import numpy as np
+
+from ann_index import DIMENSIONS, embed_rows, projection
+
+# Upcoming rows that each click re-ranks
+WINDOW = 32
+
+# How much of the preference vector survives each click
+DECAY = 0.9
+
+FEEDBACK_WEIGHTS = {'like': 1.0, 'skip': -0.25, 'dislike': -1.0}
+
+# Preference penalty per window length a title sits behind the head of the window
+RANK_WEIGHT = 0.5
+
+
+class TitleEmbedder:
+    """Computes hashed title embeddings a few rows at a time; shared by all sessions."""
+
+    def __init__(self, similarity, dimensions=DIMENSIONS, seed=0):
+        self.similarity = similarity
+        self.dimensions = dimensions
+        self.dims, self.signs = projection(len(similarity.weights), dimensions, seed=seed)
+
+    def __call__(self, rows):
+        return embed_rows(self.similarity, rows, self.dims, self.signs, self.dimensions)
+
+
+class Preferences:
+    """One session's taste, as a decayed sum of the embeddings it reacted to."""
+
+    def __init__(self, dimensions=DIMENSIONS):
+        self.vector = np.zeros(dimensions, dtype=np.float32)
+        self.events = 0
+
+    def record(self, embedding, kind):
+        """Folds one click on a title with `embedding` into the vector."""
+        self.vector *= DECAY
+        self.vector += FEEDBACK_WEIGHTS[kind] * embedding
+        self.events += 1
+
+    def affinity(self, embeddings):
+        """How much the session should like each of `embeddings`."""
+        return embeddings @ self.vector
+
+    def choose(self, rows, embed):
+        """Returns the row the session is likely to like best among `rows`."""
+        rows = np.asarray(rows)
+        if not self.events or len(rows) < 2:
+            return rows[0]
+        return rows[int(np.argmax(self.affinity(embed(rows))))]
+
+
+class FeedbackQueue:
+    """A session's position in one filter result, with its next rows re-ranked by preference."""
+
+    def __init__(self, key, result, embed, preferences, window=WINDOW):
+        self.key = key
+        self.window = window
+        self.cursor = 0  # next position of `result` not yet in the window
+        self.rows = np.empty(0, dtype=np.int64)
+        self.positions = np.empty(0, dtype=np.int64)
+        self.embeddings = np.empty((0, preferences.vector.shape[0]), dtype=np.float32)
+        self._fill(result, embed, preferences)
+
+    def current(self):
+        """Row id of the title to show, or None when the result is used up."""
+        return int(self.rows[0]) if len(self.rows) else None
+
+    def upcoming(self, count):
+        """Row ids of the current title and the ones that follow it."""
+        return self.rows[:count]
+
+    def advance(self, result, embed, preferences, kind):
+        """Records `kind` ('like', 'skip' or 'dislike') for the current title and moves past it."""
+        if not len(self.rows):
+            return
+        preferences.record(self.embeddings[0], kind)
+        self.rows, self.positions, self.embeddings = self.rows[1:], self.positions[1:], self.embeddings[1:]
+        self._fill(result, embed, preferences)
+
+    def _fill(self, result, embed, preferences):
+        added = np.asarray(result[self.cursor:self.cursor + self.window - len(self.rows)], dtype=np.int64)
+        if len(added):
+            self.rows = np.concatenate([self.rows, added])
+            self.positions = np.concatenate([self.positions, np.arange(self.cursor, self.cursor + len(added))])
+            self.embeddings = np.concatenate([self.embeddings, embed(added)])
+            self.cursor += len(added)
+        if preferences.events and len(self.rows) > 1:
+            score = preferences.affinity(self.embeddings)
+            score -= RANK_WEIGHT * (self.positions - self.positions.min()) / self.window
+            order = np.argsort(-score, kind='stable')
+            self.rows, self.positions, self.embeddings = self.rows[order], self.positions[order], self.embeddings[order]
@@ -0,0 +1,246 @@
+"""
+Inverted indexes for the multi-valued sidebar filters.
+
+For every language, genre and person the index keeps the sorted row ids of the
+titles that contain it, stored CSR-style (one offsets array plus one flat array
+of row ids per column). A filter then intersects or merges a handful of short
+integer arrays instead of scanning every row's list in Python.
+"""
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from interned import InternedLists, SortedIds, StringVocabulary
+
+EMPTY = np.empty(0, dtype=np.int32)
+
+
+def sorted_member(values, sorted_values):
+    """Boolean mask telling which of `values` appear in the sorted `sorted_values` array."""
+    if len(sorted_values) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return sorted_values[positions] == values
+
+
+def _list_array(values):
+    """Returns a column of lists as a single, unsliced Arrow list array."""
+    if isinstance(values, InternedLists):
+        array = values.to_arrow()
+    elif isinstance(values, (pa.Array, pa.ChunkedArray)):
+        array = values
+    else:
+        try:
+            # Arrow-backed pandas columns hand over their buffers without copying
+            array = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            array = pa.array(list(values), type=pa.list_(pa.string()))
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    return array
+
+
+class InvertedIndex:
+    """Maps each distinct value of one list column to the sorted ids of the rows containing it."""
+
+    def __init__(self, vocabulary, offsets, rows, num_rows, values=None):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.rows = rows
+        self.num_rows = num_rows
+        # The vocabulary as a sorted object array: lookups search it and patch() merges new values into it
+        self._values = values
+        self.ids = self._ids()
+
+    def _ids(self):
+        if isinstance(self.vocabulary, StringVocabulary):
+            return self.vocabulary.ids()
+        return SortedIds(self._sorted_values())
+
+    def _sorted_values(self):
+        if self._values is None:
+            self._values = np.fromiter(self.vocabulary, dtype=object, count=len(self.vocabulary))
+        return self._values
+
+    def __getstate__(self):
+        # The lookups and the array are rebuilt on load; a shared vocabulary answers lookups itself
+        state = self.__dict__.copy()
+        del state['ids'], state['_values']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _values=None)
+        self.ids = self._ids()
+
+    @classmethod
+    def build(cls, values):
+        """Builds the index from a column of lists (Arrow list array or Python lists)."""
+        array = _list_array(values)
+        num_rows = len(array)
+        lengths = pc.fill_null(pc.list_value_length(array), 0).to_numpy()
+        items = pc.list_flatten(array)
+        row_ids = np.repeat(np.arange(num_rows, dtype=np.int64), lengths)
+
+        if not pa.types.is_dictionary(items.type):
+            items = pc.dictionary_encode(items)
+        valid = pc.is_valid(items).to_numpy(zero_copy_only=False)
+        codes = items.indices.to_numpy(zero_copy_only=False)[valid].astype(np.int64)
+        row_ids = row_ids[valid]
+
+        # Give the values in use a sorted order so lookups and widgets agree; a slice of a
+        # dictionary column carries its whole dictionary
+        used = np.flatnonzero(np.bincount(codes, minlength=len(items.dictionary)))
+        dictionary = np.asarray(items.dictionary.take(pa.array(used)).to_pylist(), dtype=object)
+        order = np.argsort(dictionary.astype(str), kind='stable')
+        rank = np.full(len(items.dictionary), -1, dtype=np.int64)
+        rank[used[order]] = np.arange(len(order))
+        sorted_values = dictionary[order]
+
+        # Sorting by (value, row) groups the postings and drops duplicate items in a row
+        keys = np.sort(rank[codes] * max(num_rows, 1) + row_ids)
+        keys = keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys
+        value_ids = keys // max(num_rows, 1)
+        rows = (keys % max(num_rows, 1)).astype(np.int32)
+        offsets = np.zeros(len(sorted_values) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(value_ids, minlength=len(sorted_values)), out=offsets[1:])
+        return cls(sorted_values.tolist(), offsets, rows, num_rows, sorted_values)
+
+    def patch(self, row_map, rows, values, num_rows):
+        """
+        Returns the index of an updated catalog without re-reading unchanged rows.
+
+        `row_map[old_row]` is the new id of a row that did not change, or -1 if it
+        was removed or modified. `values` holds the lists of the new and modified
+        rows, and `rows` their ids in the updated catalog.
+        """
+        old_values = self._sorted_values()
+        kept_ids = np.repeat(np.arange(len(old_values)), np.diff(self.offsets))
+        kept_rows = row_map[self.rows]
+        kept = kept_rows >= 0
+        kept_ids, kept_rows = kept_ids[kept], kept_rows[kept]
+
+        added = InvertedIndex.build(values)
+        added_ids = np.repeat(np.arange(len(added.vocabulary)), np.diff(added.offsets))
+        added_rows = np.asarray(rows, dtype=np.int64)[added.rows]
+
+        # Slot the few values seen for the first time into the sorted vocabulary
+        added_values = added._sorted_values()
+        found = np.searchsorted(old_values, added_values)
+        known = sorted_member(added_values, old_values)
+        inserts = found[~known]
+        old_position = np.arange(len(old_values)) + np.searchsorted(inserts, np.arange(len(old_values)), side='right')
+        new_position = inserts + np.arange(len(inserts))
+        vocabulary = np.empty(len(old_values) + len(inserts), dtype=object)
+        vocabulary[old_position] = old_values
+        vocabulary[new_position] = added_values[~known]
+        added_position = np.empty(len(added_values), dtype=np.int64)
+        added_position[known] = old_position[found[known]]
+        added_position[~known] = new_position
+
+        width = max(num_rows, 1)
+        keys = old_position[kept_ids] * width + kept_rows
+        added_keys = np.sort(added_position[added_ids] * width + added_rows)
+        if np.all(keys[1:] > keys[:-1]):
+            # Kept rows kept their order, so their postings are still sorted: merge the few new ones in
+            keys = np.insert(keys, np.searchsorted(keys, added_keys), added_keys)
+        else:
+            keys = np.sort(np.concatenate([keys, added_keys]))
+        counts = np.bincount(keys // width, minlength=len(vocabulary))
+        # Values whose last row went away leave the vocabulary
+        used = counts > 0
+        offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+        np.cumsum(counts[used], out=offsets[1:])
+        vocabulary = vocabulary[used]
+        return InvertedIndex(vocabulary.tolist(), offsets, (keys % width).astype(np.int32), num_rows, vocabulary)
+
+    def postings(self, value_id):
+        """Returns the sorted row ids for one value id."""
+        return self.rows[self.offsets[value_id]:self.offsets[value_id + 1]]
+
+    def lookup(self, value):
+        """Returns the sorted row ids of the rows containing `value`."""
+        value_id = self.ids.get(value)
+        if value_id is None:
+            return EMPTY
+        return self.postings(value_id)
+
+    def count(self, value):
+        """Returns how many rows contain `value`."""
+        value_id = self.ids.get(value)
+        if value_id is None:
+            return 0
+        return int(self.offsets[value_id + 1] - self.offsets[value_id])
+
+    def counts(self, rows=None):
+        """How many of `rows` (sorted or not; every row if None) contain each vocabulary value."""
+        if rows is None:
+            return np.diff(self.offsets)
+        member = np.zeros(self.num_rows, dtype=bool)
+        member[rows] = True
+        # Running count of member postings; each value's count is the difference across its slice
+        hits = np.zeros(len(self.rows) + 1, dtype=np.int64)
+        np.cumsum(member[self.rows], out=hits[1:])
+        return hits[self.offsets[1:]] - hits[self.offsets[:-1]]
+
+    def containing(self, fragment):
+        """Returns the values that contain `fragment` as a substring."""
+        return [value for value in self.vocabulary if fragment in value]
+
+    def match_all(self, values):
+        """Row ids of the rows containing every one of `values`."""
+        postings = sorted((self.lookup(value) for value in set(values)), key=len)
+        if not postings:
+            return None
+        result = postings[0]
+        # Start from the rarest value so every intersection is as small as possible
+        for rows in postings[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, rows, assume_unique=True)
+        return result
+
+    def match_any(self, values):
+        """Row ids of the rows containing at least one of `values`."""
+        postings = [self.lookup(value) for value in set(values)]
+        if not postings:
+            return None
+        return np.unique(np.concatenate(postings)).astype(np.int32)
+
+
+class FilterIndex:
+    """Inverted indexes for several list columns of the same catalog."""
+
+    def __init__(self, columns, num_rows):
+        self.columns = columns
+        self.num_rows = num_rows
+
+    @classmethod
+    def build(cls, df, columns):
+        """Builds one inverted index per column of `df`, a dataframe or a dict of list columns."""
+        indexes = {name: InvertedIndex.build(df[name]) for name in columns}
+        return cls(indexes, len(df[columns[0]]))
+
+    def patch(self, row_map, rows, frame, num_rows):
+        """Applies InvertedIndex.patch to every column; `frame` holds the new and modified rows."""
+        indexes = {name: index.patch(row_map, rows, frame[name], num_rows) for name, index in self.columns.items()}
+        return FilterIndex(indexes, num_rows)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def match(self, selections, mode='all'):
+        """
+        Returns the sorted row ids matching every non-empty selection, or None when
+        nothing is selected. `mode` is 'all' (a row must contain every selected value
+        of a column) or 'any' (one selected value per column is enough).
+        """
+        result = None
+        for name, values in selections.items():
+            if not values:
+                continue
+            index = self.columns[name]
+            rows = index.match_all(values) if mode == 'all' else index.match_any(values)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
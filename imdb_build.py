@@ -0,0 +1,387 @@
+"""
+Reproducible catalog build from the IMDb TSV dumps.
+
+Streams title.basics, title.ratings, title.akas, title.crew, title.principals
+and name.basics in fixed-size blocks with explicit column types. Only movies
+are kept, and every other table is semi-joined against the sorted array of
+movie ids as it streams. The surviving rows are spread over on-disk
+partitions by id, and the joins then run partition by partition as hash joins
+(a grace hash join). Memory for reading and joining is bounded by the block
+size and by the largest partition, not by the size of the dumps. The joined
+catalog itself is held in memory, though: it is sorted by id, dictionary-
+encoded and written as one record batch. So peak memory grows with the output
+catalog, at about twice its size while it is sorted.
+
+    python imdb_build.py --dumps ./imdb --output catalog.arrow
+
+With --store, the result goes into the versioned catalog store instead (see
+catalog_store.py): only partitions with changed titles are rewritten, and running
+app processes switch to the new version on their own.
+
+The dumps are the *.tsv.gz files from https://datasets.imdbws.com/.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from catalog import CATALOG_PATH, encode_table, id_numbers, write_catalog
+from catalog_store import STORE_DIR, CatalogStore
+from filter_index import sorted_member
+
+PARTITIONS = 64
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# Minimum-votes quantile used by the IMDb weighted rating formula
+MIN_VOTES_QUANTILE = 0.9
+
+# Column types of the fields read from each dump; IMDb writes missing values as \N
+DUMPS = {
+    'basics': ('title.basics.tsv.gz', {
+        'tconst': pa.string(), 'titleType': pa.string(), 'primaryTitle': pa.string(),
+        'isAdult': pa.int8(), 'startYear': pa.int16(), 'runtimeMinutes': pa.int32(), 'genres': pa.string(),
+    }),
+    'ratings': ('title.ratings.tsv.gz', {
+        'tconst': pa.string(), 'averageRating': pa.float64(), 'numVotes': pa.int64(),
+    }),
+    'akas': ('title.akas.tsv.gz', {'titleId': pa.string(), 'language': pa.string()}),
+    'crew': ('title.crew.tsv.gz', {'tconst': pa.string(), 'directors': pa.string()}),
+    'principals': ('title.principals.tsv.gz', {
+        'tconst': pa.string(), 'ordering': pa.int32(), 'nconst': pa.string(), 'category': pa.string(),
+    }),
+    'names': ('name.basics.tsv.gz', {'nconst': pa.string(), 'primaryName': pa.string()}),
+}
+
+CAST_CATEGORIES = ['actor', 'actress']
+
+
+def read_dump(path, column_types, block_size=BLOCK_SIZE):
+    """Streams a (gzipped) IMDb TSV as typed record batches."""
+    return pacsv.open_csv(
+        pa.input_stream(path, compression='detect'),
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        # IMDb does not quote fields; titles may contain literal quotes
+        parse_options=pacsv.ParseOptions(delimiter='\t', quote_char=False),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=list(column_types), column_types=column_types,
+            null_values=['\\N'], strings_can_be_null=True,
+        ),
+    )
+
+
+class Stage:
+    """Counts rows through a build step and reports its throughput."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        print(f"{self.name:<28}{self.rows:>12,} rows {elapsed:>8.1f}s {self.rows / max(elapsed, 1e-9):>12,.0f} rows/s")
+
+
+class PartitionWriter:
+    """Spreads record batches over N Arrow stream files by an integer key."""
+
+    def __init__(self, directory, name, num_partitions):
+        self.paths = [os.path.join(directory, f'{name}-{part:03d}.arrows') for part in range(num_partitions)]
+        self.num_partitions = num_partitions
+        self._writers = None
+
+    def write(self, batch, keys):
+        if self._writers is None:
+            self._writers = [pa.ipc.new_stream(path, batch.schema) for path in self.paths]
+        parts = keys % self.num_partitions
+        order = np.argsort(parts, kind='stable')
+        bounds = np.searchsorted(parts[order], np.arange(self.num_partitions + 1))
+        batch = batch.take(pa.array(order))
+        for part in range(self.num_partitions):
+            if bounds[part + 1] > bounds[part]:
+                self._writers[part].write_batch(batch.slice(bounds[part], bounds[part + 1] - bounds[part]))
+
+    def close(self):
+        for writer in self._writers or []:
+            writer.close()
+
+    def read(self, part):
+        """Returns one partition as a table, or None if nothing was written to it."""
+        if self._writers is None:
+            return None
+        with pa.memory_map(self.paths[part]) as source:
+            return pa.ipc.open_stream(source).read_all()
+
+
+def _partition_dump(path, column_types, writer, key_column, transform, stage, block_size):
+    for batch in read_dump(path, column_types, block_size):
+        stage.rows += batch.num_rows
+        batch = transform(batch)
+        if batch is not None and batch.num_rows:
+            writer.write(batch, id_numbers(batch.column(key_column)))
+
+
+class ImdbBuild:
+    """One run of the partitioned build; scratch files live in `workdir`."""
+
+    def __init__(self, dump_dir, workdir, num_partitions=PARTITIONS, block_size=BLOCK_SIZE):
+        self.dump_dir = dump_dir
+        self.workdir = workdir
+        self.num_partitions = num_partitions
+        self.block_size = block_size
+        self.movie_ids = np.empty(0, dtype=np.int64)
+        self.person_ids = np.empty(0, dtype=np.int64)
+
+    def _path(self, name):
+        return os.path.join(self.dump_dir, DUMPS[name][0])
+
+    def _writer(self, name):
+        return PartitionWriter(self.workdir, name, self.num_partitions)
+
+    def _stream(self, name, writer, key_column, transform):
+        with Stage(f'read {DUMPS[name][0]}') as stage:
+            _partition_dump(self._path(name), DUMPS[name][1], writer, key_column, transform, stage, self.block_size)
+
+    def movies(self):
+        """Keeps movies with a release year, genres and a runtime, like the original notebooks."""
+        writer = self._writer('basics')
+        movie_ids = []
+
+        def keep_movies(batch):
+            mask = pc.equal(batch.column('titleType'), 'movie')
+            for column in ['startYear', 'genres', 'runtimeMinutes']:
+                mask = pc.and_(mask, pc.is_valid(batch.column(column)))
+            batch = batch.filter(mask)
+            movie_ids.append(id_numbers(batch.column('tconst')))
+            # Genres stay a comma-separated string until after the joins; Acero cannot carry lists
+            return pa.RecordBatch.from_arrays(
+                [batch.column('tconst'), batch.column('primaryTitle'), batch.column('isAdult'),
+                 batch.column('startYear'), batch.column('runtimeMinutes'), batch.column('genres')],
+                names=['tconst', 'title', 'isAdult', 'startYear', 'runtimeMinutes', 'genres'],
+            )
+
+        self._stream('basics', writer, 'tconst', keep_movies)
+        writer.close()
+        self.movie_ids = np.sort(np.concatenate(movie_ids)) if movie_ids else self.movie_ids
+        return writer
+
+    def _movie_rows(self, batch, column):
+        return batch.filter(pa.array(sorted_member(id_numbers(batch.column(column)), self.movie_ids)))
+
+    def ratings(self):
+        writer = self._writer('ratings')
+        self._stream('ratings', writer, 'tconst', lambda batch: self._movie_rows(batch, 'tconst'))
+        writer.close()
+        return writer
+
+    def languages(self):
+        writer = self._writer('akas')
+
+        def movie_languages(batch):
+            batch = self._movie_rows(batch.filter(pc.is_valid(batch.column('language'))), 'titleId')
+            return pa.RecordBatch.from_arrays([batch.column('titleId'), batch.column('language')],
+                                              names=['tconst', 'language'])
+
+        self._stream('akas', writer, 'tconst', movie_languages)
+        writer.close()
+        return writer
+
+    def credits(self):
+        """Directors (from title.crew) and cast (from title.principals), partitioned by person."""
+        writer = self._writer('credits')
+        person_ids = []
+        schema = pa.schema([('tconst', pa.string()), ('nconst', pa.string()),
+                            ('role', pa.string()), ('ordering', pa.int32())])
+
+        def directors(batch):
+            batch = self._movie_rows(batch.filter(pc.is_valid(batch.column('directors'))), 'tconst')
+            lists = pc.split_pattern(batch.column('directors'), ',')
+            parents = pc.list_parent_indices(lists)
+            nconst = pc.list_flatten(lists)
+            starts = pc.take(lists.offsets[:-1], parents) if len(lists) else pa.array([], pa.int32())
+            ordering = pc.subtract(pa.array(np.arange(len(nconst), dtype=np.int32)), pc.cast(starts, pa.int32()))
+            person_ids.append(id_numbers(nconst))
+            return pa.RecordBatch.from_arrays(
+                [pc.take(batch.column('tconst'), parents), nconst,
+                 pa.array(['director'] * len(nconst), pa.string()), ordering], schema=schema)
+
+        def cast(batch):
+            batch = self._movie_rows(batch.filter(pc.is_in(batch.column('category'), pa.array(CAST_CATEGORIES))),
+                                     'tconst')
+            person_ids.append(id_numbers(batch.column('nconst')))
+            return pa.RecordBatch.from_arrays(
+                [batch.column('tconst'), batch.column('nconst'),
+                 pa.array(['cast'] * batch.num_rows, pa.string()), batch.column('ordering')], schema=schema)
+
+        # Both dumps feed the same partitions, keyed by person
+        self._stream('crew', writer, 'nconst', directors)
+        self._stream('principals', writer, 'nconst', cast)
+        writer.close()
+        self.person_ids = np.unique(np.concatenate(person_ids)) if person_ids else self.person_ids
+        return writer
+
+    def names(self):
+        writer = self._writer('names')
+        self._stream('names', writer, 'nconst', lambda batch: batch.filter(
+            pa.array(sorted_member(id_numbers(batch.column('nconst')), self.person_ids))))
+        writer.close()
+        return writer
+
+    def people(self, credits, names):
+        """Hash-joins credits with names per person partition, re-partitioned by title."""
+        writer = self._writer('people')
+        with Stage('join credits x names') as stage:
+            for part in range(self.num_partitions):
+                part_credits, part_names = credits.read(part), names.read(part)
+                if part_credits is None or part_names is None:
+                    continue
+                joined = part_credits.join(part_names, 'nconst', join_type='inner', use_threads=False)
+                stage.rows += joined.num_rows
+                for batch in joined.select(['tconst', 'role', 'ordering', 'primaryName']).to_batches():
+                    writer.write(batch, id_numbers(batch.column('tconst')))
+        writer.close()
+        return writer
+
+    def rating_stats(self, ratings):
+        """Mean rating and minimum-votes threshold for the weighted rating."""
+        votes, scores = [], []
+        for part in range(self.num_partitions):
+            table = ratings.read(part)
+            if table is not None:
+                votes.append(table.column('numVotes').to_numpy())
+                scores.append(table.column('averageRating').to_numpy())
+        if not votes:
+            return 0.0, 0.0
+        votes, scores = np.concatenate(votes), np.concatenate(scores)
+        return float(scores.mean()), float(np.quantile(votes, MIN_VOTES_QUANTILE))
+
+    def titles(self, basics, ratings, akas, people):
+        """Joins everything per title partition into catalog rows."""
+        mean_rating, min_votes = self.rating_stats(ratings)
+        tables = []
+        with Stage('join titles') as stage:
+            for part in range(self.num_partitions):
+                movies, part_ratings = basics.read(part), ratings.read(part)
+                if movies is None or part_ratings is None:
+                    continue
+                # Movies without any votes cannot be ranked, so they are left out
+                movies = movies.join(part_ratings, 'tconst', join_type='inner', use_threads=False)
+                votes = pc.cast(movies.column('numVotes'), pa.float64())
+                weight = pc.divide(votes, pc.add(votes, min_votes))
+                weighted = pc.add(pc.multiply(weight, movies.column('averageRating')),
+                                  pc.multiply(pc.subtract(1, weight), mean_rating))
+                movies = movies.append_column('weighted_rating', weighted)
+                movies = movies.set_column(movies.schema.get_field_index('genres'), 'genres',
+                                           pc.split_pattern(movies.column('genres'), ','))
+                part_people = people.read(part)
+                for column, grouped in (('available_languages', self._languages(akas.read(part))),
+                                        ('cast', self._names(part_people, 'cast')),
+                                        ('directors', self._names(part_people, 'director'))):
+                    movies = movies.append_column(column, _lookup(movies.column('tconst'), *grouped))
+                stage.rows += movies.num_rows
+                tables.append(movies)
+        return tables
+
+    @staticmethod
+    def _languages(akas):
+        """(tconst, distinct languages) for one partition."""
+        if akas is None:
+            return None, None
+        # Sorted and de-duplicated by hand, so the lists do not depend on partition count or block size
+        akas = akas.sort_by([('tconst', 'ascending'), ('language', 'ascending')])
+        tconst = akas.column('tconst').to_numpy(zero_copy_only=False)
+        language = akas.column('language').to_numpy(zero_copy_only=False)
+        keep = np.ones(len(tconst), dtype=bool)
+        keep[1:] = (tconst[1:] != tconst[:-1]) | (language[1:] != language[:-1])
+        tconst, language = tconst[keep], language[keep]
+        starts = np.flatnonzero(np.r_[True, tconst[1:] != tconst[:-1]]) if len(tconst) else np.empty(0, np.int64)
+        offsets = pa.array(np.r_[starts, len(tconst)].astype(np.int32))
+        return pa.array(tconst[starts], pa.string()), pa.ListArray.from_arrays(offsets, pa.array(language, pa.string()))
+
+    @staticmethod
+    def _names(people, role):
+        """(tconst, names in billing order) for one role in one partition."""
+        if people is None:
+            return None, None
+        people = people.filter(pc.equal(people.column('role'), role))
+        people = people.sort_by([('tconst', 'ascending'), ('ordering', 'ascending')])
+        grouped = people.group_by('tconst', use_threads=False).aggregate([('primaryName', 'list')])
+        return grouped.column('tconst'), grouped.column('primaryName_list')
+
+
+def _lookup(keys, group_keys, group_values):
+    """Left-joins a grouped list column onto `keys`; titles without a group get null."""
+    if group_keys is None:
+        return pa.nulls(len(keys), pa.list_(pa.string()))
+    if isinstance(group_keys, pa.ChunkedArray):
+        group_keys = group_keys.combine_chunks()
+    return pc.take(group_values, pc.index_in(keys, value_set=group_keys))
+
+
+COLUMNS = ['tconst', 'title', 'isAdult', 'startYear', 'runtimeMinutes', 'genres', 'averageRating',
+           'numVotes', 'weighted_rating', 'available_languages', 'cast', 'directors']
+
+
+def finish_table(tables):
+    """Concatenates partition results into one catalog table sorted by IMDb id."""
+    # Still the partitions' chunks; the sorting take below is the one full copy of the catalog
+    table = pa.concat_tables(tables).select(COLUMNS)
+    for name in ['available_languages', 'cast', 'directors']:
+        # Titles without any akas/credits get empty lists rather than nulls
+        column = table.column(name)
+        filled = pc.if_else(pc.is_valid(column), column, pa.scalar([], type=column.type))
+        table = table.set_column(table.schema.get_field_index(name), name, filled)
+    return table.take(pa.array(np.argsort(id_numbers(table.column('tconst')), kind='stable')))
+
+
+def build_from_imdb(dump_dir, output=CATALOG_PATH, num_partitions=PARTITIONS, block_size=BLOCK_SIZE, workdir=None,
+                    store=None):
+    """Runs the whole build and writes the catalog (or a new store version); returns the number of titles."""
+    start = time.perf_counter()
+    scratch = tempfile.mkdtemp(prefix='datawiz-build-', dir=workdir)
+    try:
+        build = ImdbBuild(dump_dir, scratch, num_partitions, block_size)
+        basics = build.movies()
+        ratings = build.ratings()
+        akas = build.languages()
+        credits = build.credits()
+        names = build.names()
+        people = build.people(credits, names)
+        table = encode_table(finish_table(build.titles(basics, ratings, akas, people)))
+        if store is None:
+            write_catalog(table, output)
+        else:
+            summary = CatalogStore(store).write(table)
+            output = f"{store} version {summary['version']}"
+            print(f"{summary['added']:,} added, {summary['changed']:,} changed, {summary['removed']:,} removed; "
+                  f"{summary['written']} partitions written, {summary['reused']} unchanged")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    print(f"Wrote {table.num_rows:,} titles to {output} in {time.perf_counter() - start:.1f}s")
+    return table.num_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the movie catalog from IMDb TSV dumps.")
+    parser.add_argument('--dumps', default='.', help="directory holding the *.tsv.gz dumps")
+    parser.add_argument('--output', default=CATALOG_PATH)
+    parser.add_argument('--partitions', type=int, default=PARTITIONS)
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help="bytes per streamed block")
+    parser.add_argument('--workdir', default=None, help="where to put scratch partitions")
+    parser.add_argument('--store', nargs='?', const=STORE_DIR, default=None,
+                        help="update the versioned catalog store (default dir: %(const)s) instead of --output")
+    args = parser.parse_args()
+    build_from_imdb(args.dumps, args.output, args.partitions, args.block_size, args.workdir, args.store)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Interned list columns.
+
+Cast, directors, languages and genres repeat the same few strings across many
+titles. Held as Python lists, every row costs a list object plus a str object
+per name, and pickling or hashing the frame walks all of them. Here a whole
+column is three flat arrays: an Arrow string array holding each distinct value
+once, row offsets and int32 value ids, the same CSR layout the filter
+indexes use. Reading one title's list for display is a slice and a take.
+
+A catalog refresh patches the columns instead of interning them again: rows
+that did not change keep their ids, copied in one vectorized gather, and only
+the changed rows' strings are looked up. Values new to the column join the
+end of the vocabulary; values whose last row went away stay in it until the
+next full build.
+"""
+import bisect
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def csr_slices(starts, ends):
+    """
+    Positions start..end-1 of every (start, end) slice of a CSR array,
+    flattened, and the number of the slice each position belongs to.
+    """
+    lengths = np.maximum(ends - starts, 0)
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return positions, owner
+
+
+class InternedLists:
+    """A column of string lists as CSR offsets and int32 ids into one shared vocabulary."""
+
+    def __init__(self, vocabulary, offsets, ids):
+        self.vocabulary = vocabulary  # Arrow string array of the distinct values
+        self.offsets = offsets        # row -> slice of `ids` (int32 or int64)
+        self.ids = ids                # vocabulary positions, in each row's original order
+
+    @classmethod
+    def from_arrow(cls, column):
+        """Interns an Arrow list<string> or list<dictionary<int32, string>> column."""
+        chunks = column.chunks if isinstance(column, pa.ChunkedArray) else [column]
+        lengths, values = [], []
+        for chunk in chunks:
+            lengths.append(pc.fill_null(pc.list_value_length(chunk), 0).to_numpy(zero_copy_only=False))
+            items = pc.list_flatten(chunk)
+            values.append(items if pa.types.is_dictionary(items.type) else pc.dictionary_encode(items))
+        if not values:
+            return cls(pa.array([], type=pa.string()), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32))
+
+        # Chunks (e.g. store partitions) each carry their own dictionary; merge them into one
+        values = pa.chunked_array(values).unify_dictionaries()
+        ids = [chunk.indices.to_numpy(zero_copy_only=False) for chunk in values.chunks]
+        if len(chunks) == 1 and chunks[0].null_count == 0:
+            # A single chunk keeps its offsets and ids in the memory-mapped file
+            offsets = chunks[0].offsets.to_numpy(zero_copy_only=False)
+            offsets = offsets - offsets[0] if offsets[0] else offsets
+            return cls(values.chunks[0].dictionary, offsets, ids[0].astype(np.int32, copy=False))
+        offsets = np.zeros(sum(len(chunk) for chunk in lengths) + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(lengths), out=offsets[1:])
+        return cls(values.chunks[0].dictionary, offsets, np.concatenate(ids).astype(np.int32, copy=False))
+
+    def patch(self, source, rows, values):
+        """
+        Returns the column of an updated catalog. `source[new_row]` is the row of
+        this column a row that did not change came from, or -1; `values` holds
+        the lists of the other rows, whose ids in the updated catalog are `rows`.
+        """
+        changed = InternedLists.from_arrow(values)
+        # A slice of a dictionary column carries the whole dictionary; keep the values it uses
+        used, changed_ids = np.unique(changed.ids, return_inverse=True)
+        changed = InternedLists(changed.vocabulary.take(pa.array(used)), changed.offsets, changed_ids)
+        # Ids of the changed rows' values in this vocabulary; the ones it lacks are appended. Probing
+        # the whole vocabulary against the few changed values is much cheaper than hashing it
+        found = pc.index_in(self.vocabulary, value_set=changed.vocabulary)
+        valid = pc.is_valid(found)
+        position = np.full(len(changed.vocabulary), -1, dtype=np.int64)
+        position[found.filter(valid).to_numpy()] = np.flatnonzero(valid.to_numpy(zero_copy_only=False))
+        missing = np.flatnonzero(position < 0)
+        position[missing] = len(self.vocabulary) + np.arange(len(missing))
+        vocabulary = pa.concat_arrays([self.vocabulary, changed.vocabulary.take(pa.array(missing))])
+
+        # Every new row is a slice of the old ids or of the changed ones, appended after them
+        pool = np.concatenate([self.ids, position[changed.ids]]).astype(np.int32)
+        starts, ends = self.offsets[source], self.offsets[source + 1]
+        starts[rows] = len(self.ids) + changed.offsets[:-1]
+        ends[rows] = len(self.ids) + changed.offsets[1:]
+        offsets = np.zeros(len(source) + 1, dtype=np.int64)
+        np.cumsum(ends - starts, out=offsets[1:])
+        # Runs of rows whose slices follow each other in the pool are copied as one slice
+        breaks = np.flatnonzero(starts[1:] != ends[:-1]) + 1
+        positions, _ = csr_slices(starts[np.r_[0, breaks]], ends[np.r_[breaks - 1, len(source) - 1]]) \
+            if len(source) else (np.empty(0, dtype=np.int64), None)
+        return InternedLists(vocabulary, offsets, pool[positions])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        """The values of one row as a list of strings."""
+        return self.vocabulary.take(self.ids[self.offsets[row]:self.offsets[row + 1]]).to_pylist()
+
+    def to_arrow(self):
+        """The column as an Arrow list<dictionary<int32, string>> array, without copying."""
+        list_type = pa.ListArray if self.offsets.dtype == np.int32 else pa.LargeListArray
+        return list_type.from_arrays(pa.array(self.offsets), pa.DictionaryArray.from_arrays(pa.array(self.ids),
+                                                                                         self.vocabulary))
+
+    @property
+    def nbytes(self):
+        return self.vocabulary.nbytes + self.offsets.nbytes + self.ids.nbytes
+
+
+class StringVocabulary:
+    """
+    A sorted list of strings held in an Arrow array, for vocabularies shared
+    between processes (see serving.py). It reads like the Python list it
+    replaces, so millions of names stay in one memory-mapped buffer instead of
+    becoming str objects in every worker; values are found by binary search.
+    """
+
+    def __init__(self, array):
+        self.array = array
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return self.array[position].to_pylist()
+        return self.array[position].as_py()
+
+    def __iter__(self):
+        for start in range(0, len(self.array), 4096):
+            yield from self.array[start:start + 4096].to_pylist()
+
+    def __contains__(self, value):
+        return self.position(value) is not None
+
+    def position(self, value):
+        """Position of `value`, or None if it is not in the vocabulary."""
+        position = bisect.bisect_left(self, value)
+        return position if position < len(self.array) and self[position] == value else None
+
+    def ids(self):
+        """A read-only value -> position mapping, in place of a dict over the vocabulary."""
+        return VocabularyIds(self)
+
+
+class VocabularyIds:
+    """The value -> position lookups of a StringVocabulary."""
+
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+
+    def get(self, value, default=None):
+        position = self.vocabulary.position(value)
+        return default if position is None else position
+
+    def __contains__(self, value):
+        return value in self.vocabulary
+
+    def __getitem__(self, value):
+        position = self.vocabulary.position(value)
+        if position is None:
+            raise KeyError(value)
+        return position
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+
+class SortedIds:
+    """The value -> position lookups of a sorted numpy object array, by binary search like VocabularyIds."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, value, default=None):
+        position = int(np.searchsorted(self.values, value))
+        return position if position < len(self.values) and self.values[position] == value else default
+
+    def __contains__(self, value):
+        return self.get(value) is not None
+
+    def __getitem__(self, value):
+        position = self.get(value)
+        if position is None:
+            raise KeyError(value)
+        return position
+
+    def __len__(self):
+        return len(self.values)
@@ -1,10 +1,8 @@
 import streamlit as st
-import requests
-import pandas as pd
-import ast
-from PIL import Image
-from io import BytesIO
-from streamlit_autorefresh import st_autorefresh
+import streamlit.components.v1 as components
+from metrics import METRICS_PORT, Metrics, budget_table, start_exporter
+from trending import CAROUSEL_HEIGHT
+from warm_start import load_api_client, load_poster_store, load_trending_feed
 
 # Define the desired red color
 red_color = "#e50914"  # Netflix red color for consistency
@@ -53,30 +51,34 @@ TMDB_API_KEY = st.secrets["tmdb_api"]["api_key"]
 # OMDb API key
 OMDB_API_KEY = st.secrets["omdb_api"]["api_key"]
 
-# Function to fetch trending movies
-@st.cache_data(show_spinner=False)
-def fetch_trending_movies(api_key):
-    url = f"https://api.themoviedb.org/3/trending/movie/week?api_key={api_key}"
-    response = requests.get(url).json()
-    trending_movies = []
-    if "results" in response:
-        for movie in response["results"][:5]:  # Limit to top 5 movies
-            trending_movies.append({
-                "title": movie["title"],
-                "poster_path": f"https://image.tmdb.org/t/p/w500{movie['poster_path']}",
-                "overview": movie["overview"],
-                "rating": round(movie["vote_average"], 1),
-                "release_date": movie.get("release_date", "N/A")[:4]
-            })
-    return trending_movies
-
-# Fetch trending movies
-trending_movies = fetch_trending_movies(TMDB_API_KEY)
+# Number of upcoming titles shown as a grid under the current recommendation
+GRID_SIZE = 6
+GRID_COLUMNS = 3
 
-# Initialize session state
-if "carousel_index" not in st.session_state:
-    st.session_state.carousel_index = 0
+# Number of upcoming posters fetched in the background while one is shown:
+# the grid plus the title that moves into it after 'Next'
+PREFETCH_COUNT = GRID_SIZE + 1
+
+# The HTTP client, shared by all sessions (see warm_start.py)
+api_client = load_api_client()
+
+# Stage timings of every rerun, recorded only when APP_METRICS is set (see metrics.py)
+@st.cache_resource(show_spinner=False)
+def load_metrics(_api_client):
+    metrics = Metrics()
+    if metrics.enabled and METRICS_PORT:
+        start_exporter(metrics, METRICS_PORT, client=_api_client)
+    return metrics
 
+metrics = load_metrics(api_client)
+trace = metrics.trace()
+
+# The trending carousel, rendered once per process and refreshed in the background; the
+# browser rotates it, so an open landing page does not rerun the script
+with trace.stage('trending'):
+    trending = load_trending_feed(TMDB_API_KEY).current()
+
+# Initialize session state
 if "show_recommendations" not in st.session_state:
     st.session_state.show_recommendations = False
 
@@ -93,31 +95,9 @@ if not st.session_state.show_recommendations:
         </p>
     """, unsafe_allow_html=True)
 
-    if trending_movies:
-        # Use st_autorefresh to automatically refresh the page every 5 seconds
-        count = st_autorefresh(interval=5000, limit=None, key="carousel_counter")
-
-        # Update the carousel index
-        st.session_state.carousel_index = count % len(trending_movies)
-        current_movie = trending_movies[st.session_state.carousel_index]
-
-        # Display Movie Card with shadow
-        st.markdown(f"""
-            <div style="display: flex; justify-content: center; align-items: center;">
-                <div class="movie-card" style="background: #1C1C1C; color: white; padding: 20px; border-radius: 15px; width: 300px; text-align: center;">
-                    <img src="{current_movie['poster_path']}" alt="{current_movie['title']}" style="width: 100%; border-radius: 10px; margin-bottom: 15px;">
-                    <div style="font-size: 1.2rem; font-weight: bold; margin-bottom: 10px;">
-                        {current_movie['title']} ({current_movie['release_date']})
-                    </div>
-                    <div style="color: #f39c12; font-size: 1rem; margin-bottom: 15px;">
-                        ⭐ {current_movie['rating']}
-                    </div>
-                    <p style="font-size: 0.9rem; color: #bbb;">
-                        {current_movie['overview'][:300]}...
-                    </p>
-                </div>
-            </div>
-        """, unsafe_allow_html=True)
+    if trending.html:
+        # All the trending cards in one frame that rotates itself every few seconds
+        components.html(trending.html, height=CAROUSEL_HEIGHT)
 
         # Proceed to Recommendations button underneath the movie card
         if st.button("Proceed to Recommendations", key='proceed_button'):
@@ -126,96 +106,183 @@ if not st.session_state.show_recommendations:
         st.write("No trending movies available at the moment.")
 
 else:
-    # Recommendation page
-    st.sidebar.header('Select Your Preferences')
+    # Recommendation page. Its modules pull in pandas, pyarrow and PIL, so they are imported
+    # here rather than at the top, where the landing page would wait for them
+    from feedback import FeedbackQueue, Preferences
+    from poster_urls import POSTER_URLS_PATH, load_poster_urls
+    from posters import PosterFetcher, PosterPrefetcher, fetch_poster
+    from thumbnails import ThumbnailPool
+    from warm_start import load_engine
 
-    # Load the data (cached)
-    @st.cache_data(show_spinner=False)
-    def load_data():
-        df = pd.read_csv('merged_df.zip', compression="zip")
-        # Convert lists
-        list_columns = ['available_languages', 'genres', 'cast', 'directors']
-        for col in list_columns:
-            df[col] = df[col].apply(ast.literal_eval)
-        return df
+    st.sidebar.header('Select Your Preferences')
 
+    # The filter and recommendation logic lives in the engine, shared with the HTTP API (api.py),
+    # and is loaded once per process (see warm_start.py)
     try:
-        df = load_data()
+        with trace.stage('engine'):
+            engine = load_engine()
     except FileNotFoundError:
         st.error("The data file 'merged_df.zip' was not found. Please ensure it is in the correct directory.")
         st.stop()
 
-    @st.cache_data(show_spinner=False)
-    def get_movie_poster(imdb_id, api_key):
-        url = f'http://www.omdbapi.com/?i={imdb_id}&apikey={api_key}'
-        response = requests.get(url)
-        data = response.json()
-        if 'Poster' in data and data['Poster'] != 'N/A':
-            poster_url = data['Poster']
-            poster_response = requests.get(poster_url)
-            return Image.open(BytesIO(poster_response.content))
+    # One snapshot per rerun: the catalog, its interned list columns, the inverted indexes
+    # for the list filters and the sorted indexes for the sliders always belong to the same version
+    snapshot = engine.catalog.current()
+    df = snapshot.df
+    lists = snapshot.lists
+    filter_index = snapshot.filter_index
+    if st.session_state.get('catalog_version') != snapshot.version:
+        # Feature ids differ between versions, so a learned taste does not carry over
+        st.session_state.preferences = Preferences()
+        # Keep the sidebar selection, minus values and ranges the new version no longer has
+        for key, name in (('languages_filter', 'available_languages'), ('genres_filter', 'genres')):
+            if key in st.session_state:
+                st.session_state[key] = [value for value in st.session_state[key] if value in filter_index[name].ids]
+        for key, name in (('runtime_filter', 'runtimeMinutes'), ('year_filter', 'startYear'),
+                          ('rating_filter', 'weighted_rating')):
+            if key in st.session_state:
+                low, high = snapshot.facets.bounds[name]
+                st.session_state[key] = tuple(type(value)(min(max(value, low), high))
+                                              for value in st.session_state[key])
+    st.session_state.catalog_version = snapshot.version
+
+    # Similarity, name and title search indexes of this version, built once per process
+    indexes = engine.indexes(snapshot)
+    name_search = indexes.name_search
+    embedder = indexes.embedder
+
+    # Posters are fetched on a shared thread pool; each session prefetches the
+    # next few posters of its result while the current one is on screen
+    @st.cache_resource(show_spinner=False)
+    def load_poster_fetcher():
+        # Poster URLs precomputed offline; OMDb is only asked about titles missing there
+        poster_urls = load_poster_urls(POSTER_URLS_PATH)
+        # Posters are shrunk to thumbnails in worker processes before they are cached
+        thumbnail_pool = ThumbnailPool()
+        return PosterFetcher(
+            lambda imdb_id, is_cancelled: fetch_poster(
+                imdb_id, OMDB_API_KEY, api_client, is_cancelled=is_cancelled, poster_urls=poster_urls),
+            store=load_poster_store(),
+            transform=thumbnail_pool.thumbnail,
+        )
+
+    poster_fetcher = load_poster_fetcher()
+    if 'poster_prefetcher' not in st.session_state:
+        st.session_state.poster_prefetcher = PosterPrefetcher(poster_fetcher)
+
+    # Sidebar options and slider bounds come from the facet summary built with the snapshot,
+    # so drawing the sidebar never touches the catalog rows
+    facets = snapshot.facets
+    runtime_bounds = tuple(int(x) for x in facets.bounds['runtimeMinutes'])
+    year_bounds = tuple(int(x) for x in facets.bounds['startYear'])
+    rating_bounds = tuple(float(x) for x in facets.bounds['weighted_rating'])
+
+    # The selection is read from the widget state before the widgets are drawn, so the
+    # options can show how many of the matching movies each of them would keep.
+    # A movie must contain every selected language, genre, cast member and director.
+    with trace.stage('query'):
+        query = engine.query({
+            'languages': st.session_state.get('languages_filter', []),
+            'genres': st.session_state.get('genres_filter', []),
+            'cast': st.session_state.get('cast_filter', ''),
+            'directors': st.session_state.get('directors_filter', ''),
+            'include_adult': st.session_state.get('adult_filter', False),
+            'year': st.session_state.get('year_filter', year_bounds),
+            'runtime': st.session_state.get('runtime_filter', runtime_bounds),
+            'rating': st.session_state.get('rating_filter', rating_bounds),
+        }, snapshot)
+    # Row ids of the matching movies, best-rated first; the catalog itself is never copied.
+    # Paging with 'Next' reuses the cached ids instead of filtering again.
+    query_key = query.key
+    filtered_rows = query.rows
+    people = query.people
+    list_filters = query.list_filters
+
+    # Sidebar filters, labelled with the live counts of the current result
+    def facet_multiselect(label, name, key):
+        with trace.stage('facets'):
+            counts = dict(zip(facets.options(name), engine.counts(query, name).tolist()))
+        return st.sidebar.multiselect(label, facets.options(name), key=key,
+                                      format_func=lambda value: f"{value} ({counts[value]:,})")
+
+    facet_multiselect('Available Languages:', 'available_languages', 'languages_filter')
+    st.sidebar.slider('Runtime (Minutes):', *runtime_bounds, runtime_bounds, key='runtime_filter')
+    st.sidebar.slider('Release Year Range:', *year_bounds, year_bounds, key='year_filter')
+    st.sidebar.slider('Rating:', *rating_bounds, rating_bounds, key='rating_filter')
+    facet_multiselect('Genres:', 'genres', 'genres_filter')
+    # Free-text people filters; the sidebar shows who each entry was taken to be
+    def people_input(label, key, name):
+        st.sidebar.text_input(label, key=key)
+        search, resolved = name_search[name], people[name]
+        matched = list_filters[name]
+        if matched:
+            st.sidebar.caption(f"Matched: {', '.join(matched)}")
+        entries = list(resolved)
+        if entries and resolved[entries[-1]] is not None:
+            # Other people the entry being typed could mean
+            others = [value for value in search.names(search.suggest(entries[-1], limit=4)) if value not in matched]
+            if others:
+                st.sidebar.caption(f"Or: {' · '.join(others[:3])}")
+        for entry in entries:
+            if resolved[entry] is None:
+                st.sidebar.warning(f"No one matches '{entry}'; it is ignored.")
+
+    people_input('Cast (comma-separated):', 'cast_filter', 'cast')
+    people_input('Directors (comma-separated):', 'directors_filter', 'directors')
+    st.sidebar.checkbox('Include Adult Movies', key='adult_filter')
+    st.sidebar.caption(f"{len(filtered_rows):,} matching movies")
+
+    # The session walks through the shared result in its own order: 'Like' and 'Next'
+    # re-rank the next few titles by what it liked and skipped so far
+    preferences = st.session_state.preferences
+    queue = st.session_state.get('feedback_queue')
+    if queue is None or queue.key != query_key:
+        queue = st.session_state.feedback_queue = FeedbackQueue(query_key, filtered_rows, embedder, preferences)
+
+    def show_movie_grid(rows):
+        """Shows movies as a grid; their posters are resolved as one concurrent batch
+        and each cell is filled in order as soon as it is ready."""
+        with trace.stage('grid'):
+            grid_movies = df.iloc[rows]
+            cells = [column.empty() for _ in range(0, len(rows), GRID_COLUMNS)
+                     for column in st.columns(GRID_COLUMNS)]
+            grid_posters = poster_fetcher.resolve(grid_movies['tconst'].tolist())
+            for cell, (_, grid_movie), (_, grid_poster) in zip(cells, grid_movies.iterrows(), grid_posters):
+                with cell.container():
+                    if grid_poster:
+                        st.image(grid_poster, use_container_width=True)
+                    st.caption(f"**{grid_movie['title']}** ({grid_movie['startYear']}) · "
+                               f"⭐ {round(grid_movie['weighted_rating'], 1)}")
+
+    # Title search, ranked by BM25 among the movies that match the filters
+    search_text = st.text_input('Search titles', key='title_search')
+    if search_text.strip():
+        with trace.stage('search'):
+            search_rows = engine.search(query, search_text, k=GRID_SIZE)
+        if len(search_rows):
+            st.markdown("<div class='recommended-movie'>Search Results:</div>", unsafe_allow_html=True)
+            show_movie_grid(search_rows)
         else:
-            return None
-
-    # Sidebar filters
-    available_languages = sorted(df['available_languages'].explode().unique().tolist())
-    selected_languages = st.sidebar.multiselect('Available Languages:', available_languages)
-
-    min_runtime = int(df['runtimeMinutes'].min())
-    max_runtime = int(df['runtimeMinutes'].max())
-    selected_runtime_range = st.sidebar.slider('Runtime (Minutes):', min_runtime, max_runtime, (min_runtime, max_runtime))
-
-    min_year = int(df['startYear'].min())
-    max_year = int(df['startYear'].max())
-    selected_year_range = st.sidebar.slider('Release Year Range:', min_year, max_year, (min_year, max_year))
+            st.write('No titles match the search.')
 
-    min_rating = float(df['weighted_rating'].min())
-    max_rating = float(df['weighted_rating'].max())
-    selected_rating_range = st.sidebar.slider('Rating:', min_rating, max_rating, (min_rating, max_rating))
-
-    available_genres = sorted(df['genres'].explode().unique().tolist())
-    selected_genres = st.sidebar.multiselect('Genres:', available_genres)
-
-    selected_cast_input = st.sidebar.text_input('Cast (comma-separated):')
-    selected_cast = [x.strip() for x in selected_cast_input.split(',')] if selected_cast_input else []
-
-    selected_directors_input = st.sidebar.text_input('Directors (comma-separated):')
-    selected_directors = [x.strip() for x in selected_directors_input.split(',')] if selected_directors_input else []
-
-    selected_isAdult = st.sidebar.checkbox('Include Adult Movies')
-
-    # Filter data
-    filtered_df = df.copy()
-    if selected_languages:
-        filtered_df = filtered_df[filtered_df['available_languages'].apply(lambda x: all(lang in x for lang in selected_languages))]
-    if not selected_isAdult:
-        filtered_df = filtered_df[filtered_df['isAdult'] == 0]
-    filtered_df = filtered_df[(filtered_df['startYear'] >= selected_year_range[0]) & (filtered_df['startYear'] <= selected_year_range[1])]
-    filtered_df = filtered_df[(filtered_df['runtimeMinutes'] >= selected_runtime_range[0]) & (filtered_df['runtimeMinutes'] <= selected_runtime_range[1])]
-    filtered_df = filtered_df[(filtered_df['weighted_rating'] >= selected_rating_range[0]) & (filtered_df['weighted_rating'] <= selected_rating_range[1])]
-    if selected_genres:
-        filtered_df = filtered_df[filtered_df['genres'].apply(lambda x: all(genre in x for genre in selected_genres))]
-    if selected_cast:
-        filtered_df = filtered_df[filtered_df['cast'].apply(lambda x: all(cast_member in x for cast_member in selected_cast))]
-    if selected_directors:
-        filtered_df = filtered_df[filtered_df['directors'].apply(lambda x: all(director in x for director in selected_directors))]
-
-    filtered_df = filtered_df.sort_values(by='weighted_rating', ascending=False).reset_index(drop=True)
-
-    if 'recommendation_index' not in st.session_state:
-        st.session_state.recommendation_index = 0
-
-    if len(filtered_df) == 0:
+    if len(filtered_rows) == 0:
+        metrics.count('empty_results')
         st.write('No movies found with the selected filters.')
     else:
-        current_index = st.session_state.recommendation_index
-        if current_index < len(filtered_df):
-            movie = filtered_df.iloc[current_index]
+        current_row = queue.current()
+        if current_row is not None:
+            movie = df.iloc[current_row]
             # Style 'Recommended Movie' text
             st.markdown("<div class='recommended-movie'>Recommended Movie:</div>", unsafe_allow_html=True)
 
+            # Start on this poster and the next ones together, then wait for this one only
+            upcoming = queue.upcoming(PREFETCH_COUNT + 1)
+            st.session_state.poster_prefetcher.follow(query_key, df['tconst'].iloc[upcoming].tolist())
             imdb_id = movie['tconst']
-            poster = get_movie_poster(imdb_id, OMDB_API_KEY)
+            with trace.stage('poster'):
+                poster = poster_fetcher.get(imdb_id)
+            if not poster:
+                metrics.count('missing_posters')
 
             # Adjust columns to [1, 2] for a 1:2 ratio
             col1, col2 = st.columns([1, 2])
@@ -229,23 +296,45 @@ else:
                 # Add spacing before the 'Next' button
                 st.markdown("<br>", unsafe_allow_html=True)
 
-                # 'Next' button underneath the poster
-                if st.button('Next', key='next_button'):
-                    st.session_state.recommendation_index += 1
+                # 'Like' and 'Next' buttons underneath the poster; both move on to the next title
+                feedback_args = (filtered_rows, embedder, preferences)
+                st.button('Like', key='like_button', on_click=queue.advance, args=(*feedback_args, 'like'))
+                st.button('Next', key='next_button', on_click=queue.advance, args=(*feedback_args, 'skip'))
 
             with col2:
                 # Display movie details as per your request
                 st.write(f"**Title:** {movie['title']}")
                 st.write(f"**Rating:** {round(movie['weighted_rating'], 1)}")
                 st.write(f"**Year:** {movie['startYear']}")
-                st.write(f"**Genres:** {', '.join(movie['genres'])}")
+                st.write(f"**Genres:** {', '.join(lists['genres'][current_row])}")
                 st.write(f"**Runtime:** {movie['runtimeMinutes']} minutes")
-                st.write(f"**Cast:** {', '.join(sorted(movie['cast']))}")
-                st.write(f"**Directors:** {', '.join(sorted(movie['directors']))}")
-                st.write(f"**Languages:** {', '.join(sorted(movie['available_languages']))}")
+                st.write(f"**Cast:** {', '.join(sorted(lists['cast'][current_row]))}")
+                st.write(f"**Directors:** {', '.join(sorted(lists['directors'][current_row]))}")
+                st.write(f"**Languages:** {', '.join(sorted(lists['available_languages'][current_row]))}")
                 st.write(f"**Adult Content:** {'Yes' if movie['isAdult'] == 1 else 'No'}")
 
+            # The next recommendations as a grid
+            grid_rows = queue.upcoming(GRID_SIZE + 1)[1:]
+            if len(grid_rows):
+                st.markdown("<div class='recommended-movie'>Up Next:</div>", unsafe_allow_html=True)
+                show_movie_grid(grid_rows)
+
+            # Titles closest to this one in genres, people, languages, year and runtime,
+            # among the movies that match the filters
+            with trace.stage('similar'):
+                similar_rows = engine.similar(query, current_row, k=GRID_SIZE)
+            if len(similar_rows):
+                st.markdown("<div class='recommended-movie'>More Like This:</div>", unsafe_allow_html=True)
+                show_movie_grid(similar_rows)
+
         else:
             st.write('No more recommendations.')
-            if st.button('Restart Recommendations', key='restart_button'):
-                st.session_state.recommendation_index = 0
+            # Start the result over; what the session liked so far is kept
+            st.button('Restart Recommendations', key='restart_button',
+                      on_click=st.session_state.pop, args=('feedback_queue', None))
+
+# Timings of this rerun's stages against their budgets, when recording is on
+trace.finish()
+if metrics.enabled:
+    with st.sidebar.expander('Timings'):
+        st.dataframe(budget_table(metrics, trace), hide_index=True)
@@ -0,0 +1,264 @@
+"""
+Per-stage timings of the app's reruns and the API's requests.
+
+The hot path is split into named stages: loading the engine, the filter
+query, the sidebar counts, title search, "more like this", waiting for
+posters and drawing the page. Each stage runs inside a timer, and the timer
+adds its duration to a fixed-bucket histogram. The OMDb and poster-download
+calls already have per-endpoint histograms in api_client.py. The exporter
+serves those too, so the slow part of a page can be found in one place.
+
+Recording is off unless APP_METRICS is set. While it is off, a timer is a
+shared no-op context manager and nothing is stored. While it is on:
+
+- APP_METRICS_PORT serves the histograms on a local port, as Prometheus text
+  at /metrics and as JSON at /metrics.json.
+- APP_METRICS_LOG appends one JSON line per rerun to a file.
+- The app shows a "Timings" panel in the sidebar with the stages of the last
+  rerun and the p50/p99 of each stage.
+
+Every stage has a latency budget (STAGE_BUDGETS, in milliseconds,
+overridable with APP_METRICS_BUDGETS="query=20,poster=300"). Each run over
+budget is counted in app_stage_over_budget_total, so an alert can enforce
+the budget. It is also flagged in the panel and in the log line.
+"""
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from api_client import LatencyHistogram
+
+METRICS_ENABLED = os.environ.get('APP_METRICS', '') not in ('', '0')
+METRICS_PORT = int(os.environ.get('APP_METRICS_PORT') or 0)
+METRICS_LOG = os.environ.get('APP_METRICS_LOG')
+
+# Upper bounds of the stage histogram buckets, in seconds; finer than the HTTP ones, as most
+# stages take well under a millisecond to a few milliseconds
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+# Latency budget of each stage, in milliseconds
+STAGE_BUDGETS = {
+    'engine': 50,      # cached after the first rerun of a process
+    'trending': 50,
+    'query': 50,       # filter chain and best-rated ordering
+    'facets': 20,      # live option counts in the sidebar
+    'search': 50,
+    'poster': 500,     # waiting for the current poster (OMDb lookup, download, thumbnail)
+    'grid': 500,       # a grid of posters and captions
+    'similar': 50,
+    'rerun': 1000,     # a whole rerun of the script
+}
+
+
+def parse_budgets(text):
+    """Reads 'stage=ms,stage=ms' into a dict of milliseconds."""
+    budgets = {}
+    for item in (text or '').split(','):
+        if item.strip():
+            stage, _, milliseconds = item.partition('=')
+            budgets[stage.strip()] = float(milliseconds)
+    return budgets
+
+
+_NO_TIMER = contextlib.nullcontext()
+
+
+class _Timer:
+
+    def __init__(self, metrics, stage, trace):
+        self.metrics = metrics
+        self.stage = stage
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, self.trace)
+
+
+class RerunTrace:
+    """The stages of one rerun or request, in the order they finished."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.stages = []        # (stage, seconds, over budget)
+
+    def stage(self, name):
+        """Times a `with` block as stage `name`."""
+        return _Timer(self.metrics, name, self)
+
+    def finish(self):
+        """Records the whole rerun as the 'rerun' stage and writes the log line."""
+        self.metrics.observe('rerun', time.perf_counter() - self.started, self)
+        self.metrics.log(self)
+
+
+class _NoTrace:
+    stages = ()
+
+    def stage(self, name):
+        return _NO_TIMER
+
+    def finish(self):
+        pass
+
+
+NO_TRACE = _NoTrace()
+
+
+class Metrics:
+    """Stage histograms, budget overruns and counters of one process; safe to share between threads."""
+
+    def __init__(self, enabled=METRICS_ENABLED, budgets=None, log_path=METRICS_LOG):
+        self.enabled = enabled
+        self.budgets = dict(STAGE_BUDGETS, **parse_budgets(os.environ.get('APP_METRICS_BUDGETS')))
+        self.budgets.update(budgets or {})
+        self.log_path = log_path
+        self.histograms = {}
+        self.over_budget = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def trace(self):
+        """A RerunTrace to time the stages of one rerun, or a no-op one while recording is off."""
+        return RerunTrace(self) if self.enabled else NO_TRACE
+
+    def timer(self, stage):
+        """Times a `with` block as `stage`, outside of any trace."""
+        return _Timer(self, stage, None) if self.enabled else _NO_TIMER
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, stage, seconds, trace=None):
+        budget = self.budgets.get(stage)
+        over = budget is not None and seconds * 1000 > budget
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram(STAGE_BUCKETS)
+            if over:
+                self.over_budget[stage] = self.over_budget.get(stage, 0) + 1
+        histogram.observe(seconds)
+        if trace is not None:
+            trace.stages.append((stage, seconds, over))
+
+    def log(self, trace):
+        if not self.log_path:
+            return
+        # A stage that ran several times in the rerun (a grid per section) is logged as its total
+        stages = {}
+        for stage, seconds, _ in trace.stages:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+        line = json.dumps({
+            'time': time.time(),
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+            'over_budget': sorted({stage for stage, _, over in trace.stages if over}),
+        })
+        with self._lock, open(self.log_path, 'a') as f:
+            f.write(line + '\n')
+
+    def snapshot(self):
+        """Histograms, budgets, overruns and counters as a JSON-ready dict."""
+        with self._lock:
+            histograms = dict(self.histograms)
+            over_budget = dict(self.over_budget)
+            counters = dict(self.counters)
+        return {
+            'stages': {stage: histogram.snapshot() for stage, histogram in histograms.items()},
+            'budgets_ms': self.budgets,
+            'over_budget': over_budget,
+            'counters': counters,
+        }
+
+    def prometheus(self, http_latency=None):
+        """
+        The metrics in the Prometheus text format. `http_latency` adds the
+        per-endpoint histograms of an ApiClient (its stats()['latency']).
+        """
+        snapshot = self.snapshot()
+        lines = []
+        _histogram_lines(lines, 'app_stage_seconds', 'stage', snapshot['stages'])
+        if http_latency:
+            _histogram_lines(lines, 'app_http_seconds', 'endpoint', http_latency)
+        lines.append('# TYPE app_stage_budget_seconds gauge')
+        for stage, budget in sorted(snapshot['budgets_ms'].items()):
+            lines.append(f'app_stage_budget_seconds{{stage="{stage}"}} {budget / 1000}')
+        lines.append('# TYPE app_stage_over_budget_total counter')
+        for stage, count in sorted(snapshot['over_budget'].items()):
+            lines.append(f'app_stage_over_budget_total{{stage="{stage}"}} {count}')
+        lines.append('# TYPE app_events_total counter')
+        for name, count in sorted(snapshot['counters'].items()):
+            lines.append(f'app_events_total{{name="{name}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(lines, metric, label, snapshots):
+    lines.append(f'# TYPE {metric} histogram')
+    for name, snapshot in sorted(snapshots.items()):
+        # Prometheus buckets are cumulative; the snapshots count per bucket
+        total = 0
+        for bound, count in snapshot['buckets'].items():
+            total += count
+            le = '+Inf' if bound == 'inf' else bound
+            lines.append(f'{metric}_bucket{{{label}="{name}",le="{le}"}} {total}')
+        lines.append(f'{metric}_sum{{{label}="{name}"}} {snapshot["sum"]}')
+        lines.append(f'{metric}_count{{{label}="{name}"}} {snapshot["count"]}')
+
+
+class _ExporterHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        metrics, client = self.server.metrics, self.server.client
+        http_latency = client.stats()['latency'] if client is not None else None
+        if self.path == '/metrics':
+            body, content_type = metrics.prometheus(http_latency).encode(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body, content_type = json.dumps(dict(metrics.snapshot(), http=http_latency or {})).encode(), \
+                'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_exporter(metrics, port=METRICS_PORT, client=None, host='127.0.0.1'):
+    """Serves /metrics and /metrics.json on a daemon thread; `client` adds an ApiClient's histograms."""
+    server = ThreadingHTTPServer((host, port), _ExporterHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    server.client = client
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def budget_table(metrics, trace):
+    """Rows for the sidebar panel: each stage of `trace` with its budget and p50/p99 so far."""
+    rows = []
+    for stage, seconds, over in trace.stages:
+        histogram = metrics.histograms.get(stage)
+        rows.append({
+            'stage': stage,
+            'ms': round(seconds * 1000, 1),
+            'budget ms': metrics.budgets.get(stage),
+            'p50 ms': histogram.quantile(0.5) * 1000 if histogram else None,
+            'p99 ms': histogram.quantile(0.99) * 1000 if histogram else None,
+            'over': '⚠️' if over else '',
+        })
+    return rows
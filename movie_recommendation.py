@@ -1,8 +1,14 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import requests
-from PIL import Image
-from io import BytesIO
+from api_client import ApiClient
+from facets import FacetSummary
+from feedback import WINDOW, Preferences, TitleEmbedder
+from filter_index import FilterIndex
+from posters import fetch_poster
+from sampling import RowSampler, SeenRows
+from similarity import FEATURE_WEIGHTS, SimilarityIndex
 
 # Assume you have loaded your data into df
 df = pd.read_csv('/Users/ziyuefu/Desktop/CU_Fall24/Data viz/merged_df.csv')
@@ -17,35 +23,68 @@ def safe_eval(value):
     except Exception as e:
         return ''  # Return an empty string if an error occurs
 
+def safe_eval_list(value):
+    """Like safe_eval, but keeps the items as a list."""
+    try:
+        if isinstance(value, str) and value:
+            return list(eval(value))
+        return []
+    except Exception as e:
+        return []
+
 # Handle NaN and null values by filling them with appropriate default values
 df['genres'] = df['genres'].fillna('').apply(safe_eval)
-df['directors'] = df['directors'].fillna('').apply(safe_eval)
+# Director names contain spaces, so they stay whole: a list for filtering, comma-joined for display
+director_lists = df['directors'].fillna('').apply(safe_eval_list)
+df['directors'] = director_lists.apply(', '.join)
 
 # Fill missing values in the rating column (if necessary)
 df['weighted_rating'] = df['weighted_rating'].fillna(df['weighted_rating'].mean())
 
+# Indexes for the genre and director filters. Genres are a space-joined string, so that
+# index is keyed on its tokens; directors are keyed on their full names.
+@st.cache_resource(show_spinner=False)
+def build_filter_index(_df, _director_lists):
+    tokens = pd.DataFrame({'genres': _df['genres'].str.split(' '), 'directors': _director_lists})
+    return FilterIndex.build(tokens, ['genres', 'directors'])
+
+filter_index = build_filter_index(df, director_lists)
+
+# Sidebar options and the rating bounds, computed once instead of on every rerun
+@st.cache_resource(show_spinner=False)
+def build_facets(_df, _filter_index):
+    bounds = {'weighted_rating': (_df['weighted_rating'].min(), _df['weighted_rating'].max())}
+    return FacetSummary.build(_filter_index, bounds)
+
+facets = build_facets(df, filter_index)
+
+# Title embeddings over the same tokens plus year and runtime buckets, for learning
+# from "Don't like this one" clicks
+@st.cache_resource(show_spinner=False)
+def build_embedder(_df, _filter_index):
+    numbers = pd.DataFrame({col: pd.to_numeric(_df[col], errors='coerce') for col in ['startYear', 'runtimeMinutes']})
+    weights = {col: FEATURE_WEIGHTS[col] for col in ['genres', 'directors', 'startYear', 'runtimeMinutes']}
+    return TitleEmbedder(SimilarityIndex.build(numbers, _filter_index, weights))
+
+embedder = build_embedder(df, filter_index)
+
 # OMDb API to get movie poster
 API_KEY = "86760ae5"
 
+# Pooled, rate-limited HTTP client shared by all sessions
+@st.cache_resource(show_spinner=False)
+def load_api_client():
+    return ApiClient()
+
+api_client = load_api_client()
+
 def get_movie_poster(tconst, api_key):
     """
     Fetches the movie poster image for a given IMDb tconst using the OMDb API.
     """
-    # OMDb API endpoint
-    url = f'http://www.omdbapi.com/?i={tconst}&apikey={api_key}'
-
-    # Send a GET request to the OMDb API
-    response = requests.get(url)
-    data = response.json()
-
-    # Check if the response contains a poster URL
-    if 'Poster' in data and data['Poster'] != 'N/A':
-        poster_url = data['Poster']
-        # Fetch the poster image
-        poster_response = requests.get(poster_url)
-        poster_image = Image.open(BytesIO(poster_response.content))
-        return poster_image
-    else:
+    try:
+        return fetch_poster(tconst, api_key, api_client)
+    except requests.RequestException:
         return None
 
 # Streamlit application configuration
@@ -81,49 +120,77 @@ st.title("Welcome to Movie Matchmaker!")
 st.sidebar.header("Filter Movies")
 
 # Genres filter
-genres = df['genres'].str.split(' ').explode().unique()
-selected_genres = st.sidebar.multiselect("Select Genres", genres)
+selected_genres = st.sidebar.multiselect("Select Genres", facets.options('genres'))
 
 # Rating filter
-min_rating = df['weighted_rating'].min()
-max_rating = df['weighted_rating'].max()
+min_rating, max_rating = facets.bounds['weighted_rating']
 selected_rating = st.sidebar.slider("Select Rating", min_rating, max_rating, (min_rating, max_rating))
 
 # Director filter
-directors = df['directors'].str.split(' ').explode().unique()
-selected_directors = st.sidebar.multiselect("Select Director", directors)
+selected_directors = st.sidebar.multiselect("Select Director", facets.options('directors'))
 
 # isAdult filter
 # Map 1 to 'Adult', and 0 to 'Not Adult'
 adult_status = {1: 'Adult', 0: 'Not Adult'}
 selected_adult = st.sidebar.selectbox("Select Adult Status", ['Any', 'Adult', 'Not Adult'])
 
-# Apply filters to the dataframe
-filtered_df = df.copy()
+# "Don't like this one" draws come from the matching rows, favoring better-rated movies if asked
+favor_rating = st.sidebar.checkbox("Favor higher-rated movies")
 
-# Filter according to the selected filter options
-if selected_genres:
-    filtered_df = filtered_df[filtered_df['genres'].apply(lambda x: any(genre in x for genre in selected_genres))]
+# Apply filters as row ids, without copying the matching part of the dataframe
+# Genres are matched as substrings of the space-joined string, so each selected token also
+# matches every token that contains it; directors are matched by name
+candidate_rows = filter_index.match({
+    'genres': [token for option in selected_genres for token in filter_index['genres'].containing(option)],
+    'directors': selected_directors,
+}, mode='any')
+ratings = df['weighted_rating'].to_numpy()
+rows = np.arange(len(df)) if candidate_rows is None else candidate_rows.astype(np.int64)
 
+# Filter according to the selected filter options
 if selected_rating:
-    filtered_df = filtered_df[(filtered_df['weighted_rating'] >= selected_rating[0]) & 
-                               (filtered_df['weighted_rating'] <= selected_rating[1])]
-
-if selected_directors:
-    filtered_df = filtered_df[filtered_df['directors'].apply(lambda x: any(director in x for director in selected_directors))]
+    rows = rows[(ratings[rows] >= selected_rating[0]) & (ratings[rows] <= selected_rating[1])]
 
 if selected_adult != 'Any':
     # Filter the isAdult column, mapping 1 to 'Adult' and 0 to 'Not Adult'
     is_adult_filter = 1 if selected_adult == 'Adult' else 0
-    filtered_df = filtered_df[filtered_df['isAdult'] == is_adult_filter]
+    rows = rows[df['isAdult'].to_numpy()[rows] == is_adult_filter]
+
+sampler = RowSampler(rows, ratings if favor_rating else None)
+
+# What this session disliked so far, as one fixed-size vector
+if 'preferences' not in st.session_state:
+    st.session_state.preferences = Preferences()
+
+# The movies this session was already shown, so a draw does not repeat one
+if 'seen' not in st.session_state:
+    st.session_state.seen = SeenRows(len(df))
+    st.session_state.rng = np.random.default_rng()
+
+def draw_movies(count):
+    """Up to `count` random matching rows not shown yet; starts over once every match was shown."""
+    seen = st.session_state.seen
+    drawn = sampler.sample(count, st.session_state.rng, seen)
+    if not len(drawn) and len(sampler):
+        seen.clear()
+        drawn = sampler.sample(count, st.session_state.rng, seen)
+    return drawn
+
+def show_movie(row):
+    st.session_state.current_movie = df.iloc[row]
+    st.session_state.seen.add(row)
+    # Get the movie poster from OMDb API
+    st.session_state.poster = get_movie_poster(st.session_state.current_movie['tconst'], API_KEY)
+
+# If no movies match the filters, there is nothing to draw from
+if not len(sampler):
+    st.write("No movies match your filters.")
+    st.stop()
 
 # Initialize the session state for the movie if not already set
 if 'current_movie' not in st.session_state or 'poster' not in st.session_state:
     # Get a random movie from the filtered data
-    st.session_state.current_movie = filtered_df.sample(1).iloc[0]
-    # Get the movie poster from OMDb API
-    tconst = st.session_state.current_movie['tconst']
-    st.session_state.poster = get_movie_poster(tconst, API_KEY)
+    show_movie(draw_movies(1)[0])
 
 # Display movie recommendations
 st.header("Recommended Movies")
@@ -157,16 +224,12 @@ with st.container():
     # Use the movie's tconst to ensure the button key is unique
     button_key = f"btn_{tconst}"
     if st.button("Don't like this one", key=button_key):
-        # Randomly select a new movie
-        st.session_state.current_movie = filtered_df.sample(1).iloc[0]
-        tconst = st.session_state.current_movie['tconst']
-        # Get the new movie poster
-        st.session_state.poster = get_movie_poster(tconst, API_KEY)
+        preferences = st.session_state.preferences
+        preferences.record(embedder([current_movie.name])[0], 'dislike')
+        # Pick the least disliked-looking of a few random movies
+        show_movie(preferences.choose(draw_movies(WINDOW), embedder))
         # Re-render the current page
         st.rerun()  # Use st.rerun() instead of st.experimental_rerun()
 
     st.markdown('</div>', unsafe_allow_html=True)
 
-# If no movies match the filters, display a message
-if filtered_df.empty:
-    st.write("No movies match your filters.")
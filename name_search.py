@@ -0,0 +1,229 @@
+"""
+Typeahead search over cast and director names.
+
+The sidebar used to need the exact full name, so 'tom hanks', 'Penelope Cruz'
+(for Penélope) or a typo silently matched nothing. NameSearch indexes the
+person vocabulary of one inverted index and resolves free text to the ids of
+the people it most likely means:
+
+- Names are folded: Unicode NFKD, combining marks dropped, lower-cased and
+  whitespace collapsed, so accents and case never matter.
+- Prefix search: every suffix of a folded name that starts at a word is a key
+  in one sorted byte array ('tom hanks', 'hanks'), so 'han' finds Tom Hanks.
+  A query is two binary searches, and the matches form one contiguous range.
+- Fuzzy fallback: when no name starts with the query, trigram postings (CSR,
+  like the filter indexes) give the names sharing the most letter triples, so
+  typos still find someone.
+
+Matches rank by how well they match, then by how many titles the person has.
+Both structures are numpy arrays built with vectorized Arrow string kernels,
+so building runs at catalog load and a query takes a few milliseconds.
+"""
+import unicodedata
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from interned import csr_slices
+
+# Bytes of each key kept in the sorted array; longer queries are checked against the full name
+KEY_BYTES = 24
+
+# Suggestions returned per query
+LIMIT = 10
+
+# Queries up to this many bytes match huge ranges of keys; their results are kept
+SHORT_QUERY = 2
+
+# Trigrams in more than this share of the names carry little signal; they are left out of
+# the similarity on both sides
+COMMON_TRIGRAMS = 0.05
+
+# Minimum Dice similarity of trigram sets for a fuzzy match
+MIN_SIMILARITY = 0.4
+
+
+def fold_array(names):
+    """Folds an Arrow string array: NFKD, no combining marks, lower case, single spaces."""
+    names = pc.utf8_normalize(names, form='NFKD')
+    names = pc.replace_substring_regex(names, pattern=r'\p{Mn}+', replacement='')
+    names = pc.utf8_lower(names)
+    names = pc.replace_substring_regex(names, pattern=r'\s+', replacement=' ')
+    return pc.utf8_trim_whitespace(names)
+
+
+def fold(name):
+    """Folds one query like fold_array, e.g. ' Penélope  CRUZ' -> 'penelope cruz'."""
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(char for char in name if unicodedata.category(char) != 'Mn')
+    return ' '.join(name.lower().split())
+
+
+def prefix_end(key):
+    """
+    The first byte string after all those starting with `key`, so the keys
+    of a sorted array starting with `key` lie in [key, prefix_end(key)).
+    UTF-8 never contains 0xff, so the last byte of a key can always be bumped.
+    """
+    return key[:-1] + bytes([key[-1] + 1])
+
+
+def _flat_bytes(strings):
+    """(bytes, offsets) of an Arrow string array, as numpy arrays."""
+    strings = pa.concat_arrays([strings]) if strings.offset else strings
+    offsets = np.frombuffer(strings.buffers()[1], dtype=np.int32)[:len(strings) + 1].astype(np.int64)
+    data = np.frombuffer(strings.buffers()[2], dtype=np.uint8) if len(strings) else np.empty(0, dtype=np.uint8)
+    return data, offsets
+
+
+def _fixed_width(data, starts, ends, width):
+    """Copies the byte slices into a NUL-padded numpy bytes array of `width`."""
+    ends = np.minimum(ends, starts + width)
+    positions, owner = csr_slices(starts, ends)
+    matrix = np.zeros((len(starts), width), dtype=np.uint8)
+    matrix[owner, positions - starts[owner]] = data[positions]
+    return matrix.view(f'S{width}').ravel()
+
+
+def _trigram_codes(data, starts, ends):
+    """Byte trigrams of every slice as int32 codes, and the slice each belongs to."""
+    positions, owner = csr_slices(starts, ends - 2)
+    codes = (data[positions].astype(np.int32) << 16) | (data[positions + 1].astype(np.int32) << 8) \
+        | data[positions + 2]
+    return codes, owner
+
+
+def _query_trigrams(folded):
+    data = np.frombuffer(f' {folded}'.encode(), dtype=np.uint8)
+    codes, _ = _trigram_codes(data, np.zeros(1, dtype=np.int64), np.array([len(data)]))
+    return np.unique(codes)
+
+
+class NameSearch:
+    """Prefix and trigram indexes over the names of one person column."""
+
+    def __init__(self, vocabulary, counts, folded, keys, key_names, key_first, trigrams, trigram_offsets,
+                 trigram_names, trigram_counts):
+        self.vocabulary = vocabulary            # names, as in the inverted index
+        self.counts = counts                    # titles per name
+        self.folded = folded                    # folded names, Arrow string array
+        self.keys = keys                        # sorted word-start suffixes, S{KEY_BYTES}
+        self.key_names = key_names              # name id of each key
+        self.key_first = key_first              # True where the key starts at the name's first word
+        self.trigrams = trigrams                # sorted distinct trigram codes
+        self.trigram_offsets = trigram_offsets  # trigram -> slice of `trigram_names`
+        self.trigram_names = trigram_names      # name ids per trigram, sorted
+        self.trigram_counts = trigram_counts    # distinct uncommon trigrams per name
+        self._short = {}                        # results of short prefix queries
+
+    @classmethod
+    def build(cls, index):
+        """Indexes the vocabulary of an InvertedIndex, ranking people by their posting counts."""
+        vocabulary = index.vocabulary
+        folded = fold_array(pa.array(vocabulary, type=pa.string()))
+        data, offsets = _flat_bytes(folded)
+        starts, ends = offsets[:-1], offsets[1:]
+
+        # One key per word start: the name itself plus the suffix after every space
+        spaces = np.flatnonzero(data == ord(' '))
+        space_names = np.searchsorted(offsets, spaces, side='right') - 1
+        key_names = np.concatenate([np.arange(len(vocabulary)), space_names])
+        key_starts = np.concatenate([starts, spaces + 1])
+        keys = _fixed_width(data, key_starts, ends[key_names], KEY_BYTES)
+        order = np.argsort(keys, kind='stable')
+        key_first = np.zeros(len(keys), dtype=bool)
+        key_first[:len(vocabulary)] = True
+
+        # Trigrams of ' name ', deduplicated per name
+        padded = pc.binary_join_element_wise('', folded, '', ' ')
+        data, offsets = _flat_bytes(padded)
+        codes, owner = _trigram_codes(data, offsets[:-1], offsets[1:])
+        pairs = np.sort(codes.astype(np.int64) << 32 | owner)
+        pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]] if len(pairs) else pairs
+        codes, owner = (pairs >> 32).astype(np.int32), (pairs & 0xFFFFFFFF).astype(np.int32)
+        boundaries = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        trigram_offsets = np.append(boundaries, len(codes)).astype(np.int64)
+        lengths = np.diff(trigram_offsets)
+        common = np.repeat(lengths > max(COMMON_TRIGRAMS * len(vocabulary), 1), lengths)
+        trigram_counts = np.bincount(owner[~common], minlength=len(vocabulary)).astype(np.int32)
+
+        return cls(vocabulary, np.asarray(index.counts()), folded, keys[order], key_names[order].astype(np.int32),
+                   key_first[order], codes[boundaries], trigram_offsets, owner, trigram_counts)
+
+    def prefix(self, folded, limit=LIMIT):
+        """Ids of up to `limit` names with a word starting with `folded`, best first."""
+        query = folded.encode()
+        if not query:
+            return np.empty(0, dtype=np.int64)
+        if len(query) <= SHORT_QUERY:
+            if (query, limit) not in self._short:
+                self._short[query, limit] = self._prefix(folded, query, limit)
+            return self._short[query, limit]
+        return self._prefix(folded, query, limit)
+
+    def _prefix(self, folded, query, limit):
+        key = query[:KEY_BYTES]
+        low, high = np.searchsorted(self.keys, [key, prefix_end(key)])
+        names, first = self.key_names[low:high], self.key_first[low:high]
+        # Whole names that may be exactly the query: their key is the query (cut to KEY_BYTES)
+        exact = first & (self.keys[low:high] == key)
+        if len(query) > KEY_BYTES:
+            # The keys only hold the first KEY_BYTES bytes; check the rest on the full names
+            keep = np.array([f' {self.folded[name].as_py()}'.find(f' {folded}') >= 0 for name in names.tolist()],
+                            dtype=bool)
+            names, first, exact = names[keep], first[keep], exact[keep]
+        if not len(names):
+            return np.empty(0, dtype=np.int64)
+        # A name that is exactly the query comes first, so 'Chris Evans' is not taken for a
+        # 'Chris Evanson' with more titles
+        candidates = np.flatnonzero(exact)
+        exact[candidates] = [self.folded[name].as_py() == folded for name in names[candidates].tolist()]
+        # Then matches at the first word before later-word matches, then people with more titles
+        bonus = self.counts.max() + 1
+        score = self.counts[names] + first * bonus + exact * 2 * bonus
+        # A name can match at several of its words, so keep a few spare before dropping repeats
+        best = min(len(names), 4 * limit)
+        top = np.argpartition(-score, best - 1)[:best]
+        names = names[top[np.lexsort((names[top], -score[top]))]]
+        _, position = np.unique(names, return_index=True)
+        return names[np.sort(position)][:limit].astype(np.int64)
+
+    def fuzzy(self, folded, limit=LIMIT):
+        """Ids of the names sharing the most trigrams with `folded`, best first."""
+        codes = _query_trigrams(folded)
+        if not len(self.trigrams):
+            return np.empty(0, dtype=np.int64)
+        found = np.minimum(np.searchsorted(self.trigrams, codes), len(self.trigrams) - 1)
+        found = found[self.trigrams[found] == codes]
+        lengths = self.trigram_offsets[found + 1] - self.trigram_offsets[found]
+        common = lengths > max(COMMON_TRIGRAMS * len(self.vocabulary), 1)
+        rare = found[~common]
+        if not len(rare):
+            return np.empty(0, dtype=np.int64)
+        positions, _ = csr_slices(self.trigram_offsets[rare], self.trigram_offsets[rare + 1])
+        names = np.sort(self.trigram_names[positions])
+        starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+        names, shared = names[starts], np.diff(np.append(starts, len(names)))
+        similarity = 2 * shared / (len(codes) - common.sum() + self.trigram_counts[names])
+        keep = similarity >= MIN_SIMILARITY
+        names, similarity = names[keep], similarity[keep]
+        order = np.lexsort((names, -self.counts[names], -similarity))[:limit]
+        return names[order].astype(np.int64)
+
+    def suggest(self, text, limit=LIMIT):
+        """Ids of up to `limit` names matching `text`; fuzzy matches only when no name starts with it."""
+        folded = fold(text)
+        names = self.prefix(folded, limit)
+        if not len(names) and folded:
+            names = self.fuzzy(folded, limit)
+        return names
+
+    def resolve(self, text):
+        """Id of the person `text` most likely means, or None if nobody matches."""
+        names = self.suggest(text, limit=1)
+        return int(names[0]) if len(names) else None
+
+    def names(self, ids):
+        """The names of `ids`, as stored in the inverted index."""
+        return [self.vocabulary[name] for name in np.asarray(ids).tolist()]
@@ -0,0 +1,201 @@
+"""
+Persistent on-disk cache for posters and API metadata.
+
+Posters are stored as the original compressed image bytes in content-addressed
+files (objects/<sha256 prefix>/<sha256>), indexed by IMDb id in SQLite. Titles
+without a poster are cached too, so OMDb is not asked again for them until the
+negative entry expires. The cache survives restarts and is shared by every
+worker process: SQLite runs in WAL mode and image files are written atomically.
+When the stored images exceed the byte budget, the least recently used are
+evicted. Their total size is kept up to date in the index by every write, so
+checking the budget does not scan the cache.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.environ.get('POSTER_CACHE_DIR', '.cache/posters')
+MAX_BYTES = int(os.environ.get('POSTER_CACHE_BYTES', 512 * 1024 * 1024))
+
+# How long a "no poster" answer is trusted before OMDb is asked again
+NEGATIVE_TTL = 7 * 24 * 3600
+
+# Evict down to this fraction of the budget so eviction does not run on every write
+EVICT_TO = 0.9
+
+# Only refresh access times this often per entry, to keep hits from turning into writes
+TOUCH_INTERVAL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posters (
+    imdb_id TEXT PRIMARY KEY,
+    digest TEXT,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posters_accessed ON posters (accessed_at);
+CREATE INDEX IF NOT EXISTS posters_digest ON posters (digest);
+CREATE TABLE IF NOT EXISTS totals (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Bytes of the stored images, shared images counted once; kept in the totals table
+IMAGE_BYTES = """
+SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM posters WHERE digest IS NOT NULL)
+"""
+
+MISSING = object()
+
+
+class PosterStore:
+    """SQLite-indexed, content-addressed poster cache with LRU eviction."""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES, negative_ttl=NEGATIVE_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self._local = threading.local()
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        with self._connection() as db:
+            db.executescript(SCHEMA)
+            # Counted once for a cache written before the total was kept
+            db.execute(f"INSERT OR IGNORE INTO totals SELECT 'image_bytes', ({IMAGE_BYTES})")
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.root, 'index.sqlite'), timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def get(self, imdb_id):
+        """
+        Returns the cached poster bytes, None for a cached "no poster" answer, or
+        MISSING when the title is not cached (or its negative entry has expired).
+        """
+        db = self._connection()
+        row = db.execute('SELECT digest, fetched_at, accessed_at FROM posters WHERE imdb_id = ?',
+                         (imdb_id,)).fetchone()
+        if row is None:
+            return MISSING
+        digest, fetched_at, accessed_at = row
+        now = time.time()
+        if digest is None:
+            return None if now - fetched_at < self.negative_ttl else MISSING
+        try:
+            with open(self._path(digest), 'rb') as f:
+                poster = f.read()
+        except FileNotFoundError:
+            # Evicted by another process between the lookup and the read
+            return MISSING
+        if now - accessed_at > TOUCH_INTERVAL:
+            with db:
+                db.execute('UPDATE posters SET accessed_at = ? WHERE imdb_id = ?', (now, imdb_id))
+        return poster
+
+    def put(self, imdb_id, poster):
+        """Stores the poster bytes for a title, or a negative entry when `poster` is None."""
+        now = time.time()
+        digest = None
+        if poster is not None:
+            digest = hashlib.sha256(poster).hexdigest()
+            path = self._path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(poster)
+                os.replace(tmp_path, path)
+        size = len(poster) if poster is not None else 0
+        db = self._connection()
+        with db:
+            # Takes the write lock before reading, so another process cannot change the total in between
+            db.execute('BEGIN IMMEDIATE')
+            old = db.execute('SELECT digest, size FROM posters WHERE imdb_id = ?', (imdb_id,)).fetchone()
+            db.execute('INSERT OR REPLACE INTO posters VALUES (?, ?, ?, ?, ?)', (imdb_id, digest, size, now, now))
+            change = 0
+            old_digest, old_size = old or (None, 0)
+            if digest is not None and digest != old_digest and self._references(db, digest) == 1:
+                change += size
+            if old_digest is not None and old_digest != digest and self._references(db, old_digest) == 0:
+                change -= old_size
+            (total,) = db.execute("UPDATE totals SET value = value + ? WHERE name = 'image_bytes' RETURNING value",
+                                  (change,)).fetchone()
+        if total > self.max_bytes:
+            self.evict()
+
+    @staticmethod
+    def _references(db, digest):
+        (count,) = db.execute('SELECT COUNT(*) FROM posters WHERE digest = ?', (digest,)).fetchone()
+        return count
+
+    def size(self):
+        """Total bytes of the stored images (shared images are counted once)."""
+        (total,) = self._connection().execute("SELECT value FROM totals WHERE name = 'image_bytes'").fetchone()
+        return total
+
+    def evict(self, target=None):
+        """Drops least recently used posters until the images fit in `target` bytes."""
+        target = self.max_bytes * EVICT_TO if target is None else target
+        db = self._connection()
+        removed = []
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            (total,) = db.execute("SELECT value FROM totals WHERE name = 'image_bytes'").fetchone()
+            if total > target:
+                rows = db.execute('SELECT imdb_id, digest, size FROM posters WHERE digest IS NOT NULL '
+                                  'ORDER BY accessed_at')
+                for imdb_id, digest, size in rows.fetchall():
+                    if total <= target:
+                        break
+                    db.execute('DELETE FROM posters WHERE imdb_id = ?', (imdb_id,))
+                    if not self._references(db, digest):
+                        total -= size
+                        removed.append(digest)
+                db.execute("UPDATE totals SET value = ? WHERE name = 'image_bytes'", (total,))
+        # Delete files only after the index no longer points at them
+        for digest in removed:
+            try:
+                os.remove(self._path(digest))
+            except FileNotFoundError:
+                pass
+        return len(removed)
+
+    def get_json(self, key):
+        """Returns a cached metadata value, or None if absent or expired."""
+        row = self._connection().execute('SELECT value, expires_at FROM metadata WHERE key = ?',
+                                         (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def put_json(self, key, value, ttl):
+        """Caches a JSON-serializable metadata value for `ttl` seconds."""
+        db = self._connection()
+        with db:
+            db.execute('INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)',
+                       (key, json.dumps(value), time.time() + ttl))
+
+    def stats(self):
+        """Entry counts and stored bytes, for monitoring."""
+        db = self._connection()
+        posters, negatives = db.execute(
+            'SELECT COUNT(digest), COUNT(*) - COUNT(digest) FROM posters').fetchone()
+        return {'posters': posters, 'negatives': negatives, 'bytes': self.size(), 'max_bytes': self.max_bytes}
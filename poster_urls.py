@@ -0,0 +1,149 @@
+"""
+Precomputed IMDb id -> poster URL table.
+
+Resolving a poster through OMDb costs a JSON lookup per title on top of the
+image download. This table is built offline next to the catalog, so at serving
+time a poster is a single image GET and OMDb is only asked about titles the
+table does not know. Build it from TMDB's /find endpoint, or import an existing
+CSV with `tconst,poster_url` columns:
+
+    python poster_urls.py build --api-key $TMDB_API_KEY
+    python poster_urls.py import posters.csv
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import requests
+
+from api_client import TMDB_URL, ApiClient
+from catalog import CATALOG_PATH, open_catalog, write_catalog
+from poster_store import MISSING
+
+POSTER_URLS_PATH = 'poster_urls.arrow'
+TMDB_IMAGE_URL = os.environ.get('TMDB_IMAGE_URL', 'https://image.tmdb.org/t/p/w500')
+
+
+def _id_number(imdb_id):
+    """'tt0111161' -> 111161, so ids can be kept in a sorted integer array."""
+    return int(imdb_id[2:])
+
+
+class PosterUrlTable:
+    """Sorted, memory-mapped lookup from IMDb id to poster URL."""
+
+    def __init__(self, ids, urls):
+        self.ids = ids
+        self.urls = urls
+
+    @classmethod
+    def open(cls, path=POSTER_URLS_PATH):
+        table = open_catalog(path)
+        ids = table.column('id').combine_chunks().to_numpy()
+        return cls(ids, table.column('poster_url').combine_chunks())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, imdb_id):
+        """Returns the poster URL for an IMDb id, or MISSING if the table has none."""
+        number = _id_number(imdb_id)
+        position = int(np.searchsorted(self.ids, number))
+        if position < len(self.ids) and self.ids[position] == number:
+            return self.urls[position].as_py()
+        return MISSING
+
+    def items(self):
+        return zip((f'tt{number:07d}' for number in self.ids.tolist()), self.urls.to_pylist())
+
+
+def load_poster_urls(path=POSTER_URLS_PATH):
+    """Opens the table, or returns None when it has not been built."""
+    return PosterUrlTable.open(path) if os.path.exists(path) else None
+
+
+def write_poster_urls(mapping, path=POSTER_URLS_PATH):
+    """Writes a {tconst: poster_url} mapping as a table sorted by id."""
+    imdb_ids = sorted(mapping, key=_id_number)
+    table = pa.table({
+        'id': pa.array([_id_number(imdb_id) for imdb_id in imdb_ids], type=pa.int64()),
+        'tconst': pa.array(imdb_ids, type=pa.string()),
+        'poster_url': pa.array([mapping[imdb_id] for imdb_id in imdb_ids], type=pa.string()),
+    })
+    write_catalog(table, path)
+
+
+def find_poster_url(client, imdb_id, api_key, tmdb_url=TMDB_URL):
+    """Asks TMDB for the poster of an IMDb id; returns its URL or None."""
+    data = client.get_json('tmdb_find', f'{tmdb_url}3/find/{imdb_id}',
+                           params={'api_key': api_key, 'external_source': 'imdb_id'})
+    for movie in data.get('movie_results', []):
+        if movie.get('poster_path'):
+            return f"{TMDB_IMAGE_URL}{movie['poster_path']}"
+    return None
+
+
+def build_poster_urls(api_key, catalog_path=CATALOG_PATH, output=POSTER_URLS_PATH, workers=8, client=None):
+    """
+    Resolves a poster URL for every catalog title missing from `output` and
+    rewrites it. Safe to rerun: already known titles are not queried again.
+    """
+    client = client or ApiClient()
+    existing = load_poster_urls(output)
+    mapping = dict(existing.items()) if existing is not None else {}
+    todo = [imdb_id for imdb_id in open_catalog(catalog_path).column('tconst').to_pylist() if imdb_id not in mapping]
+
+    def resolve(imdb_id):
+        try:
+            return imdb_id, find_poster_url(client, imdb_id, api_key), False
+        except (requests.RequestException, ValueError):
+            return imdb_id, None, True
+
+    start = time.perf_counter()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for done, (imdb_id, poster_url, error) in enumerate(executor.map(resolve, todo), start=1):
+            failed += error
+            if poster_url:
+                mapping[imdb_id] = poster_url
+            if done % 1000 == 0 or done == len(todo):
+                print(f"{done}/{len(todo)} titles looked up, {failed} failed "
+                      f"({done / (time.perf_counter() - start):.0f}/s)")
+    write_poster_urls(mapping, output)
+    return len(mapping)
+
+
+def import_poster_urls(csv_path, output=POSTER_URLS_PATH):
+    """Builds the table from a CSV with tconst and poster_url columns."""
+    df = pd.read_csv(csv_path, usecols=['tconst', 'poster_url']).dropna()
+    df = df[df['poster_url'] != 'N/A']
+    write_poster_urls(dict(zip(df['tconst'], df['poster_url'])), output)
+    return len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the tconst -> poster URL table.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="look up every catalog title on TMDB")
+    build.add_argument('--api-key', default=os.environ.get('TMDB_API_KEY'), required='TMDB_API_KEY' not in os.environ)
+    build.add_argument('--catalog', default=CATALOG_PATH)
+    build.add_argument('--output', default=POSTER_URLS_PATH)
+    build.add_argument('--workers', type=int, default=8)
+    import_csv = subparsers.add_parser('import', help="convert a tconst,poster_url CSV")
+    import_csv.add_argument('csv')
+    import_csv.add_argument('--output', default=POSTER_URLS_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        count = build_poster_urls(args.api_key, args.catalog, args.output, args.workers)
+    else:
+        count = import_poster_urls(args.csv, args.output)
+    print(f"{args.output} now maps {count} titles to posters")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Poster fetching and prefetching.
+
+A poster costs two HTTP round-trips (the OMDb lookup, then the image itself).
+PosterFetcher runs those on a bounded, process-wide thread pool, backed by the
+on-disk PosterStore, and keeps recent results in memory. Each session has a
+PosterPrefetcher that schedules the next few posters of its current result
+while the user looks at the current one, and drops pending work when the
+filters change.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import requests
+
+from api_client import OMDB_URL
+from poster_store import MISSING
+
+
+def fetch_poster(imdb_id, api_key, client, omdb_url=OMDB_URL, is_cancelled=None, poster_urls=None):
+    """
+    Returns the poster image bytes for an IMDb id, or None if OMDb has none.
+    The URL comes from the precomputed `poster_urls` table when it knows the title.
+    """
+    poster_url = MISSING if poster_urls is None else poster_urls.get(imdb_id)
+    if poster_url is MISSING:
+        data = client.get_json('omdb', omdb_url, params={'i': imdb_id, 'apikey': api_key})
+        if 'Poster' not in data or data['Poster'] == 'N/A':
+            return None
+        poster_url = data['Poster']
+    if is_cancelled is not None and is_cancelled():
+        # Nobody wants this poster any more; skip the image download
+        raise CancelledError()
+    poster_response = client.get('poster_image', poster_url)
+    poster_response.raise_for_status()
+    return poster_response.content
+
+
+class PosterFetcher:
+    """Process-wide pool that fetches posters with bounded concurrency and keeps the results."""
+
+    def __init__(self, fetch, max_workers=8, max_items=256, store=None, transform=None):
+        # `fetch(imdb_id, is_cancelled)` returns the poster bytes or None; `store` is
+        # an optional PosterStore consulted before fetching and filled afterwards;
+        # `transform(poster)` post-processes fetched bytes (e.g. into a thumbnail)
+        # before they are stored
+        self._fetch = fetch
+        self._store = store
+        self._transform = transform
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='poster')
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._max_items = max_items
+        self._inflight = {}
+
+    def _run(self, imdb_id, cancel_event):
+        try:
+            poster = MISSING if self._store is None else self._store.get(imdb_id)
+            if poster is MISSING:
+                poster = self._fetch(imdb_id, cancel_event.is_set)
+                if poster is not None and self._transform is not None:
+                    poster = self._transform(poster)
+                if self._store is not None:
+                    self._store.put(imdb_id, poster)
+        finally:
+            with self._lock:
+                if self._inflight.get(imdb_id, (None, None))[1] is cancel_event:
+                    del self._inflight[imdb_id]
+        with self._lock:
+            self._results[imdb_id] = poster
+            self._results.move_to_end(imdb_id)
+            while len(self._results) > self._max_items:
+                self._results.popitem(last=False)
+        return poster
+
+    def submit(self, imdb_id):
+        """Starts fetching a poster unless it is cached or already in flight; returns (future, cancel_event)."""
+        with self._lock:
+            if imdb_id in self._results:
+                self._results.move_to_end(imdb_id)
+                future = Future()
+                future.set_result(self._results[imdb_id])
+                return future, None
+            if imdb_id in self._inflight:
+                future, cancel_event = self._inflight[imdb_id]
+                if not cancel_event.is_set():
+                    return future, cancel_event
+            cancel_event = threading.Event()
+            future = self._executor.submit(self._run, imdb_id, cancel_event)
+            self._inflight[imdb_id] = (future, cancel_event)
+            return future, cancel_event
+
+    def get(self, imdb_id, timeout=None):
+        """Returns the poster bytes, waiting for an in-flight fetch; None if unavailable."""
+        for _ in range(2):
+            future, _ = self.submit(imdb_id)
+            try:
+                return future.result(timeout=timeout)
+            except CancelledError:
+                # Another session dropped this fetch before it finished; start it again
+                continue
+            except (FutureTimeoutError, requests.RequestException, ValueError):
+                return None
+        return None
+
+    def resolve(self, imdb_ids, timeout=None):
+        """
+        Fetches a batch of posters concurrently and yields (imdb_id, poster bytes or
+        None) in the requested order, each as soon as it and its predecessors are done.
+        """
+        futures = [(imdb_id, self.submit(imdb_id)[0]) for imdb_id in imdb_ids]
+        for imdb_id, future in futures:
+            try:
+                yield imdb_id, future.result(timeout=timeout)
+            except CancelledError:
+                yield imdb_id, self.get(imdb_id, timeout)
+            except (FutureTimeoutError, requests.RequestException, ValueError):
+                yield imdb_id, None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PosterPrefetcher:
+    """Per-session prefetch of the next posters of the current ordered result."""
+
+    def __init__(self, fetcher, lookahead=5):
+        self.fetcher = fetcher
+        self.lookahead = lookahead
+        self.key = None
+        self._pending = []
+
+    def follow(self, key, imdb_ids):
+        """
+        Schedules the first `lookahead` posters of `imdb_ids` (current movie first).
+        A new `key` means the filters changed, so pending work is cancelled first.
+        """
+        if key != self.key:
+            self.cancel()
+            self.key = key
+        self._pending = [(future, event) for future, event in self._pending if not future.done()]
+        for imdb_id in imdb_ids[:self.lookahead + 1]:
+            future, cancel_event = self.fetcher.submit(imdb_id)
+            if cancel_event is not None:
+                self._pending.append((future, cancel_event))
+
+    def cancel(self):
+        """Cancels queued fetches and stops running ones before the image download."""
+        for future, cancel_event in self._pending:
+            cancel_event.set()
+            future.cancel()
+        self._pending = []
@@ -0,0 +1,24 @@
+"""
+Values that one thread replaces while other threads keep reading them.
+
+The catalog snapshot, the indexes of each catalog version and the trending
+payload are read by every rerun and request, on many threads, and replaced
+now and then by a single one. Readers take no lock: rebinding one reference
+is atomic in CPython, so a reader gets either the old value or the new one.
+That only holds for a single reference. Whatever has to change together is
+published as one object, never as several attributes or by updating a dict
+in place, which a reader could catch half done.
+"""
+
+
+class Published:
+    """The current version of a value; get() takes no lock and never sees a half-made update."""
+
+    def __init__(self, value=None):
+        self._value = value
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
@@ -0,0 +1,125 @@
+"""
+Range queries over the numeric catalog columns.
+
+Each numeric column keeps an argsorted array of row ids, so a slider range
+resolves to a contiguous slice via searchsorted. A query starts from the
+smallest of the candidate sets, checks the remaining conditions on those rows
+only, and returns row ids already ordered by the ranking column. The catalog
+dataframe itself is never copied or masked.
+"""
+import numpy as np
+
+from filter_index import sorted_member
+
+RANK_COLUMN = 'weighted_rating'
+NUMERIC_COLUMNS = ['startYear', 'runtimeMinutes', 'weighted_rating', 'isAdult']
+
+
+def _numeric_values(column):
+    """Returns a column as a numpy array, with missing values as NaN."""
+    values = column.to_numpy() if hasattr(column, 'to_numpy') else np.asarray(column)
+    if values.dtype.kind not in 'iuf':
+        values = column.to_numpy(dtype=float, na_value=np.nan)
+    return values
+
+
+class RangeIndex:
+    """Row ids of one numeric column sorted by value, with NaNs left out."""
+
+    def __init__(self, values):
+        values = _numeric_values(values)
+        num_rows = len(values)
+        # Sorting the reversed column keeps ties in descending row order, so a reversed
+        # slice lists equal values in catalog order
+        order = (num_rows - 1 - np.argsort(values[::-1], kind='stable')).astype(np.int32)
+        if values.dtype.kind == 'f':
+            order = order[:num_rows - int(np.isnan(values).sum())]
+        self.values = values
+        self.order = order
+        self.sorted_values = values[order]
+        self.num_rows = num_rows
+
+    def limits(self):
+        """Returns the smallest and largest value of the column, ignoring NaNs."""
+        if len(self.sorted_values) == 0:
+            return -np.inf, np.inf
+        return self.sorted_values[0].item(), self.sorted_values[-1].item()
+
+    def bounds(self, low, high):
+        """Returns the [start, stop) slice of `order` holding values in [low, high]."""
+        start = int(np.searchsorted(self.sorted_values, low, side='left'))
+        stop = int(np.searchsorted(self.sorted_values, high, side='right'))
+        return start, max(start, stop)
+
+    def select(self, low, high):
+        """Returns the ids of the rows with low <= value <= high, in ascending value order."""
+        start, stop = self.bounds(low, high)
+        return self.order[start:stop]
+
+    def count(self, low, high):
+        """Returns how many rows fall in [low, high] without materializing them."""
+        start, stop = self.bounds(low, high)
+        return stop - start
+
+    def covers_all(self, low, high):
+        """True when the range keeps every row, i.e. the condition is a no-op."""
+        return self.count(low, high) == self.num_rows
+
+    def contains(self, rows, low, high):
+        """Boolean mask telling which of `rows` fall in [low, high]."""
+        values = self.values[rows]
+        return (values >= low) & (values <= high)
+
+
+class CatalogQuery:
+    """Resolves slider ranges and candidate sets to row ids ordered by rating."""
+
+    def __init__(self, ranges, rank_column=RANK_COLUMN):
+        self.ranges = ranges
+        self.rank_column = rank_column
+        ranking = ranges[rank_column]
+        self.num_rows = ranking.num_rows
+        # Best-rated first; rows without a rating go last
+        ranked = ranking.order[::-1]
+        unranked = np.setdiff1d(np.arange(self.num_rows, dtype=np.int32), ranked, assume_unique=True)
+        self.rank_order = np.concatenate([ranked, unranked]).astype(np.int32)
+        self.rank = np.empty(self.num_rows, dtype=np.int32)
+        self.rank[self.rank_order] = np.arange(self.num_rows, dtype=np.int32)
+        self.limits = {name: index.limits() for name, index in ranges.items()}
+
+    @classmethod
+    def build(cls, df, columns=NUMERIC_COLUMNS, rank_column=RANK_COLUMN):
+        """Builds a range index for every numeric column of `df`."""
+        return cls({name: RangeIndex(df[name]) for name in columns}, rank_column)
+
+    def run(self, candidates=None, ranges=None):
+        """
+        Returns the ids of the rows in `candidates` (sorted row ids, or None for every
+        row) whose values fall inside each inclusive (low, high) entry of `ranges`,
+        ordered by descending rank column. Entries whose range is None are ignored.
+        """
+        conditions = [(name, bounds) for name, bounds in (ranges or {}).items()
+                      if bounds is not None and not self.ranges[name].covers_all(*bounds)]
+
+        # Drive the query from whichever set is smallest and check the rest on its rows
+        sizes = [self.ranges[name].count(*bounds) for name, bounds in conditions]
+        if candidates is not None and (not sizes or len(candidates) <= min(sizes)):
+            rows = np.asarray(candidates, dtype=np.int32)
+            driver = None
+        elif sizes:
+            driver = int(np.argmin(sizes))
+            name, bounds = conditions[driver]
+            rows = self.ranges[name].select(*bounds)
+        else:
+            return self.rank_order
+
+        for position, (name, bounds) in enumerate(conditions):
+            if position != driver:
+                rows = rows[self.ranges[name].contains(rows, *bounds)]
+        if driver is not None and candidates is not None:
+            rows = rows[sorted_member(rows, candidates)]
+
+        if driver is not None and conditions[driver][0] == self.rank_column:
+            # Already in rating order; reversing gives best-rated first
+            return rows[::-1]
+        return rows[np.argsort(self.rank[rows], kind='stable')]
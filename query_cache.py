@@ -0,0 +1,81 @@
+"""
+Process-wide cache of filter results.
+
+Results are keyed on a canonical form of the sidebar selection (sorted lists,
+ranges clamped to the column bounds, the adult flag) and hold only the ordered
+row-id array, so paging through a result is an array lookup and a popular
+filter combination is computed once for every session of the worker.
+"""
+import threading
+
+from cachetools import TTLCache
+
+# Budget for cached row ids (int32, so 64 MB holds ~16M ids) and how long a result may live
+MAX_BYTES = 64 * 1024 * 1024
+TTL_SECONDS = 15 * 60
+
+
+def _clamp(bounds, limits):
+    low, high = bounds
+    return max(low, limits[0]), min(high, limits[1])
+
+
+def filter_key(lists, ranges, limits):
+    """
+    Returns a hashable, canonical key for a filter selection.
+    `lists` maps list columns to selected values, `ranges` maps numeric columns to an
+    inclusive (low, high) range or None, and `limits` gives each numeric column's
+    (min, max) so equivalent ranges produce the same key.
+    """
+    list_part = tuple((name, tuple(sorted(set(values)))) for name, values in sorted(lists.items()) if values)
+    range_part = tuple(
+        (name, None if bounds is None else _clamp(bounds, limits[name]))
+        for name, bounds in sorted(ranges.items())
+    )
+    return list_part, range_part
+
+
+class QueryCache:
+    """Size-bounded LRU cache with a TTL that maps filter keys to ordered row ids."""
+
+    def __init__(self, max_bytes=MAX_BYTES, ttl=TTL_SECONDS):
+        self._results = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=lambda rows: max(rows.nbytes, 1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """Returns the cached row ids for `key`, calling `compute()` on a miss."""
+        with self._lock:
+            rows = self._results.get(key)
+            if rows is not None:
+                self.hits += 1
+                return rows
+            self.misses += 1
+        rows = compute()
+        # Results are shared between sessions, so nobody may modify them
+        rows.setflags(write=False)
+        with self._lock:
+            try:
+                self._results[key] = rows
+            except ValueError:
+                # Larger than the whole budget; serve it uncached
+                pass
+        return rows
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        """Hit/miss counters and occupancy, for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._results),
+                'bytes': self._results.currsize,
+                'max_bytes': self._results.maxsize,
+            }
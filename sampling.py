@@ -0,0 +1,220 @@
+"""
+Random draws from a filter result, without copying its rows.
+
+A RowSampler holds only the result's row ids. For rating-weighted draws it also
+keeps their running weight total. A uniform draw picks a position at random.
+A weighted draw picks a point in [0, total) and finds it with searchsorted on
+the running totals. Either way a draw costs O(log n) at most, and no dataframe
+is built or copied, however large the result is.
+
+A session that should not see a title twice keeps a SeenRows bitset: one bit
+per catalog row, so 125 KB for a million titles. Draws that land on a seen row
+are thrown away and drawn again. Once most of the result has been seen that
+stops paying off. The sampler then makes one vectorized pass over its rows and
+keeps the unseen ones: a compact array of positions for uniform draws, from
+which a drawn position is swap-removed, and a Fenwick tree of their weights for
+weighted ones, from which a drawn weight is subtracted. Both keep a draw at
+O(log n). Rows seen after the pass are dropped lazily, when a draw lands on
+them, and clearing the SeenRows starts over with a new pass.
+"""
+import numpy as np
+
+# Rounds of drawing and discarding seen rows before switching to a pass over the unseen ones
+MAX_ROUNDS = 4
+
+# Extra draws per round, as a multiple of the rows still wanted, to make up for the discarded ones
+OVERDRAW = 2
+
+
+class SeenRows:
+    """A bitset of the catalog rows one session has already been shown."""
+
+    def __init__(self, num_rows):
+        self.num_rows = num_rows
+        self.bits = np.zeros((num_rows + 7) // 8, dtype=np.uint8)
+        self.cleared = 0  # times clear() was called, so samplers know their unseen rows are stale
+
+    def add(self, rows):
+        """Marks a row id or an array of row ids as seen."""
+        rows = np.asarray(rows, dtype=np.int64)
+        np.bitwise_or.at(self.bits, rows >> 3, (1 << (rows & 7)).astype(np.uint8))
+
+    def contains(self, rows):
+        """Boolean array: which of `rows` have been seen."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return ((self.bits[rows >> 3] >> (rows & 7).astype(np.uint8)) & 1).astype(bool)
+
+    def __contains__(self, row):
+        return bool(self.bits[row >> 3] >> (row & 7) & 1)
+
+    def __len__(self):
+        return int(np.unpackbits(self.bits).sum())
+
+    def clear(self):
+        self.bits[:] = 0
+        self.cleared += 1
+
+
+class RowSampler:
+    """Draws row ids from a filter result, uniformly or in proportion to a weight column."""
+
+    def __init__(self, rows, weights=None):
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cumulative = None
+        if weights is not None and len(self.rows):
+            # Rows with a negative or missing weight are drawn only once every other row has been seen;
+            # all-zero weights fall back to uniform draws
+            weights = np.nan_to_num(np.asarray(weights, dtype=np.float64)[self.rows], nan=0.0)
+            cumulative = np.cumsum(np.maximum(weights, 0.0))
+            if cumulative[-1] > 0:
+                self.cumulative = cumulative
+        self._unseen = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _draw(self, rng, count):
+        if self.cumulative is None:
+            positions = rng.integers(len(self.rows), size=count)
+        else:
+            points = rng.random(count) * self.cumulative[-1]
+            positions = np.searchsorted(self.cumulative, points, side='right')
+            # Guards against a point rounding up to the total
+            np.minimum(positions, len(self.rows) - 1, out=positions)
+        return self.rows[positions]
+
+    def sample(self, k, rng, seen=None):
+        """
+        Up to `k` distinct row ids, in draw order. With a SeenRows `seen`, rows
+        already in it are skipped; fewer than `k` rows come back only when fewer
+        than `k` unseen ones are left.
+        """
+        if not len(self.rows) or k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if self._unseen is not None and self._unseen.fits(seen):
+            return self._unseen.sample(k, rng)
+        picked = np.empty(0, dtype=np.int64)
+        for _ in range(MAX_ROUNDS):
+            drawn = self._draw(rng, (k - len(picked)) * OVERDRAW + 1)
+            if seen is not None:
+                drawn = drawn[~seen.contains(drawn)]
+            # Keep the first draw of each row, in draw order
+            drawn = np.concatenate([picked, drawn])
+            _, first = np.unique(drawn, return_index=True)
+            picked = drawn[np.sort(first)][:k]
+            if len(picked) == k:
+                return picked
+        # Most draws were seen (or repeats): from now on draw from the unseen rows only
+        self._unseen = _UnseenRows(self, seen)
+        return self._unseen.sample(k, rng)
+
+    def draw(self, rng, seen=None):
+        """One row id, or None when every row of the result has been seen."""
+        rows = self.sample(1, rng, seen)
+        return int(rows[0]) if len(rows) else None
+
+
+class _UnseenRows:
+    """The positions of a RowSampler's rows not seen yet, which draws remove as they go."""
+
+    def __init__(self, sampler, seen):
+        self.rows = sampler.rows
+        self.seen = seen
+        self.cleared = None if seen is None else seen.cleared
+        unseen = np.ones(len(self.rows), dtype=bool) if seen is None else ~seen.contains(self.rows)
+        if sampler.cumulative is None:
+            self.weights = np.zeros(len(self.rows))
+        else:
+            self.weights = np.where(unseen, np.diff(sampler.cumulative, prepend=0.0), 0.0)
+        # Fenwick tree of the weights: tree[i] holds the sum of the lowbit(i) weights ending at position i - 1
+        cumulative = np.concatenate([[0.0], np.cumsum(self.weights)])
+        index = np.arange(1, len(self.rows) + 1)
+        self.tree = np.concatenate([[0.0], cumulative[index] - cumulative[index - (index & -index)]])
+        self.top = 1 << (len(self.rows).bit_length() - 1)
+        self.weighted = int(np.count_nonzero(self.weights > 0))
+        # Rows without weight, drawn uniformly once no weighted row is left: positions[:left] are unseen
+        self.positions = np.flatnonzero(unseen & (self.weights <= 0))
+        self.left = len(self.positions)
+
+    def fits(self, seen):
+        """Whether these rows still reflect `seen`: the same bitset, not cleared since."""
+        return seen is self.seen and (seen is None or seen.cleared == self.cleared)
+
+    def _add(self, position, weight):
+        index = position + 1
+        while index < len(self.tree):
+            self.tree[index] += weight
+            index += index & -index
+
+    def _total(self):
+        total, index = 0.0, len(self.tree) - 1
+        while index:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def _find(self, point):
+        """The position whose weight covers `point`: the one past every prefix summing to at most it."""
+        position, step = 0, self.top
+        while step:
+            if position + step < len(self.tree) and self.tree[position + step] <= point:
+                position += step
+                point -= self.tree[position]
+            step >>= 1
+        return position
+
+    def _is_seen(self, position):
+        return self.seen is not None and int(self.rows[position]) in self.seen
+
+    def _draw_weighted(self, rng):
+        """(position, weight) of a weighted draw, taken out of the tree; None once no weight is left."""
+        while self.weighted:
+            position = self._find(rng.random() * self._total())
+            if position == len(self.weights) or self.weights[position] <= 0:
+                # The point rounded past the last weight; draw again
+                continue
+            weight = self.weights[position]
+            self.weights[position] = 0.0
+            self._add(position, -weight)
+            self.weighted -= 1
+            if not self._is_seen(position):
+                return position, weight
+        return None
+
+    def _draw_plain(self, rng, taken):
+        """
+        A uniform draw among positions[:left - taken], swapped to just before the
+        `taken` draws of this call at positions[left - taken:left]; None if none is left.
+        """
+        positions = self.positions
+        while self.left > taken:
+            end = self.left - taken - 1
+            index = rng.integers(end + 1)
+            positions[index], positions[end] = positions[end], positions[index]
+            if not self._is_seen(positions[end]):
+                return positions[end]
+            # Seen since the pass: move it past this call's draws, out of the unseen part for good
+            positions[end], positions[self.left - 1] = positions[self.left - 1], positions[end]
+            self.left -= 1
+        return None
+
+    def sample(self, k, rng):
+        """Up to `k` distinct unseen row ids, in draw order, like RowSampler.sample."""
+        picked, weighted = [], []
+        while len(picked) < k:
+            found = self._draw_weighted(rng)
+            if found is None:
+                # Rows without weight come last, once every weighted row has been picked
+                found = self._draw_plain(rng, len(picked) - len(weighted))
+                if found is None:
+                    break
+                picked.append(found)
+            else:
+                weighted.append(found)
+                picked.append(found[0])
+        # The caller decides which draws it shows (and so marks seen); until then they stay unseen
+        for position, weight in weighted:
+            self.weights[position] = weight
+            self._add(position, weight)
+            self.weighted += 1
+        return self.rows[np.array(picked, dtype=np.int64)]
@@ -0,0 +1,245 @@
+"""
+Multi-process serving from one shared copy of the catalog.
+
+Every Streamlit process builds its own catalog snapshot, filter indexes,
+similarity index and search indexes, so running one worker per core on a
+machine multiplies that memory by the number of workers. In serving mode a
+single loader process builds them once and publishes them as a bundle:
+
+- state.pickle: the objects, pickled with protocol 5. Every numpy and Arrow
+  buffer goes out-of-band instead of into the pickle, and so do large sorted
+  lists of strings (people's names), as Arrow string arrays.
+- buffers.bin: those buffers, one after the other at 64-byte boundaries,
+  and layout.json with the offset and size of each.
+
+Workers memory-map buffers.bin read-only and unpickle the small state on top
+of it, so every array they use is a view of the same page-cache pages. An
+extra worker costs its Python objects and per-session state, not a copy of
+the catalog.
+
+The loader follows the catalog store like LiveCatalog does and publishes a
+new bundle for every version; current.json names the newest one, and workers
+switch to it on their next check. Bundles are immutable, and old ones are
+deleted only after KEEP_VERSIONS newer ones exist.
+
+    python serving.py publish              # once, from catalog.arrow or the store
+    python serving.py serve --workers 4    # publish, start 4 app workers, keep publishing
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import time
+
+import pyarrow as pa
+
+from catalog import CATALOG_PATH
+from catalog_store import CHECK_INTERVAL, KEEP_VERSIONS, STORE_DIR, CatalogStore, LiveCatalog
+from feedback import TitleEmbedder
+from interned import StringVocabulary
+from name_search import NameSearch
+from published import Published
+from similarity import SimilarityIndex
+from title_search import TitleSearch
+
+SERVE_DIR = os.environ.get('CATALOG_SERVE', 'serving')
+CURRENT = 'current.json'
+STATE_FILE = 'state.pickle'
+BUFFERS_FILE = 'buffers.bin'
+LAYOUT_FILE = 'layout.json'
+
+# Lists of strings at least this long are published as Arrow arrays (if they are sorted)
+MIN_SHARED_STRINGS = 1024
+
+ALIGNMENT = 64
+
+# Port of the first app worker started by `serve`; the others take the next ones
+PORT = 8501
+
+# glibc serves large allocations with fresh mmaps until a big block has been freed. A worker
+# that attaches instead of building never frees one, so the scratch arrays of every request
+# would be page-faulted in from scratch; keep blocks up to 64 MB on the heap instead
+WORKER_ENV = {'MALLOC_MMAP_THRESHOLD_': str(64 << 20), 'MALLOC_TRIM_THRESHOLD_': str(256 << 20)}
+
+
+def build_shared(snapshot):
+    """The indexes the app would otherwise build in every worker, keyed like CatalogSnapshot.shared."""
+    similarity = SimilarityIndex.build(snapshot.df, snapshot.filter_index)
+    return {
+        'similarity': similarity,
+        'embedder': TitleEmbedder(similarity),
+        'name_search': {name: NameSearch.build(snapshot.filter_index[name]) for name in ['cast', 'directors']},
+        'title_search': TitleSearch.build(snapshot.table),
+    }
+
+
+class _Pickler(pickle.Pickler):
+    """Protocol 5 pickler that turns large sorted string lists into shared Arrow arrays."""
+
+    def __init__(self, file, buffer_callback):
+        super().__init__(file, protocol=5, buffer_callback=buffer_callback)
+        self._vocabularies = {}
+
+    def persistent_id(self, obj):
+        if type(obj) is not list or len(obj) < MIN_SHARED_STRINGS:
+            return None
+        if id(obj) not in self._vocabularies:
+            shared = all(type(value) is str for value in obj) and all(a <= b for a, b in zip(obj, obj[1:]))
+            # The list is kept alive with its id, so the id cannot be reused for another list
+            self._vocabularies[id(obj)] = (obj, ('strings', pa.array(obj, type=pa.string())) if shared else None)
+        return self._vocabularies[id(obj)][1]
+
+
+class _Unpickler(pickle.Unpickler):
+
+    def __init__(self, file, buffers):
+        super().__init__(file, buffers=buffers)
+        self._vocabularies = {}
+
+    def persistent_load(self, pid):
+        # A list referenced from several places comes back as one shared object
+        if id(pid) not in self._vocabularies:
+            self._vocabularies[id(pid)] = (pid, StringVocabulary(pid[1]))
+        return self._vocabularies[id(pid)][1]
+
+
+def dump_bundle(obj, path):
+    """Writes `obj` as a bundle directory: a small pickle plus one file of its buffers."""
+    os.makedirs(path)
+    buffers, layout = [], []
+    with open(os.path.join(path, STATE_FILE), 'wb') as state:
+        _Pickler(state, buffers.append).dump(obj)
+    with open(os.path.join(path, BUFFERS_FILE), 'wb') as data:
+        for buffer in buffers:
+            raw = buffer.raw()
+            data.write(b'\0' * (-data.tell() % ALIGNMENT))
+            layout.append((data.tell(), raw.nbytes))
+            data.write(raw)
+    with open(os.path.join(path, LAYOUT_FILE), 'w') as f:
+        json.dump(layout, f)
+
+
+def load_bundle(path):
+    """Maps a bundle written by dump_bundle; its arrays are read-only views of the file."""
+    data = pa.memory_map(os.path.join(path, BUFFERS_FILE), 'r').read_buffer()
+    with open(os.path.join(path, LAYOUT_FILE)) as f:
+        layout = json.load(f)
+    buffers = [data.slice(offset, length) for offset, length in layout]
+    with open(os.path.join(path, STATE_FILE), 'rb') as state:
+        return _Unpickler(state, buffers).load()
+
+
+def publish(snapshot, root=SERVE_DIR):
+    """Publishes a snapshot and its shared indexes as the newest bundle; returns its directory."""
+    os.makedirs(root, exist_ok=True)
+    name = f'bundle-{snapshot.version:06d}-{time.time_ns()}'
+    tmp_path = os.path.join(root, f'{name}.tmp')
+    dump_bundle({'snapshot': snapshot, 'shared': build_shared(snapshot)}, tmp_path)
+    os.replace(tmp_path, os.path.join(root, name))
+    # Workers switch bundles here, all at once
+    current_tmp = os.path.join(root, f'{CURRENT}.tmp')
+    with open(current_tmp, 'w') as f:
+        json.dump({'version': snapshot.version, 'bundle': name}, f)
+    os.replace(current_tmp, os.path.join(root, CURRENT))
+
+    # Workers still mapping a deleted bundle keep reading it until they let go
+    bundles = sorted(entry for entry in os.listdir(root) if entry.startswith('bundle-'))
+    for entry in bundles[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+    return os.path.join(root, name)
+
+
+class SharedCatalog:
+    """
+    The worker side: serves the snapshot of the newest published bundle, with
+    the same current() as LiveCatalog. Attaching a bundle only maps its file,
+    so a newer version is picked up inline on the next check.
+    """
+
+    def __init__(self, root=SERVE_DIR, check_interval=CHECK_INTERVAL):
+        self.root = root
+        self.check_interval = check_interval
+        # The attached bundle's name and its snapshot, replaced together
+        self._attached = Published((None, None))
+        self._checked = time.monotonic()
+        self._attach()
+        if self._attached.get()[1] is None:
+            raise FileNotFoundError(os.path.join(root, CURRENT))
+
+    def _attach(self):
+        try:
+            with open(os.path.join(self.root, CURRENT)) as f:
+                name = json.load(f)['bundle']
+        except FileNotFoundError:
+            return
+        if name != self._attached.get()[0]:
+            bundle = load_bundle(os.path.join(self.root, name))
+            bundle['snapshot'].shared = bundle['shared']
+            self._attached.set((name, bundle['snapshot']))
+
+    def current(self):
+        """Returns the snapshot of the newest bundle, checking for a newer one every check_interval."""
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            self._attach()
+        return self._attached.get()[1]
+
+
+def start_workers(count, port=PORT, root=SERVE_DIR):
+    """Starts `count` Streamlit app processes on consecutive ports, attached to the bundles in `root`."""
+    env = dict(WORKER_ENV, **os.environ, CATALOG_SERVE=root)
+    # Through warm_start.py, so each worker attaches to the bundle and fetches the trending list at boot
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warm_start.py')
+    workers = []
+    for i in range(count):
+        worker_env = dict(env)
+        if env.get('APP_METRICS_PORT'):
+            # Each worker exports its own metrics, on consecutive ports like the app
+            worker_env['APP_METRICS_PORT'] = str(int(env['APP_METRICS_PORT']) + i)
+        workers.append(subprocess.Popen([sys.executable, app, '--server.port', str(port + i),
+                                         '--server.headless', 'true'], env=worker_env))
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish the catalog for multi-process serving.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    publish_parser = subparsers.add_parser('publish', help="publish the current catalog once")
+    serve_parser = subparsers.add_parser('serve', help="publish, start app workers and follow the store")
+    serve_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    serve_parser.add_argument('--port', type=int, default=PORT)
+    for sub in (publish_parser, serve_parser):
+        sub.add_argument('--catalog', default=CATALOG_PATH)
+        sub.add_argument('--store', default=STORE_DIR)
+        sub.add_argument('--output', default=SERVE_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    live_catalog = LiveCatalog(CatalogStore(args.store), args.catalog)
+    snapshot = live_catalog.current()
+    path = publish(snapshot, args.output)
+    print(f"Published version {snapshot.version} ({snapshot.table.num_rows} titles) to {path} "
+          f"in {time.perf_counter() - start:.1f}s")
+    if args.command == 'publish':
+        return
+
+    workers = start_workers(args.workers, args.port, os.path.abspath(args.output))
+    print(f"Started {len(workers)} workers on ports {args.port}-{args.port + len(workers) - 1}")
+    try:
+        while all(worker.poll() is None for worker in workers):
+            time.sleep(live_catalog.check_interval)
+            newer = live_catalog.refresh()
+            if newer.version != snapshot.version:
+                snapshot = newer
+                print(f"Published version {snapshot.version} to {publish(snapshot, args.output)}")
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == '__main__':
+    main()
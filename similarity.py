@@ -0,0 +1,155 @@
+"""
+Content-based "more like this" recommendations.
+
+Every title is a sparse TF-IDF vector over its genres, directors, cast,
+languages and year and runtime buckets. A feature's weight is its column
+weight times its inverse document frequency, so a shared director counts for
+far more than a shared language. Each vector is L2-normalized.
+
+The matrix is kept column-major, as one sorted array of row ids per feature
+(the same CSR layout as the filter indexes), plus a row-major copy for reading
+a title's own features. Scoring a query against every title only touches the
+posting lists of the query's features: each adds its weight to its rows with
+one np.add.at. np.argpartition then picks the top k from the few
+titles above a sampled threshold, without sorting the catalog.
+"""
+import numpy as np
+
+from filter_index import InvertedIndex
+from interned import csr_slices
+
+# Relative importance of each kind of feature
+FEATURE_WEIGHTS = {
+    'genres': 1.0,
+    'directors': 1.5,
+    'cast': 1.0,
+    'available_languages': 0.3,
+    'startYear': 0.5,
+    'runtimeMinutes': 0.3,
+}
+
+# Numeric columns become one categorical feature per bucket of this width
+BUCKET_WIDTHS = {'startYear': 5, 'runtimeMinutes': 30}
+
+
+def _bucket_postings(values, width):
+    """Posting lists (offsets, rows) of a numeric column cut into buckets; NaNs get none."""
+    values = np.asarray(values, dtype=float)
+    rows = np.flatnonzero(~np.isnan(values))
+    if len(rows) == 0:
+        return np.zeros(1, dtype=np.int64), rows.astype(np.int32)
+    buckets = (values[rows] // width).astype(np.int64)
+    buckets -= buckets.min()
+    order = np.argsort(buckets, kind='stable')
+    offsets = np.zeros(buckets.max() + 2, dtype=np.int64)
+    np.cumsum(np.bincount(buckets, minlength=len(offsets) - 1), out=offsets[1:])
+    return offsets, rows[order].astype(np.int32)
+
+
+class SimilarityIndex:
+    """L2-normalized TF-IDF title vectors, stored column- and row-major."""
+
+    def __init__(self, offsets, rows, weights, row_offsets, row_features, norms):
+        self.offsets = offsets            # feature -> slice of `rows`
+        self.rows = rows                  # row ids per feature, sorted
+        self.weights = weights            # column weight * idf, per feature
+        self.row_offsets = row_offsets    # row -> slice of `row_features`
+        self.row_features = row_features  # feature ids per row
+        self.norms = norms                # L2 norm of each row's unnormalized vector
+        self.num_rows = len(norms)
+
+    @classmethod
+    def build(cls, df, filter_index=None, feature_weights=FEATURE_WEIGHTS):
+        """
+        Builds the vectors for `df`. Passing the FilterIndex of the same catalog
+        reuses its posting lists instead of indexing the list columns again.
+        """
+        num_rows = len(df)
+        blocks = []
+        for name, weight in feature_weights.items():
+            if name in BUCKET_WIDTHS:
+                offsets, rows = _bucket_postings(df[name].to_numpy(dtype=float, na_value=np.nan), BUCKET_WIDTHS[name])
+            else:
+                index = filter_index[name] if filter_index is not None else InvertedIndex.build(df[name])
+                offsets, rows = index.offsets, index.rows
+            blocks.append((offsets, rows, weight))
+
+        offsets = np.zeros(1, dtype=np.int64)
+        weights = []
+        for block_offsets, block_rows, weight in blocks:
+            counts = np.diff(block_offsets)
+            # Smoothed idf, as in scikit-learn's TfidfTransformer
+            weights.append(weight * (np.log((1 + num_rows) / (1 + counts)) + 1))
+            offsets = np.concatenate([offsets, offsets[-1] + block_offsets[1:]])
+        rows = np.concatenate([block_rows for _, block_rows, _ in blocks]).astype(np.int32)
+        weights = np.concatenate(weights)
+
+        features = np.repeat(np.arange(len(weights), dtype=np.int32), np.diff(offsets))
+        norms = np.sqrt(np.bincount(rows, weights=weights[features] ** 2, minlength=num_rows))
+        norms[norms == 0] = 1.0
+
+        # Row-major copy; a stable sort keeps each row's features in ascending order
+        order = np.argsort(rows, kind='stable')
+        row_offsets = np.zeros(num_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_rows), out=row_offsets[1:])
+        return cls(offsets, rows, weights, row_offsets, features[order], norms)
+
+    def features(self, row):
+        """Feature ids of one title."""
+        return self.row_features[self.row_offsets[row]:self.row_offsets[row + 1]]
+
+    def query_vector(self, rows, row_weights=None):
+        """
+        Returns the (feature ids, values) of the normalized sum of the vectors of
+        `rows`, e.g. the titles a user liked. `row_weights` scales each title.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if row_weights is None:
+            row_weights = np.ones(len(rows))
+        positions, owner = csr_slices(self.row_offsets[rows], self.row_offsets[rows + 1])
+        features = self.row_features[positions]
+        values = self.weights[features] * (np.asarray(row_weights, dtype=float) / self.norms[rows])[owner]
+        features, inverse = np.unique(features, return_inverse=True)
+        values = np.bincount(inverse, weights=values, minlength=len(features))
+        norm = np.sqrt(np.dot(values, values))
+        return features, values / norm if norm else values
+
+    def scores(self, features, values):
+        """Cosine similarity of every title with the query vector (features, values)."""
+        scores = np.zeros(self.num_rows)
+        for feature, value in zip(features.tolist(), (values * self.weights[features]).tolist()):
+            # Rows are unique within a posting list, so `scores[rows] += value` would be correct too,
+            # but since numpy 1.25 np.add.at is the faster of the two on long lists (about 2x at 1M titles)
+            np.add.at(scores, self.rows[self.offsets[feature]:self.offsets[feature + 1]], value)
+        scores /= self.norms
+        return scores
+
+    def top_k(self, scores, k, candidates=None, exclude=()):
+        """Ids of the `k` best-scoring rows among `candidates` (all rows if None), best first."""
+        candidate_scores = scores if candidates is None else scores[candidates]
+        if len(exclude):
+            if candidates is None:
+                candidate_scores = candidate_scores.copy()
+                candidate_scores[exclude] = -np.inf
+            else:
+                candidate_scores[np.isin(candidates, exclude)] = -np.inf
+        k = min(k, len(candidate_scores))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        # The k-th best score of a sample is a safe lower bound: at least k titles reach it.
+        # Only the titles above it are partitioned.
+        sample = candidate_scores[::max(len(candidate_scores) // (64 * k), 1)]
+        threshold = np.partition(sample, len(sample) - k)[len(sample) - k] if len(sample) >= k else -np.inf
+        above = np.flatnonzero(candidate_scores >= threshold)
+        best = above[np.argpartition(-candidate_scores[above], k - 1)[:k]]
+        # Highest score first; equal scores in catalog order
+        best = best[np.lexsort((best, -candidate_scores[best]))]
+        best = best[candidate_scores[best] > 0]
+        rows = best if candidates is None else candidates[best]
+        return rows, candidate_scores[best]
+
+    def similar(self, rows, k=10, candidates=None, row_weights=None):
+        """Returns (row ids, similarities) of the `k` titles most like `rows`, leaving `rows` out."""
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        features, values = self.query_vector(rows, row_weights)
+        return self.top_k(self.scores(features, values), k, candidates, exclude=rows)
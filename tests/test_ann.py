@@ -0,0 +1,91 @@
+"""
+The ANN index: its recall against an exact search, and the catalog version it is used for.
+"""
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from ann_index import AnnIndex, build_ann_index, embed_query
+from catalog_store import CatalogSnapshot, CatalogStore, LiveCatalog
+from engine import RecommendationEngine
+from similarity import SimilarityIndex
+from synthetic import synthetic_catalog
+
+NUM_ROWS = 5000
+LISTS = 16
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # The app's store and index paths are relative to its working directory
+    monkeypatch.chdir(tmp_path)
+    store = CatalogStore('catalog')
+    store.write(synthetic_catalog(NUM_ROWS, seed=1))
+    return store
+
+
+def test_index_of_the_served_version_is_used(store):
+    index = build_ann_index(lists=LISTS)
+    assert index.meta['version'] == store.version()
+    engine = RecommendationEngine(LiveCatalog(store))
+    assert engine.indexes().ann is not None
+
+
+def test_index_of_an_older_version_is_skipped(store, capsys):
+    build_ann_index(lists=LISTS)
+    table = synthetic_catalog(NUM_ROWS, seed=1)
+    genres = table.column('genres').to_pylist()
+    genres[0] = ['Documentary']
+    store.write(table.set_column(table.schema.get_field_index('genres'), 'genres', pa.array(genres)))
+    engine = RecommendationEngine(LiveCatalog(store))
+    assert engine.indexes().ann is None
+    assert 'built for another catalog version (1)' in capsys.readouterr().err
+    # Rebuilt, it is used again
+    build_ann_index(lists=LISTS)
+    assert RecommendationEngine(LiveCatalog(store)).indexes().ann is not None
+
+
+@pytest.fixture(scope='module')
+def ann():
+    snapshot = CatalogSnapshot.build(0, synthetic_catalog(10000, seed=2))
+    similarity = SimilarityIndex.build(snapshot.df, snapshot.filter_index)
+    index = AnnIndex.build(similarity, lists=32)
+    # Every title's embedding in catalog row order, for the exact search
+    embeddings = np.empty_like(index.vectors)
+    embeddings[index.ids] = index.vectors
+    rows = np.random.default_rng(0).choice(snapshot.table.num_rows, size=100, replace=False)
+    queries = [embed_query(*similarity.query_vector([row]), index.dims, index.signs, index.meta['dimensions'])
+               for row in rows]
+    return index, embeddings, rows, queries
+
+
+def exact_top(embeddings, query, k, exclude, allowed=None):
+    scores = embeddings @ query
+    scores[exclude] = -np.inf
+    if allowed is not None:
+        scores[~allowed] = -np.inf
+    return set(np.argpartition(-scores, k - 1)[:k].tolist())
+
+
+def recall(ann, nprobe, k=10):
+    index, embeddings, rows, queries = ann
+    return np.mean([len(exact_top(embeddings, query, k, row) & set(index.search(query, k, nprobe, exclude=[row])[0]))
+                    / k for row, query in zip(rows, queries)])
+
+
+def test_recall_grows_with_nprobe(ann):
+    recalls = [recall(ann, nprobe) for nprobe in (1, 4, 8, 32)]
+    assert recalls == sorted(recalls)
+    assert recalls[2] >= 0.7
+    # Probing every cluster is an exact search
+    assert recalls[-1] == 1
+
+
+def test_search_keeps_to_allowed_rows(ann):
+    index, embeddings, rows, queries = ann
+    allowed = np.random.default_rng(1).random(len(embeddings)) < 0.3
+    for row, query in zip(rows[:20], queries[:20]):
+        found, scores = index.search(query, 10, nprobe=32, allowed=allowed, exclude=[row])
+        assert allowed[found].all() and row not in found
+        assert set(found.tolist()) == exact_top(embeddings, query, 10, row, allowed)
+        assert np.all(np.diff(scores) <= 0)
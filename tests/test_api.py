@@ -0,0 +1,98 @@
+"""
+The HTTP API answers every request, whatever its headers and body.
+"""
+import http.client
+import json
+import threading
+
+import pytest
+
+from api import ApiServer
+from catalog_store import CatalogSnapshot
+from engine import RecommendationEngine
+from synthetic import synthetic_catalog
+from test_filters import FixedCatalog
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    snapshot = CatalogSnapshot.build(0, synthetic_catalog(2000, seed=1))
+    engine = RecommendationEngine(FixedCatalog(snapshot), ann_path=str(tmp_path_factory.mktemp('no-ann')))
+    server = ApiServer(('127.0.0.1', 0), engine)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, path, body, headers=None):
+    """POSTs `body` with exactly the given headers (a Content-Length only if they have one)."""
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+    connection.putrequest('POST', path)
+    for name, value in ({'Content-Length': str(len(body))} if headers is None else headers).items():
+        connection.putheader(name, value)
+    connection.endheaders(body)
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+def test_recommendations(server):
+    status, result = post(server, '/recommendations', json.dumps({'limit': 3}).encode())
+    assert status == 200
+    assert len(result['titles']) == 3
+
+
+def test_pages_follow_each_other(server):
+    request = {'filters': {'genres': ['Drama']}, 'limit': 50}
+    status, first = post(server, '/recommendations', json.dumps(request).encode())
+    assert status == 200 and first['next_cursor']
+    status, second = post(server, '/recommendations', json.dumps(dict(request, cursor=first['next_cursor'])).encode())
+    assert status == 200
+    tconsts = [title['tconst'] for title in first['titles'] + second['titles']]
+    assert len(set(tconsts)) == 100
+
+
+def test_cursor_of_another_selection_is_rejected(server):
+    status, first = post(server, '/recommendations', json.dumps({'limit': 5}).encode())
+    other = {'filters': {'genres': ['Drama']}, 'cursor': first['next_cursor']}
+    status, result = post(server, '/recommendations', json.dumps(other).encode())
+    assert status == 400 and 'different selection' in result['error']
+    status, result = post(server, '/recommendations', json.dumps({'cursor': 'not a cursor'}).encode())
+    assert status == 400 and 'malformed' in result['error']
+
+
+def test_cursor_of_another_version_is_a_conflict(server, monkeypatch):
+    status, first = post(server, '/recommendations', json.dumps({'limit': 5}).encode())
+    assert first['version'] == 0
+    monkeypatch.setattr(server.engine.catalog, 'snapshot', CatalogSnapshot.build(1, synthetic_catalog(2000, seed=2)))
+    status, result = post(server, '/recommendations', json.dumps({'cursor': first['next_cursor']}).encode())
+    assert status == 409 and 'first page' in result['error']
+    status, result = post(server, '/recommendations', json.dumps({'limit': 5}).encode())
+    assert status == 200 and result['version'] == 1
+
+
+@pytest.mark.parametrize('length', [None, 'abc', '-5', '+5', '1_0'])
+def test_invalid_content_length_is_rejected(server, length):
+    headers = {} if length is None else {'Content-Length': length}
+    status, result = post(server, '/recommendations', b'{}', headers)
+    assert status == 400
+    assert 'Content-Length' in result['error']
+
+
+def test_body_too_large(server):
+    status, _ = post(server, '/recommendations', b'', {'Content-Length': str(1 << 30)})
+    assert status == 413
+
+
+@pytest.mark.parametrize('body', [b'[]', b'{"filters": ["Drama"]}', b'{"limit": "many"}', b'{'])
+def test_malformed_request_is_rejected(server, body):
+    assert post(server, '/recommendations', body)[0] == 400
+
+
+def test_engine_failure_is_answered(server, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('broken')
+    monkeypatch.setattr(server.engine, 'query', fail)
+    assert post(server, '/recommendations', b'{}') == (500, {'error': 'internal server error'})
@@ -0,0 +1,47 @@
+"""
+Catalog refreshes: a snapshot patched from the rows that changed matches one
+built from scratch, over several versions in a row.
+"""
+import numpy as np
+import pyarrow as pa
+
+from catalog import LIST_COLUMNS, encode_table
+from catalog_store import HASH_COLUMN, CatalogSnapshot, CatalogStore
+from synthetic import synthetic_catalog
+
+
+def next_version(table, step):
+    """Drops some titles, edits the lists of others and adds a few with values never seen before."""
+    # The store hashes the rows of a new version itself
+    table = table.drop_columns([HASH_COLUMN])
+    rows = table.to_pylist()
+    rng = np.random.default_rng(step)
+    rows = [row for number, row in enumerate(rows) if number % 97 != step]
+    for number in rng.choice(len(rows), 20, replace=False):
+        rows[number]['cast'] = rows[number]['cast'][:1] + [f'Newcomer {step}']
+        rows[number]['genres'] = []
+    for number in range(5):
+        row = dict(rows[number], tconst=f'tt9{step:03d}{number:03d}', genres=['Drama', f'Genre {step}'])
+        rows.insert(len(rows) // 2, row)
+    schema = pa.schema([pa.field(field.name, pa.list_(pa.string())) if pa.types.is_list(field.type) else field
+                        for field in table.schema])
+    return encode_table(pa.Table.from_pylist(rows, schema=schema))
+
+
+def test_patched_snapshot_matches_a_fresh_build(tmp_path):
+    store = CatalogStore(str(tmp_path / 'catalog'), span=512)
+    store.write(synthetic_catalog(3000, seed=3))
+    snapshot = CatalogSnapshot.build(*store.open())
+    for step in range(1, 4):
+        store.write(next_version(snapshot.table, step))
+        snapshot = snapshot.updated(*store.open())
+        fresh = CatalogSnapshot.build(*store.open())
+        assert snapshot.version == fresh.version
+        for name in LIST_COLUMNS:
+            patched, built = snapshot.filter_index[name], fresh.filter_index[name]
+            assert patched.vocabulary == built.vocabulary
+            assert np.array_equal(patched.offsets, built.offsets) and np.array_equal(patched.rows, built.rows)
+            for value in built.vocabulary[::50] + [f'Newcomer {step}', f'Genre {step}', 'Nobody']:
+                assert np.array_equal(patched.lookup(value), built.lookup(value))
+            assert [snapshot.lists[name][row] for row in range(fresh.table.num_rows)] \
+                == [fresh.lists[name][row] for row in range(fresh.table.num_rows)]
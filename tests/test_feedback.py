@@ -0,0 +1,75 @@
+"""
+FeedbackQueue: every title of a result exactly once, re-ranked only within its window.
+"""
+import numpy as np
+import pytest
+
+from feedback import DIMENSIONS, WINDOW, FeedbackQueue, Preferences
+
+NUM_ROWS = 500
+
+
+@pytest.fixture(scope='module')
+def embeddings():
+    # Two kinds of titles, on opposite sides of the embedding space
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(NUM_ROWS, DIMENSIONS)).astype(np.float32) * 0.1
+    vectors[:, 0] += np.where(np.arange(NUM_ROWS) % 2 == 0, 1, -1)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def walk(queue, result, embed, preferences, choose_kind):
+    """Clicks through the whole queue; returns the rows in the order they were shown."""
+    shown = []
+    while queue.current() is not None:
+        row = queue.current()
+        assert list(queue.upcoming(3))[:1] == [row]
+        shown.append(row)
+        queue.advance(result, embed, preferences, choose_kind(row))
+    return shown
+
+
+def test_without_feedback_the_result_order_is_kept(embeddings):
+    result = np.random.default_rng(1).permutation(NUM_ROWS)
+    preferences = Preferences()
+    queue = FeedbackQueue('key', result, embeddings.__getitem__, preferences)
+    assert queue.upcoming(WINDOW + 10).tolist() == result[:WINDOW].tolist()
+    assert queue.current() == result[0]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_every_title_is_shown_once_and_within_its_window(embeddings, seed):
+    rng = np.random.default_rng(seed)
+    result = rng.permutation(NUM_ROWS)
+    kinds = ['like', 'skip', 'dislike']
+    preferences = Preferences()
+    queue = FeedbackQueue('key', result, embeddings.__getitem__, preferences)
+    shown = walk(queue, result, embeddings.__getitem__, preferences, lambda row: kinds[rng.integers(3)])
+    assert sorted(shown) == list(range(NUM_ROWS))
+    position = np.empty(NUM_ROWS, dtype=np.int64)
+    position[result] = np.arange(NUM_ROWS)
+    # The n-th title shown comes from the window of result positions [?, n + WINDOW)
+    assert all(position[row] < count + WINDOW for count, row in enumerate(shown))
+    assert preferences.events == NUM_ROWS
+
+
+def test_likes_bring_similar_titles_forward(embeddings):
+    # Alternating kinds in the result; the session likes even rows and dislikes odd ones
+    result = np.arange(NUM_ROWS)
+    preferences = Preferences()
+    queue = FeedbackQueue('key', result, embeddings.__getitem__, preferences)
+    for clicks in range(NUM_ROWS):
+        window = queue.upcoming(WINDOW)
+        if clicks >= 2 and (window % 2 == 0).any():
+            # Whenever the window holds a title of the liked kind, one of those is next
+            assert window[0] % 2 == 0
+        queue.advance(result, embeddings.__getitem__, preferences, 'like' if window[0] % 2 == 0 else 'dislike')
+    assert queue.current() is None
+
+
+def test_choose_prefers_liked_titles(embeddings):
+    preferences = Preferences()
+    rows = np.array([1, 3, 4])
+    assert preferences.choose(rows, embeddings.__getitem__) == 1
+    preferences.record(embeddings[0], 'like')
+    assert preferences.choose(rows, embeddings.__getitem__) == 4
@@ -0,0 +1,143 @@
+"""
+The inverted-index filters against the pandas filters they replaced.
+
+The baseline functions below are the filters main.py ('all') and
+movie_recommendation.py ('any') ran before the indexes, row by row with
+Series.apply. Random selections must give exactly the same titles, best-rated
+first.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from catalog import LIST_COLUMNS, catalog_frame
+from catalog_store import CatalogSnapshot
+from engine import RecommendationEngine
+from filter_index import FilterIndex
+from synthetic import synthetic_catalog
+
+NUM_ROWS = 3000
+SEEDS = range(20)
+
+
+class FixedCatalog:
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def current(self):
+        return self.snapshot
+
+
+def with_missing_values(table, rng):
+    """Nulls some years, runtimes and ratings, as the IMDb data has them."""
+    for name in ['startYear', 'runtimeMinutes', 'weighted_rating']:
+        column = table.column(name).combine_chunks()
+        mask = rng.random(len(column)) < 0.05
+        values = pa.array(column.to_numpy(zero_copy_only=False), type=column.type, mask=mask)
+        table = table.set_column(table.schema.get_field_index(name), name, values)
+    return table
+
+
+@pytest.fixture(scope='module')
+def table():
+    return with_missing_values(synthetic_catalog(NUM_ROWS, seed=1), np.random.default_rng(1))
+
+
+@pytest.fixture(scope='module')
+def frame(table):
+    """The catalog as the baseline held it: one Python list per row and column."""
+    return pd.DataFrame({name: table.column(name).to_pylist() for name in table.column_names})
+
+
+@pytest.fixture(scope='module')
+def engine(table, tmp_path_factory):
+    snapshot = CatalogSnapshot.build(0, table)
+    return RecommendationEngine(FixedCatalog(snapshot), ann_path=str(tmp_path_factory.mktemp('no-ann')))
+
+
+def contains(df, name, values, combine):
+    """Rows whose `name` list holds all (or any) of `values`, with Series.apply as the baseline did."""
+    if not values or df.empty:
+        # apply on an empty column returns an object Series, which pandas takes for column labels
+        return df
+    return df[df[name].apply(lambda x: combine(value in x for value in values)).astype(bool)]
+
+
+def baseline_all(df, languages, genres, cast, directors, include_adult, year, runtime, rating):
+    filtered_df = contains(df, 'available_languages', languages, all)
+    if not include_adult:
+        filtered_df = filtered_df[filtered_df['isAdult'] == 0]
+    for name, (low, high) in [('startYear', year), ('runtimeMinutes', runtime), ('weighted_rating', rating)]:
+        filtered_df = filtered_df[(filtered_df[name] >= low) & (filtered_df[name] <= high)]
+    filtered_df = contains(filtered_df, 'genres', genres, all)
+    filtered_df = contains(filtered_df, 'cast', cast, all)
+    filtered_df = contains(filtered_df, 'directors', directors, all)
+    return filtered_df.sort_values(by='weighted_rating', ascending=False).reset_index(drop=True)
+
+
+def baseline_match(df, selections, combine):
+    for name, values in selections.items():
+        df = contains(df, name, values, combine)
+    return df
+
+
+def random_values(rng, values, most):
+    count = int(rng.integers(0, min(most, len(values)) + 1))
+    return [str(value) for value in rng.choice(values, size=count, replace=False)] if count else []
+
+
+def around(rng, value, spread, default):
+    """A random range around `value`, so the selection usually matches at least the row it came from."""
+    value = default if pd.isna(value) else value
+    return [value - rng.uniform(0, spread), value + rng.uniform(0, spread)]
+
+
+def random_selection(rng, frame):
+    """Values and ranges around one random title, most of which it matches with a few others."""
+    row = frame.iloc[int(rng.integers(len(frame)))]
+    return {
+        'languages': random_values(rng, row['available_languages'], 1),
+        'genres': random_values(rng, row['genres'], 2),
+        'cast': random_values(rng, row['cast'], 1) if rng.random() < 0.3 else [],
+        'directors': random_values(rng, row['directors'], 1) if rng.random() < 0.3 else [],
+        'include_adult': bool(rng.random() < 0.5),
+        'year': around(rng, row['startYear'], 30, 1970),
+        'runtime': around(rng, row['runtimeMinutes'], 60, 120),
+        'rating': around(rng, row['weighted_rating'], 1, 6),
+    }
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_engine_matches_baseline_filters(seed, table, frame, engine):
+    selection = random_selection(np.random.default_rng(seed), frame)
+    expected = baseline_all(frame, **selection)
+    rows = engine.query(selection).rows
+    titles = table.column('tconst').take(pa.array(rows)).to_pylist()
+    assert sorted(titles) == sorted(expected['tconst'])
+    # Equal ratings may come in another order; the ranking itself must hold
+    ratings = table.column('weighted_rating').take(pa.array(rows)).to_numpy(zero_copy_only=False)
+    assert np.all(np.diff(ratings) <= 0)
+
+
+def test_no_list_selection_matches_baseline(table, frame, engine):
+    selection = {'include_adult': True, 'year': [1900, 2100], 'runtime': [0, 1000], 'rating': [0, 10]}
+    expected = baseline_all(frame, [], [], [], [], **selection)
+    assert sorted(table.column('tconst').take(pa.array(engine.query(selection).rows)).to_pylist()) \
+        == sorted(expected['tconst'])
+
+
+@pytest.mark.parametrize('mode', ['all', 'any'])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_filter_index_matches_baseline(seed, mode, table, frame):
+    rng = np.random.default_rng(seed)
+    index = FilterIndex.build(catalog_frame(table), LIST_COLUMNS)
+    row = frame.iloc[int(rng.integers(len(frame)))]
+    selections = {name: random_values(rng, row[name], 3) for name in LIST_COLUMNS}
+    rows = index.match(selections, mode=mode)
+    if not any(selections.values()):
+        assert rows is None
+        return
+    expected = baseline_match(frame, selections, all if mode == 'all' else any)
+    assert rows.tolist() == expected.index.tolist()
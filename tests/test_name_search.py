@@ -0,0 +1,102 @@
+"""
+Name search: accents and case never matter, prefixes find every word of a
+name, and a typo still finds the person through the trigram fallback.
+"""
+import pytest
+
+from filter_index import InvertedIndex
+from name_search import KEY_BYTES, NameSearch, fold
+
+# Each row is a title's cast; a person's title count breaks ties between matches
+CAST = [
+    ['Tom Hanks', 'Penélope Cruz'],
+    ['Tom Hanks', 'Tom Holland'],
+    ['Tom Hanks', 'Chris Evanson'],
+    ['Chris Evanson', 'Zoë Kravitz'],
+    ['Chris Evans', 'Tom Holland'],
+    ['Hank Azaria', 'Björk'],
+    ['Daniel Day-Lewis', 'Michelle Yeoh'],
+    ['Alexander Wolfgang Maximilian Fontaine'],
+]
+# Other people, so the trigrams of a name are rare among all of them, as in a real catalog
+CAST += [[f'Extra {number:03d}'] for number in range(200)]
+
+
+@pytest.fixture(scope='module')
+def search():
+    return NameSearch.build(InvertedIndex.build(CAST))
+
+
+def suggest(search, text, limit=10):
+    return search.names(search.suggest(text, limit))
+
+
+@pytest.mark.parametrize('name, folded', [
+    (' Penélope  CRUZ', 'penelope cruz'),
+    ('Zoë\tKravitz', 'zoe kravitz'),
+    ('BJÖRK', 'bjork'),
+    ('ｔｏｍ', 'tom'),
+])
+def test_fold(name, folded):
+    assert fold(name) == folded
+
+
+@pytest.mark.parametrize('text, name', [
+    ('penelope cruz', 'Penélope Cruz'),
+    ('PENÉLOPE', 'Penélope Cruz'),
+    ('zoe', 'Zoë Kravitz'),
+    ('bjork', 'Björk'),
+])
+def test_accents_and_case_do_not_matter(search, text, name):
+    assert search.names([search.resolve(text)]) == [name]
+
+
+def test_prefix_of_any_word(search):
+    assert suggest(search, 'tom') == ['Tom Hanks', 'Tom Holland']
+    # 'hank' starts Hank Azaria's first word and Tom Hanks' last one; first words come first
+    assert suggest(search, 'hank') == ['Hank Azaria', 'Tom Hanks']
+    assert suggest(search, 'kravitz') == ['Zoë Kravitz']
+    assert suggest(search, 'day-l') == ['Daniel Day-Lewis']
+    # A word is matched from its start only
+    assert not len(search.prefix('anks'))
+
+
+def test_more_titles_rank_first(search):
+    assert suggest(search, 't') == ['Tom Hanks', 'Tom Holland']
+    assert suggest(search, 'chris evans') == ['Chris Evans', 'Chris Evanson']
+    assert suggest(search, 'chris evan') == ['Chris Evanson', 'Chris Evans']
+
+
+def test_exact_name_comes_first(search):
+    # Chris Evanson has more titles, but the query is exactly Chris Evans
+    assert search.names([search.resolve('chris evans')]) == ['Chris Evans']
+
+
+def test_limit(search):
+    assert suggest(search, 'tom', limit=1) == ['Tom Hanks']
+    assert suggest(search, 'h', limit=1) == ['Hank Azaria']
+
+
+def test_query_longer_than_the_keys(search):
+    query = 'alexander wolfgang maximilian'
+    assert len(query) > KEY_BYTES
+    assert suggest(search, query) == ['Alexander Wolfgang Maximilian Fontaine']
+    assert suggest(search, 'alexander wolfgang maximilian fontaine') == ['Alexander Wolfgang Maximilian Fontaine']
+    # Past the key's bytes, the rest of the query is checked against the full name
+    assert not len(search.prefix('alexander wolfgang maximilian dupont'))
+
+
+@pytest.mark.parametrize('text, name', [
+    ('tom hnaks', 'Tom Hanks'),
+    ('michele yeoh', 'Michelle Yeoh'),
+    ('penelop cruz', 'Penélope Cruz'),
+    ('daniel day lewis', 'Daniel Day-Lewis'),
+])
+def test_typos_find_the_person(search, text, name):
+    assert not len(search.prefix(fold(text)))
+    assert search.names([search.resolve(text)]) == [name]
+
+
+def test_nothing_matches(search):
+    assert search.resolve('') is None
+    assert search.resolve('qqqqqq') is None
@@ -0,0 +1,45 @@
+"""
+The poster store's running byte total against a full count of its images.
+"""
+import random
+import sqlite3
+
+from poster_store import IMAGE_BYTES, MISSING, PosterStore
+
+
+def counted(store):
+    with sqlite3.connect(f'{store.root}/index.sqlite') as db:
+        return db.execute(IMAGE_BYTES).fetchone()[0]
+
+
+def test_total_follows_puts_replacements_and_evictions(tmp_path):
+    store = PosterStore(str(tmp_path), max_bytes=20_000)
+    rng = random.Random(0)
+    # Few distinct images, so titles often share one, and few titles, so entries are often replaced
+    images = [bytes([number]) * rng.randint(100, 2000) for number in range(30)]
+    for _ in range(500):
+        imdb_id = f'tt{rng.randrange(60):07d}'
+        store.put(imdb_id, None if rng.random() < 0.1 else rng.choice(images))
+        assert store.size() == counted(store)
+        assert store.size() <= store.max_bytes
+    assert store.evict(target=0) > 0
+    assert store.size() == counted(store) == 0
+
+
+def test_total_of_an_existing_cache_is_counted_once(tmp_path):
+    store = PosterStore(str(tmp_path))
+    store.put('tt0000001', b'a' * 100)
+    store.put('tt0000002', b'a' * 100)
+    store.put('tt0000003', b'b' * 50)
+    with sqlite3.connect(f'{tmp_path}/index.sqlite') as db:
+        db.execute('DROP TABLE totals')
+    assert PosterStore(str(tmp_path)).size() == 150
+
+
+def test_get_after_put(tmp_path):
+    store = PosterStore(str(tmp_path))
+    store.put('tt0000001', b'poster')
+    store.put('tt0000002', None)
+    assert store.get('tt0000001') == b'poster'
+    assert store.get('tt0000002') is None
+    assert store.get('tt0000003') is MISSING
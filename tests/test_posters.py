@@ -0,0 +1,126 @@
+"""
+Poster fetching and prefetching against the local OMDb stub.
+
+Every title the stub knows has a poster except each tenth one (OMDb's 'N/A'),
+and it counts the requests it serves, so each test can tell which posters
+came from the network and which from memory or the store.
+"""
+from concurrent.futures import CancelledError
+
+import pytest
+
+from api_client import ApiClient
+from poster_store import PosterStore
+from posters import PosterFetcher, PosterPrefetcher, fetch_poster
+from stub_api import _poster_bytes, start_stub_server
+
+WITH_POSTERS = [f'tt{number:07d}' for number in range(1, 10)]
+WITHOUT_POSTER = 'tt0000010'
+
+
+@pytest.fixture
+def stub():
+    server, base_url = start_stub_server()
+    yield server, base_url
+    server.shutdown()
+    server.server_close()
+
+
+def make_fetcher(base_url, poster_urls=None, store=None, max_workers=8):
+    client = ApiClient(rate_limits={}, default_rate=(1e9, 1e9), attempts=1)
+    return PosterFetcher(
+        lambda imdb_id, is_cancelled: fetch_poster(imdb_id, 'test', client, omdb_url=base_url + '/omdb/',
+                                                   is_cancelled=is_cancelled, poster_urls=poster_urls),
+        max_workers=max_workers, store=store)
+
+
+def test_prefetched_posters_are_served_without_requests(stub):
+    server, base_url = stub
+    fetcher = make_fetcher(base_url)
+    prefetcher = PosterPrefetcher(fetcher, lookahead=5)
+    prefetcher.follow('filters', WITH_POSTERS)
+    for future, _ in prefetcher._pending:
+        future.result(timeout=5)
+    # The current title and the next five: an OMDb lookup and an image each
+    assert server.requests == 12
+    for imdb_id in WITH_POSTERS[:6]:
+        assert fetcher.get(imdb_id, timeout=5) == _poster_bytes(imdb_id)
+    assert server.requests == 12
+    # Beyond the lookahead, nothing was fetched
+    assert fetcher.get(WITH_POSTERS[6], timeout=5) == _poster_bytes(WITH_POSTERS[6])
+    assert server.requests == 14
+    fetcher.shutdown()
+
+
+def test_title_without_poster_is_remembered(stub):
+    server, base_url = stub
+    fetcher = make_fetcher(base_url)
+    assert fetcher.get(WITHOUT_POSTER, timeout=5) is None
+    # Only the OMDb lookup, and the answer is kept like a poster is
+    assert server.requests == 1
+    assert fetcher.get(WITHOUT_POSTER, timeout=5) is None
+    assert server.requests == 1
+    fetcher.shutdown()
+
+
+def test_store_serves_a_new_fetcher(stub, tmp_path):
+    server, base_url = stub
+    first = make_fetcher(base_url, store=PosterStore(str(tmp_path)))
+    assert list(first.resolve(WITH_POSTERS[:3] + [WITHOUT_POSTER], timeout=5)) \
+        == [(imdb_id, _poster_bytes(imdb_id)) for imdb_id in WITH_POSTERS[:3]] + [(WITHOUT_POSTER, None)]
+    first.shutdown()
+    requests_served = server.requests
+    # Another worker process, with the same store on disk
+    second = make_fetcher(base_url, store=PosterStore(str(tmp_path)))
+    assert second.get(WITH_POSTERS[0], timeout=5) == _poster_bytes(WITH_POSTERS[0])
+    assert second.get(WITHOUT_POSTER, timeout=5) is None
+    assert server.requests == requests_served
+    second.shutdown()
+
+
+def test_failed_fetch_returns_none_and_is_retried(stub):
+    server, base_url = stub
+    imdb_id = WITH_POSTERS[0]
+    # The image URL 404s, as a poster CDN does for a removed image
+    poster_urls = {imdb_id: base_url + '/removed.jpg'}
+    fetcher = make_fetcher(base_url, poster_urls=poster_urls)
+    assert fetcher.get(imdb_id, timeout=5) is None
+    # A failure is not kept: the next request tries again
+    poster_urls[imdb_id] = f'{base_url}/posters/{imdb_id}.jpg'
+    assert fetcher.get(imdb_id, timeout=5) == _poster_bytes(imdb_id)
+    assert server.requests == 2
+    fetcher.shutdown()
+
+
+def test_unreachable_api_returns_none(stub):
+    server, base_url = stub
+    server.shutdown()
+    server.server_close()
+    fetcher = make_fetcher(base_url)
+    assert fetcher.get(WITH_POSTERS[0], timeout=5) is None
+    assert list(fetcher.resolve(WITH_POSTERS[:2], timeout=5)) == [(imdb_id, None) for imdb_id in WITH_POSTERS[:2]]
+    fetcher.shutdown()
+
+
+def test_slow_fetch_times_out(stub):
+    server, base_url = stub
+    server.latency = 0.5
+    fetcher = make_fetcher(base_url)
+    assert fetcher.get(WITH_POSTERS[0], timeout=0.05) is None
+    fetcher.shutdown()
+
+
+def test_new_filters_cancel_pending_prefetches(stub):
+    server, base_url = stub
+    server.latency = 0.2
+    fetcher = make_fetcher(base_url, max_workers=2)
+    prefetcher = PosterPrefetcher(fetcher, lookahead=5)
+    prefetcher.follow('old filters', WITH_POSTERS)
+    futures = [fetcher.submit(imdb_id)[0] for imdb_id in WITH_POSTERS[:6]]
+    prefetcher.follow('new filters', [])
+    for future in futures:
+        with pytest.raises(CancelledError):
+            future.result(timeout=5)
+    # At most the OMDb lookups of the two fetches already running, and no image
+    assert server.requests <= 2
+    fetcher.shutdown()
@@ -0,0 +1,85 @@
+"""
+The sorted range indexes against the pandas range filters they replaced.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from query import NUMERIC_COLUMNS, CatalogQuery, RangeIndex
+
+NUM_ROWS = 5000
+SEEDS = range(20)
+
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        # Few distinct values, so ranges end on ties
+        'startYear': rng.integers(1920, 2025, NUM_ROWS).astype(float),
+        'runtimeMinutes': rng.integers(60, 200, NUM_ROWS).astype(float),
+        'weighted_rating': np.round(rng.uniform(1, 10, NUM_ROWS), 1),
+        'isAdult': (rng.random(NUM_ROWS) < 0.05).astype(np.int8),
+    })
+    for name in ['startYear', 'runtimeMinutes', 'weighted_rating']:
+        df.loc[rng.random(NUM_ROWS) < 0.05, name] = np.nan
+    return df
+
+
+def random_range(rng, values):
+    low, high = np.sort(rng.choice(values[~np.isnan(values)], 2))
+    return float(low), float(high)
+
+
+def baseline(df, ranges, candidates=None):
+    """Row ids as the pandas filters selected them, best-rated first and ties in catalog order."""
+    filtered_df = df if candidates is None else df.iloc[candidates]
+    for name, (low, high) in ranges.items():
+        filtered_df = filtered_df[(filtered_df[name] >= low) & (filtered_df[name] <= high)]
+    return filtered_df.sort_values('weighted_rating', ascending=False, kind='stable').index.to_numpy()
+
+
+@pytest.mark.parametrize('name', NUMERIC_COLUMNS)
+def test_range_index_select(df, name):
+    index = RangeIndex(df[name])
+    values = df[name].to_numpy(dtype=float)
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        low, high = random_range(rng, values)
+        expected = np.flatnonzero((values >= low) & (values <= high))
+        rows = index.select(low, high)
+        assert sorted(rows) == list(expected)
+        assert np.all(np.diff(values[rows]) >= 0)
+        assert index.count(low, high) == len(expected)
+        assert list(index.contains(np.arange(NUM_ROWS), low, high)) == list((values >= low) & (values <= high))
+    assert index.limits() == (np.nanmin(values), np.nanmax(values))
+    # NaNs never match, so even the full range does not cover a column that has them
+    assert index.covers_all(*index.limits()) == (not np.isnan(values).any())
+
+
+def test_range_index_empty_range(df):
+    index = RangeIndex(df['startYear'])
+    assert len(index.select(2030, 2040)) == 0
+    assert len(index.select(2000, 1990)) == 0
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_catalog_query_matches_baseline(df, seed):
+    query = CatalogQuery.build(df)
+    rng = np.random.default_rng(seed)
+    names = rng.choice(NUMERIC_COLUMNS, size=int(rng.integers(1, len(NUMERIC_COLUMNS) + 1)), replace=False)
+    ranges = {name: random_range(rng, df[name].to_numpy(dtype=float)) for name in names}
+    candidates = None
+    if rng.random() < 0.5:
+        candidates = np.sort(rng.choice(NUM_ROWS, size=int(rng.integers(1, NUM_ROWS)), replace=False))
+    assert list(query.run(candidates, ranges)) == list(baseline(df, ranges, candidates))
+
+
+def test_catalog_query_without_conditions(df):
+    query = CatalogQuery.build(df)
+    # Unrated rows go last, in catalog order
+    expected = df.sort_values('weighted_rating', ascending=False, kind='stable', na_position='last').index
+    assert list(query.run()) == list(expected)
+    assert list(query.run(None, {'startYear': None})) == list(expected)
+    candidates = np.arange(0, NUM_ROWS, 7)
+    assert list(query.run(candidates)) == [row for row in expected if row % 7 == 0]
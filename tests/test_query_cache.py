@@ -0,0 +1,96 @@
+"""
+QueryCache: hits and misses, LRU eviction by bytes and expiry.
+"""
+import time
+
+import numpy as np
+import pytest
+
+from query_cache import QueryCache, filter_key
+
+ROW_BYTES = 400
+
+
+def rows():
+    return np.zeros(ROW_BYTES // 4, dtype=np.int32)
+
+
+class Computations:
+    """compute() functions that count their calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, value):
+        def compute():
+            self.calls.append(value)
+            return rows()
+        return compute
+
+
+def test_hits_and_misses():
+    cache, compute = QueryCache(), Computations()
+    first = cache.get('a', compute(1))
+    assert cache.get('a', compute(2)) is first
+    cache.get('b', compute(3))
+    assert compute.calls == [1, 3]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries'], stats['bytes']) == (1, 2, 2, 2 * ROW_BYTES)
+    assert stats['hit_rate'] == pytest.approx(1 / 3)
+
+
+def test_results_are_read_only():
+    result = QueryCache().get('a', rows)
+    with pytest.raises(ValueError):
+        result[0] = 2
+
+
+def test_least_recently_used_is_evicted_first():
+    cache, compute = QueryCache(max_bytes=3 * ROW_BYTES), Computations()
+    for key in 'abc':
+        cache.get(key, compute(key))
+    cache.get('a', compute('a'))
+    cache.get('d', compute('d'))
+    assert cache.stats()['bytes'] == 3 * ROW_BYTES
+    # 'b' was used least recently, so only it is computed again
+    for key in 'acd':
+        cache.get(key, compute(key))
+    cache.get('b', compute('b'))
+    assert compute.calls == ['a', 'b', 'c', 'd', 'b']
+
+
+def test_result_larger_than_the_budget_is_served_uncached():
+    cache, compute = QueryCache(max_bytes=ROW_BYTES // 2), Computations()
+    assert len(cache.get('a', compute('a'))) == ROW_BYTES // 4
+    cache.get('a', compute('a'))
+    assert compute.calls == ['a', 'a']
+    assert cache.stats()['entries'] == 0
+
+
+def test_results_expire():
+    cache, compute = QueryCache(ttl=0.05), Computations()
+    cache.get('a', compute('a'))
+    cache.get('a', compute('a'))
+    time.sleep(0.1)
+    cache.get('a', compute('a'))
+    assert compute.calls == ['a', 'a']
+    assert cache.stats()['misses'] == 2
+
+
+def test_clear():
+    cache, compute = QueryCache(), Computations()
+    cache.get('a', compute('a'))
+    cache.clear()
+    cache.get('a', compute('a'))
+    assert compute.calls == ['a', 'a']
+
+
+def test_equivalent_selections_share_a_key():
+    limits = {'startYear': (1920, 2024), 'runtimeMinutes': (60, 200)}
+    key = filter_key({'genres': ['Drama', 'Comedy', 'Drama'], 'cast': []},
+                     {'startYear': (1900, 2030), 'runtimeMinutes': None}, limits)
+    assert key == filter_key({'genres': ['Comedy', 'Drama']},
+                             {'runtimeMinutes': None, 'startYear': (1920, 2024)}, limits)
+    assert key != filter_key({'genres': ['Comedy']}, {'startYear': (1920, 2024), 'runtimeMinutes': None}, limits)
+    assert key != filter_key({'genres': ['Comedy', 'Drama']},
+                             {'startYear': (1950, 2024), 'runtimeMinutes': None}, limits)
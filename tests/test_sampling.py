@@ -0,0 +1,112 @@
+"""
+Row sampling: a session never sees a title twice and sees every matching
+title before the draws run out, for uniform and rating-weighted draws.
+"""
+import numpy as np
+import pytest
+
+from sampling import RowSampler, SeenRows
+
+NUM_ROWS = 1000
+
+
+@pytest.fixture
+def rows():
+    # A filter result: every third catalog row
+    return np.arange(0, NUM_ROWS, 3)
+
+
+def weights_for(kind):
+    if kind == 'uniform':
+        return None
+    weights = np.random.default_rng(0).random(NUM_ROWS)
+    # Some rows without a usable rating
+    weights[::7] = np.nan
+    weights[::11] = 0
+    return weights
+
+
+@pytest.mark.parametrize('kind', ['uniform', 'weighted'])
+@pytest.mark.parametrize('count', [1, 4])
+def test_session_sees_every_row_once(rows, kind, count):
+    sampler = RowSampler(rows, weights_for(kind))
+    seen = SeenRows(NUM_ROWS)
+    rng = np.random.default_rng(1)
+    shown = []
+    while True:
+        drawn = sampler.sample(count, rng, seen)
+        if not len(drawn):
+            break
+        assert len(drawn) == min(count, len(rows) - len(shown))
+        assert not seen.contains(drawn).any()
+        seen.add(drawn)
+        shown.extend(drawn.tolist())
+    assert len(shown) == len(set(shown))
+    assert sorted(shown) == rows.tolist()
+    assert sampler.draw(rng, seen) is None
+
+
+def test_sample_has_no_repeats(rows):
+    sampler = RowSampler(rows, weights_for('weighted'))
+    rng = np.random.default_rng(2)
+    for k in (1, 10, len(rows) - 1, len(rows), len(rows) + 5):
+        drawn = sampler.sample(k, rng)
+        assert len(drawn) == min(k, len(rows)) == len(set(drawn.tolist()))
+        assert np.isin(drawn, rows).all()
+
+
+def test_rows_without_weight_come_last(rows):
+    weights = weights_for('weighted')
+    sampler = RowSampler(rows, weights)
+    seen = SeenRows(NUM_ROWS)
+    rng = np.random.default_rng(3)
+    shown = []
+    while (row := sampler.draw(rng, seen)) is not None:
+        seen.add(row)
+        shown.append(row)
+    positive = np.nan_to_num(weights[shown]) > 0
+    assert positive[:positive.sum()].all() and not positive[positive.sum():].any()
+
+
+def test_weighted_draws_favor_heavy_rows():
+    weights = np.array([1.0, 1.0, 8.0, 0.0])
+    sampler = RowSampler(np.arange(4), weights)
+    rng = np.random.default_rng(4)
+    counts = np.bincount([sampler.draw(rng) for _ in range(4000)], minlength=4)
+    assert counts[3] == 0
+    assert np.allclose(counts[:3] / 4000, [0.1, 0.1, 0.8], atol=0.03)
+    # The same holds for draws from the unseen rows once most were seen
+    seen = SeenRows(1000)
+    seen.add(np.arange(4, 1000))
+    sampler = RowSampler(np.arange(1000), np.r_[weights, np.ones(996)])
+    counts = np.bincount([sampler.draw(rng, seen) for _ in range(4000)], minlength=4)
+    assert np.allclose(counts[:4] / 4000, [0.1, 0.1, 0.8, 0], atol=0.03)
+
+
+@pytest.mark.parametrize('kind', ['uniform', 'weighted'])
+def test_rows_seen_elsewhere_are_skipped(rows, kind):
+    sampler = RowSampler(rows, weights_for(kind))
+    seen = SeenRows(NUM_ROWS)
+    seen.add(rows[:-10])
+    rng = np.random.default_rng(5)
+    assert set(sampler.sample(3, rng, seen).tolist()) <= set(rows[-10:].tolist())
+    # Marked seen by someone else after the sampler took stock of the unseen rows
+    seen.add(rows[-10:-2])
+    assert sorted(sampler.sample(10, rng, seen).tolist()) == rows[-2:].tolist()
+
+
+@pytest.mark.parametrize('kind', ['uniform', 'weighted'])
+def test_cleared_session_starts_over(rows, kind):
+    sampler = RowSampler(rows, weights_for(kind))
+    seen = SeenRows(NUM_ROWS)
+    seen.add(rows)
+    rng = np.random.default_rng(6)
+    assert not len(sampler.sample(5, rng, seen))
+    seen.clear()
+    assert len(sampler.sample(len(rows), rng, seen)) == len(rows)
+
+
+def test_empty_result():
+    sampler = RowSampler(np.empty(0, dtype=np.int64), np.ones(NUM_ROWS))
+    assert not len(sampler.sample(3, np.random.default_rng(7)))
+    assert sampler.draw(np.random.default_rng(7), SeenRows(NUM_ROWS)) is None
@@ -0,0 +1,60 @@
+"""
+Thumbnails from the worker pool, also when a worker dies.
+"""
+import os
+import signal
+import sys
+import types
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import thumbnails
+from thumbnails import THUMBNAIL_WIDTH, ThumbnailPool
+
+
+def jpeg(size):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    # Under Streamlit __main__ is the app script; the workers must not run it again
+    script = tmp_path / 'app.py'
+    script.write_text(f"open({str(tmp_path / 'ran')!r}, 'w').close()\n")
+    main = types.ModuleType('__main__')
+    main.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, '__main__', main)
+    # The fork server finds its worker module in the app's directory, where the app runs
+    monkeypatch.chdir(os.path.dirname(thumbnails.__file__))
+    pool = ThumbnailPool(max_workers=2)
+    yield pool
+    pool.shutdown()
+    assert not (tmp_path / 'ran').exists()
+
+
+def test_thumbnail(pool):
+    thumbnail = Image.open(BytesIO(pool.thumbnail(jpeg((600, 900)))))
+    assert thumbnail.size == (THUMBNAIL_WIDTH, 450)
+
+
+def test_not_an_image(pool):
+    assert pool.thumbnail(b'not an image') is None
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason="needs SIGKILL")
+def test_dead_worker_gives_the_poster_and_a_new_pool(pool):
+    poster = jpeg((600, 900))
+    pool.thumbnail(poster)
+    os.kill(next(iter(pool._executor._processes)), signal.SIGKILL)
+    # The task that finds the pool broken gets the poster unchanged
+    assert poster in (pool.thumbnail(poster) for _ in range(10))
+    assert Image.open(BytesIO(pool.thumbnail(poster))).width == THUMBNAIL_WIDTH
+
+
+def test_shut_down_pool_gives_the_poster(pool):
+    pool.shutdown()
+    assert pool.thumbnail(b'poster') == b'poster'
@@ -0,0 +1,126 @@
+"""
+Title search: BM25 scores and ranking on a small corpus, checked against a
+plain per-title computation of the same formula.
+"""
+import math
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+import title_search
+from title_search import B, K1, TitleSearch, tokenize
+
+TITLES = [
+    ('The Godfather', 'The Godfather'),
+    ('The Godfather Part II', 'The Godfather Part II'),
+    ('Godfather of Harlem', 'Godfather of Harlem'),
+    ('The Dark Knight', 'The Dark Knight'),
+    ('Dark', 'Dark'),
+    ('Amélie', "Le Fabuleux Destin d'Amélie Poulain"),
+    ('Spirited Away', 'Sen to Chihiro no Kamikakushi'),
+    ('Knight and Day', 'Knight and Day'),
+    ('The Good, the Bad and the Ugly', 'Il buono, il brutto, il cattivo'),
+    ('Goodfellas', 'Goodfellas'),
+    ('Dark Dark Dark', 'Dark Dark Dark'),
+    ('Harlem Nights', 'Harlem Nights'),
+]
+
+
+@pytest.fixture(scope='module')
+def search():
+    titles, originals = zip(*TITLES)
+    return TitleSearch.build(pa.table({'title': list(titles), 'originalTitle': list(originals)}))
+
+
+def documents():
+    return [tokenize(f'{title} {original}') for title, original in TITLES]
+
+
+def bm25(words, prefix=None):
+    """Every title's BM25 score for `words`, plus its best word starting with `prefix`."""
+    docs = documents()
+    average = sum(map(len, docs)) / len(docs)
+
+    def score(doc, word):
+        count = sum(word in other for other in docs)
+        idf = math.log(1 + (len(docs) - count + 0.5) / (count + 0.5))
+        frequency = doc.count(word)
+        return idf * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * len(doc) / average))
+
+    scores = []
+    for doc in docs:
+        total = sum(score(doc, word) for word in set(words))
+        if prefix is not None:
+            total += max([score(doc, word) for word in set(doc) if word.startswith(prefix)], default=0)
+        scores.append(total)
+    return np.array(scores)
+
+
+@pytest.fixture(params=['dense', 'sparse'])
+def path(request, monkeypatch):
+    # Both ways of scoring must agree; the fraction decides which one a query takes
+    monkeypatch.setattr(title_search, 'SPARSE_FRACTION', 0 if request.param == 'sparse' else 10 ** 9)
+    return request.param
+
+
+@pytest.mark.parametrize('query, words, prefix', [
+    ('godfather ', ['godfather'], None),
+    ('dark knight ', ['dark', 'knight'], None),
+    ('the good ', ['the', 'good'], None),
+    ('AMELIE ', ['amelie'], None),
+    ('harlem nig', ['harlem'], 'nig'),
+    ('go', [], 'go'),
+])
+def test_scores_match_bm25(search, query, words, prefix):
+    assert np.allclose(search.scores(query), bm25(words, prefix), rtol=1e-5)
+
+
+@pytest.mark.parametrize('query', ['godfather ', 'dark knight ', 'the good ', 'harlem nig', 'go', 'kni'])
+def test_search_ranks_by_score(search, path, query):
+    expected = search.scores(query)
+    rows, scores = search.search(query, k=5)
+    assert np.allclose(scores, expected[rows])
+    assert np.all(np.diff(scores) <= 0)
+    # The best five, or every title that matches at all
+    assert len(rows) == min(5, np.count_nonzero(expected))
+    assert scores[-1] >= np.sort(expected)[-len(rows)] - 1e-6
+
+
+def test_ranking(search, path):
+    rows, _ = search.search('dark ', k=10)
+    # Repeating the word counts, with diminishing returns; a short title beats a longer one
+    assert rows[:3].tolist() == [10, 4, 3]
+    rows, _ = search.search('godfather ', k=10)
+    # The two-word title (both columns) beats the longer ones with the same word
+    assert rows[0] == 0 and set(rows.tolist()) == {0, 1, 2}
+
+
+def test_last_word_is_a_prefix(search, path):
+    assert set(search.search('godf', k=10)[0].tolist()) == {0, 1, 2}
+    assert set(search.search('good', k=10)[0].tolist()) == {8, 9}
+    # A trailing space ends the word: only titles with the whole word 'good'
+    assert search.search('good ', k=10)[0].tolist() == [8]
+
+
+def test_allowed_mask(search, path):
+    allowed = np.zeros(len(TITLES), dtype=bool)
+    allowed[[1, 2, 5]] = True
+    rows, scores = search.search('godfather ', k=10, allowed=allowed)
+    expected = search.scores('godfather ')
+    assert set(rows.tolist()) == {1, 2}
+    assert np.allclose(scores, expected[rows])
+
+
+def test_ties_follow_rank(search, path):
+    # Equal titles score the same; row order, or the given rank, decides
+    twins = TitleSearch.build(pa.table({'title': ['Heat', 'Heat', 'Heat', 'Ronin']}))
+    assert twins.search('heat ', k=3)[0].tolist() == [0, 1, 2]
+    rank = np.array([2, 0, 1, 3])
+    assert twins.search('heat ', k=2, rank=rank)[0].tolist() == [1, 2]
+
+
+def test_no_match(search, path):
+    rows, scores = search.search('zzz ', k=5)
+    assert not len(rows) and not len(scores)
+    assert not len(search.search('', k=5)[0])
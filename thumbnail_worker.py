@@ -0,0 +1,26 @@
+"""
+Start-up of the thumbnail worker processes (see thumbnails.py).
+
+The workers are forked from a fork server that preloads this module, so a
+new worker starts with PIL and thumbnails already imported. The app never
+imports it; it only runs in the fork server and the workers forked from it.
+The fork server finds it in its working directory, the app's directory
+(where catalog.arrow is).
+
+multiprocessing re-creates the parent's __main__ in every new worker, by
+running its script again. Under Streamlit that is the app script, and the
+workers only run thumbnails.make_thumbnail, which needs nothing from it.
+The fork server therefore prepares its workers without it.
+"""
+from multiprocessing import spawn
+
+import thumbnails  # noqa: F401
+
+MAIN_KEYS = ('init_main_from_path', 'init_main_from_name')
+
+
+def _prepare_without_main(data, prepare=spawn.prepare):
+    prepare({key: value for key, value in data.items() if key not in MAIN_KEYS})
+
+
+spawn.prepare = _prepare_without_main
@@ -0,0 +1,95 @@
+"""
+Poster thumbnails.
+
+OMDb and TMDB posters are several hundred KB at full resolution, and passing a
+decoded PIL image to st.image means re-encoding it on every rerun. Each poster
+is instead resized and re-encoded once, as a small WebP (JPEG if Pillow lacks
+WebP support), and the thumbnail bytes are what gets cached and sent to the
+browser. The decode/encode work runs in a process pool, so it never competes
+with the Streamlit script thread for the GIL.
+
+The workers are forked from a fork server rather than from the server
+process itself: forking the multithreaded server could copy a lock another
+thread holds into the children. thumbnail_worker.py sets them up.
+"""
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from PIL import Image, UnidentifiedImageError, features
+
+THUMBNAIL_WIDTH = 300
+THUMBNAIL_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+THUMBNAIL_QUALITY = 80
+
+# Names the cache directory, so changing the size or format starts a fresh cache
+THUMBNAIL_VARIANT = f'w{THUMBNAIL_WIDTH}-{THUMBNAIL_FORMAT.lower()}'
+
+
+def make_thumbnail(poster, width=THUMBNAIL_WIDTH, image_format=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY):
+    """Returns `poster` scaled down to `width` pixels wide and re-encoded, or None if it is not an image."""
+    try:
+        image = Image.open(BytesIO(poster))
+        image.draft('RGB', (width, 1))  # lets JPEG decode at reduced size
+        image = image.convert('RGB')
+    except (UnidentifiedImageError, OSError):
+        return None
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def _ignore_interrupts():
+    # Ctrl-C in the server's terminal reaches the workers too; the server shuts them down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class ThumbnailPool:
+    """Process pool that turns poster bytes into thumbnail bytes."""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        if 'forkserver' not in multiprocessing.get_all_start_methods():
+            # Spawned workers would run the app script again; without a fork server (Windows),
+            # thumbnails are made on the calling thread
+            return None
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['thumbnail_worker'])
+        # Workers are started as tasks arrive, each a quick fork of the preloaded fork server
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                   initializer=_ignore_interrupts)
+
+    def thumbnail(self, poster, timeout=30):
+        """
+        Returns the thumbnail bytes for `poster`, computed in a worker process.
+        If the pool is broken or shut down, returns `poster` as it is.
+        """
+        executor = self._executor
+        if executor is None:
+            return make_thumbnail(poster)
+        try:
+            return executor.submit(make_thumbnail, poster).result(timeout=timeout)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory, possibly by this very poster). The next
+            # posters go to a new pool; this one is shown full size rather than not at all.
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = self._new_executor()
+            return poster
+        except RuntimeError:
+            # The pool was shut down
+            return poster
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
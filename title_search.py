@@ -0,0 +1,212 @@
+"""
+Full-text search over movie titles, ranked with BM25.
+
+Titles are folded like people's names (no accents, lower case) and split into
+words on anything that is not a letter or a digit. The index is CSR again:
+one sorted array of the distinct words, and for each word the rows that
+contain it. Instead of term frequencies it stores each posting's final BM25
+contribution (float32). A query therefore adds up one precomputed slice per
+word, the same way the similarity engine scores features. Queries made of
+rare words only sort and sum their few postings; ones with common words
+accumulate into a dense score array instead.
+
+The last word of a query is also matched as a prefix, so results show up
+while it is still being typed. An optional mask limits the results to the
+rows that pass the sidebar filters.
+"""
+import re
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from name_search import fold, fold_array, prefix_end
+
+# Columns indexed when the catalog has them; a title's words from all of them count as one document
+TITLE_COLUMNS = ['title', 'originalTitle']
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Most frequent words a trailing prefix expands to
+PREFIX_TERMS = 32
+
+# Queries whose postings cover less than 1/SPARSE_FRACTION of the titles are scored sparsely
+SPARSE_FRACTION = 8
+
+WORD_SPLIT = r'[^\p{L}\p{N}]+'
+
+
+def tokenize(text):
+    """The folded words of a query, split like the indexed titles."""
+    return [word for word in re.split(r'[\W_]+', fold(text)) if word]
+
+
+def _words(titles):
+    """(row ids, words) of every word of an Arrow string array of titles."""
+    words = pc.split_pattern_regex(fold_array(titles), WORD_SPLIT)
+    lengths = pc.fill_null(pc.list_value_length(words), 0).to_numpy(zero_copy_only=False)
+    rows = np.repeat(np.arange(len(titles), dtype=np.int64), lengths)
+    words = pc.list_flatten(words)
+    keep = pc.greater(pc.utf8_length(words), 0).to_numpy(zero_copy_only=False)
+    return rows[keep], words.filter(pa.array(keep))
+
+
+class TitleSearch:
+    """BM25 postings over the words of the catalog titles."""
+
+    def __init__(self, terms, offsets, rows, impacts, num_rows):
+        self.terms = terms      # sorted distinct words, UTF-8 bytes
+        self.offsets = offsets  # word -> slice of rows/impacts
+        self.rows = rows        # row ids per word, ascending
+        self.impacts = impacts  # BM25 score each posting adds
+        self.num_rows = num_rows
+
+    @classmethod
+    def build(cls, table, columns=TITLE_COLUMNS, k1=K1, b=B):
+        """Indexes the title columns of a catalog table."""
+        num_rows = table.num_rows
+        parts = [_words(table.column(name).combine_chunks()) for name in columns if name in table.column_names]
+        rows = np.concatenate([part[0] for part in parts])
+        words = pc.dictionary_encode(pa.concat_arrays([part[1] for part in parts]))
+        # Number the distinct words in byte order, so a prefix is one searchsorted range
+        dictionary = words.dictionary
+        order = pc.array_sort_indices(dictionary).to_numpy()
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        codes = rank[words.indices.to_numpy(zero_copy_only=False)]
+
+        # Sorting by (word, row) groups the postings and counts repeated words in a title
+        width = max(num_rows, 1)
+        keys = np.sort(codes * width + rows)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=np.int64)
+        frequencies = np.diff(np.append(starts, len(keys)))
+        keys = keys[starts]
+        term_ids, rows = keys // width, (keys % width).astype(np.int32)
+
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(order)), out=offsets[1:])
+        documents = np.diff(offsets)
+        idf = np.log(1 + (num_rows - documents + 0.5) / (documents + 0.5))
+        lengths = np.bincount(rows, weights=frequencies, minlength=num_rows)
+        average = lengths.mean() if num_rows else 1.0
+        impacts = idf[term_ids] * frequencies * (k1 + 1) / (frequencies + k1 * (1 - b + b * lengths[rows] / average))
+
+        terms = np.array([term.encode() for term in dictionary.take(pa.array(order)).to_pylist()], dtype=bytes)
+        return cls(terms, offsets, rows, impacts.astype(np.float32), num_rows)
+
+    def _range(self, word, prefix=False):
+        """[start, stop) of the terms equal to `word`, or starting with it if `prefix`."""
+        key = word.encode()
+        start = int(np.searchsorted(self.terms, key))
+        if not prefix:
+            found = start < len(self.terms) and self.terms[start] == key
+            return start, start + 1 if found else start
+        return start, int(np.searchsorted(self.terms, prefix_end(key)))
+
+    def _postings(self, term):
+        return slice(self.offsets[term], self.offsets[term + 1])
+
+    def _terms(self, text):
+        """(exact term ids, prefix completion term ids) of the query `text`."""
+        words = tokenize(text)
+        exact = words if text[-1:].isspace() else words[:-1]
+        exact = sorted({start for start, stop in map(self._range, exact) if stop > start})
+        if len(exact) == len(words):
+            return exact, []
+        start, stop = self._range(words[-1], prefix=True)
+        completions = np.arange(start, stop)
+        if len(completions) > PREFIX_TERMS:
+            documents = self.offsets[completions + 1] - self.offsets[completions]
+            completions = completions[np.argpartition(-documents, PREFIX_TERMS - 1)[:PREFIX_TERMS]]
+        return exact, completions.tolist()
+
+    def scores(self, text):
+        """BM25 score of every title for the query `text`; the last word also matches as a prefix."""
+        exact, completions = self._terms(text)
+        return self._dense(exact, completions)
+
+    def _dense(self, exact, completions):
+        # Posting lists are sorted by row, so bincount streams through the score array
+        rows, impacts = self._gather(exact)
+        scores = np.bincount(rows, weights=impacts, minlength=self.num_rows).astype(np.float32)
+        if completions:
+            # A title matching several completions counts its best one
+            best = np.zeros(self.num_rows, dtype=np.float32)
+            for term in completions:
+                rows = self.rows[self._postings(term)]
+                best[rows] = np.maximum(best[rows], self.impacts[self._postings(term)])
+            scores += best
+        return scores
+
+    def _gather(self, terms):
+        """The concatenated (rows, impacts) postings of `terms`."""
+        slices = [self._postings(term) for term in terms]
+        return (np.concatenate([self.rows[part] for part in slices] or [np.empty(0, dtype=np.int32)]),
+                np.concatenate([self.impacts[part] for part in slices] or [np.empty(0, dtype=np.float32)]))
+
+    def _sparse(self, exact, completions):
+        """(rows, scores) of just the titles the query touches, for queries with short posting lists."""
+        rows, impacts = self._gather(exact)
+        if completions:
+            extra, extra_impacts = self._gather(completions)
+            # Best completion per title: sort by (row, impact) and keep the last of each row. Positive
+            # float32 bit patterns order like the floats, so both fit one int64 sort key
+            keys = np.sort(extra.astype(np.int64) << 32 | extra_impacts.view(np.uint32))
+            extra = (keys >> 32).astype(np.int32)
+            extra_impacts = (keys & 0xFFFFFFFF).astype(np.uint32).view(np.float32)
+            last = np.r_[extra[1:] != extra[:-1], True]
+            rows, impacts = np.concatenate([rows, extra[last]]), np.concatenate([impacts, extra_impacts[last]])
+        order = np.argsort(rows, kind='stable')
+        rows, impacts = rows[order], impacts[order]
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.empty(0, dtype=np.int64)
+        return rows[starts].astype(np.int64), np.add.reduceat(impacts, starts) if len(starts) else impacts
+
+    def search(self, text, k=10, allowed=None, rank=None):
+        """
+        Returns (row ids, scores) of the `k` best titles for `text`. `allowed` is an
+        optional boolean mask over rows (e.g. the sidebar filter result); equal
+        scores are ordered by `rank` (lower first) if given, else by row id.
+        """
+        exact, completions = self._terms(text)
+        terms = exact + completions
+        postings = int((self.offsets[np.add(terms, 1)] - self.offsets[terms]).sum()) if terms else 0
+        if postings * SPARSE_FRACTION < self.num_rows:
+            rows, scores = self._sparse(exact, completions)
+            if allowed is not None:
+                keep = allowed[rows]
+                rows, scores = rows[keep], scores[keep]
+        else:
+            rows, scores = None, self._dense(exact, completions)
+            if allowed is not None:
+                np.multiply(scores, allowed, out=scores)
+        best = _top(scores, k, rows if rank is None else (rank if rows is None else rank[rows]))
+        return (best if rows is None else rows[best]), scores[best]
+
+
+def _top(scores, k, ties):
+    """
+    Positions of the `k` highest positive `scores`, best first. Equal scores are
+    ordered by `ties` (lower first), or by position if it is None.
+    """
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    # Selecting among the lowest of the negated scores; numpy's selection slows down badly when the
+    # k-th position falls at the end of a long run of equal values (the zeros)
+    threshold = -np.partition(-scores, k - 1)[k - 1]
+    if threshold <= 0:
+        # Fewer than k matches: all of them
+        best = np.flatnonzero(scores > 0)
+    else:
+        # Everything tied with the k-th best competes on its tie key, not just what partition kept
+        best = np.flatnonzero(scores > threshold)
+        tied = np.flatnonzero(scores == threshold)
+        need = k - len(best)
+        if len(tied) > need:
+            key = tied if ties is None else ties[tied]
+            tied = tied[np.argpartition(key, need - 1)[:need]]
+        best = np.concatenate([best, tied])
+    key = best if ties is None else ties[best]
+    return best[np.lexsort((key, -scores[best]))]
@@ -0,0 +1,199 @@
+"""
+The landing page's trending carousel, rotated in the browser.
+
+The carousel used to advance by rerunning the whole app script every five
+seconds for every open landing page. Now the server renders all the cards
+into one self-contained HTML payload, and a few lines of JavaScript in the
+browser rotate them. Once the page is drawn, an idle viewer costs the server
+nothing.
+
+TrendingFeed holds the payload for the whole process. The payload is built
+from the TMDB trending list and saved in the PosterStore, so workers and
+restarts share it. Once it is older than the TTL, the next reader starts a
+refresh on a background thread and keeps serving the old payload until the
+new one is ready. If TMDB cannot be reached, the old payload stays in use.
+"""
+import html
+import threading
+import time
+
+import requests
+
+from api_client import TMDB_URL
+from published import Published
+
+# Titles in the carousel: the whole first page of TMDB's weekly trending list
+TRENDING_COUNT = 20
+
+# How long the trending list is used before TMDB is asked again, in seconds
+TRENDING_TTL = 3600
+
+# How soon to try again after TMDB could not be reached, in seconds
+RETRY_SECONDS = 60
+
+# Seconds each card is shown before the browser moves on to the next
+ROTATE_SECONDS = 5
+
+# Height of the carousel frame in pixels: a 300px wide poster, its title, rating and overview
+CAROUSEL_HEIGHT = 760
+
+STORE_KEY = 'tmdb/trending/carousel'
+
+POSTER_BASE = 'https://image.tmdb.org/t/p/w500'
+
+
+def fetch_trending(client, api_key, count=TRENDING_COUNT):
+    """The first `count` titles of TMDB's weekly trending list, as carousel entries."""
+    response = client.get_json('tmdb_trending', f"{TMDB_URL}3/trending/movie/week", params={'api_key': api_key})
+    trending_movies = []
+    for movie in response.get("results", []):
+        # A card without a poster would be an empty frame
+        if not movie.get("poster_path"):
+            continue
+        trending_movies.append({
+            "title": movie["title"],
+            "poster_path": f"{POSTER_BASE}{movie['poster_path']}",
+            "overview": movie.get("overview") or "",
+            "rating": round(movie["vote_average"], 1),
+            "release_date": (movie.get("release_date") or "N/A")[:4]
+        })
+    return trending_movies[:count]
+
+
+CAROUSEL_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><style>
+  body {{ margin: 0; font-family: "Source Sans Pro", sans-serif; background: transparent; }}
+  .carousel {{ display: flex; justify-content: center; }}
+  .movie-card {{ display: none; background: #1C1C1C; color: white; padding: 20px; border-radius: 15px;
+                width: 300px; text-align: center; box-shadow: 0 4px 8px 0 rgba(0,0,0,0.2); }}
+  .movie-card.active {{ display: block; animation: fade 0.6s; }}
+  .movie-card img {{ width: 100%; aspect-ratio: 2 / 3; border-radius: 10px; margin-bottom: 15px; }}
+  .title {{ font-size: 1.2rem; font-weight: bold; margin-bottom: 10px; }}
+  .rating {{ color: #f39c12; font-size: 1rem; margin-bottom: 15px; }}
+  .overview {{ font-size: 0.9rem; color: #bbb; margin: 0; }}
+  .dots {{ text-align: center; margin-top: 10px; }}
+  .dots span {{ display: inline-block; width: 8px; height: 8px; margin: 0 3px; border-radius: 50%;
+               background: #555; cursor: pointer; }}
+  .dots span.active {{ background: #e50914; }}
+  @keyframes fade {{ from {{ opacity: 0.3; }} to {{ opacity: 1; }} }}
+</style></head><body>
+<div class="carousel">{cards}</div>
+<div class="dots">{dots}</div>
+<script>
+  const cards = document.querySelectorAll('.movie-card');
+  const dots = document.querySelectorAll('.dots span');
+  let current = 0;
+  function show(index) {{
+    cards[current].classList.remove('active');
+    dots[current].classList.remove('active');
+    current = (index + cards.length) % cards.length;
+    cards[current].classList.add('active');
+    dots[current].classList.add('active');
+    // Fetch the next poster ahead of time, so the card after this one appears at once
+    const next = cards[(current + 1) % cards.length].querySelector('img');
+    if (next) next.loading = 'eager';
+  }}
+  dots.forEach((dot, index) => dot.addEventListener('click', () => {{ show(index); restart(); }}));
+  let timer;
+  function restart() {{
+    clearInterval(timer);
+    timer = setInterval(() => show(current + 1), {interval});
+  }}
+  if (cards.length > 1) {{ show(0); restart(); }}
+</script>
+</body></html>
+"""
+
+CARD_TEMPLATE = """<div class="movie-card{active}">
+  <img src="{poster}" alt="{title}" loading="{loading}">
+  <div class="title">{title} ({year})</div>
+  <div class="rating">⭐ {rating}</div>
+  <p class="overview">{overview}</p>
+</div>"""
+
+
+def carousel_html(movies, rotate_seconds=ROTATE_SECONDS):
+    """The whole carousel as one HTML document; the browser rotates it every `rotate_seconds`."""
+    cards = []
+    for position, movie in enumerate(movies):
+        overview = movie['overview'][:300] + ('...' if len(movie['overview']) > 300 else '')
+        cards.append(CARD_TEMPLATE.format(
+            active=' active' if position == 0 else '',
+            # The first two posters load right away, the others only when their turn is near
+            loading='eager' if position < 2 else 'lazy',
+            poster=html.escape(movie['poster_path']),
+            title=html.escape(movie['title']),
+            year=html.escape(str(movie['release_date'])),
+            rating=html.escape(str(movie['rating'])),
+            overview=html.escape(overview),
+        ))
+    dots = ''.join('<span class="active"></span>' if position == 0 else '<span></span>'
+                   for position in range(len(movies)))
+    return CAROUSEL_TEMPLATE.format(cards=''.join(cards), dots=dots, interval=int(rotate_seconds * 1000))
+
+
+class TrendingPayload:
+    """One version of the trending list and its rendered carousel."""
+
+    def __init__(self, movies, fetched_at):
+        self.movies = movies
+        self.fetched_at = fetched_at
+        self.html = carousel_html(movies) if movies else None
+
+
+class TrendingFeed:
+    """The process-wide trending payload, refreshed in the background once it is older than `ttl`."""
+
+    def __init__(self, fetch, store=None, ttl=TRENDING_TTL, retry_seconds=RETRY_SECONDS):
+        # `fetch()` returns the list of carousel entries; `store` is an optional PosterStore
+        # that shares the list between workers and restarts
+        self._fetch = fetch
+        self._store = store
+        self.ttl = ttl
+        self.retry_seconds = retry_seconds
+        self._payload = Published()
+        self._refresh_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The newest payload; only the very first call of a process waits for TMDB."""
+        if self._payload.get() is None:
+            with self._lock:
+                if self._payload.get() is None:
+                    self._refresh()
+        elif time.time() >= self._refresh_at:
+            with self._lock:
+                start = not self._refreshing and time.time() >= self._refresh_at
+                self._refreshing = self._refreshing or start
+            if start:
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return self._payload.get()
+
+    def _refresh_in_background(self):
+        try:
+            self._refresh()
+        finally:
+            self._refreshing = False
+
+    def _refresh(self):
+        try:
+            payload = self._load()
+        except (requests.RequestException, ValueError, KeyError, TypeError):
+            # TMDB could not be reached or sent something unexpected: keep what we have and try again a little later
+            self._refresh_at = time.time() + self.retry_seconds
+            if self._payload.get() is None:
+                self._payload.set(TrendingPayload([], time.time()))
+            return
+        self._refresh_at = payload.fetched_at + self.ttl if payload.movies else time.time() + self.retry_seconds
+        self._payload.set(payload)
+
+    def _load(self):
+        # Another worker may have refreshed the stored list already
+        data = None if self._store is None else self._store.get_json(STORE_KEY)
+        if data is not None and data.get('fetched_at', 0) + self.ttl > time.time():
+            return TrendingPayload(data['movies'], data['fetched_at'])
+        payload = TrendingPayload(self._fetch(), time.time())
+        if payload.movies and self._store is not None:
+            self._store.put_json(STORE_KEY, {'movies': payload.movies, 'fetched_at': payload.fetched_at}, self.ttl)
+        return payload
@@ -0,0 +1,132 @@
+"""
+The app's process-wide resources, and a launcher that loads them at boot.
+
+main.py gets its engine, HTTP client, poster store and trending carousel
+from the cached loaders here. The loaders live in a module, not in the
+script, so they are the same functions and share one cache entry wherever
+they are called from.
+
+Only the landing page runs on a fresh session, and it needs the trending
+carousel and nothing of the catalog. So main.py imports the catalog side
+(pandas, pyarrow, numpy, PIL, the indexes) only when the recommendation page
+runs, and the landing page skips that half-second of imports.
+
+Launched through this module, a worker also starts a background thread
+when it boots. The thread loads the catalog, builds its search and
+similarity indexes and fetches the trending payload. The server takes
+connections meanwhile. Whoever asks for one of these first, the thread or
+a user, computes it, and everyone else waits for that result. The first
+user after a deploy thus finds them ready instead of paying for them.
+
+    python warm_start.py --server.port 8501    # takes the options of `streamlit run`
+
+benchmarks/bench_startup.py reports the time to the first page for cold
+and warm starts.
+"""
+import os
+import sys
+import threading
+import time
+
+import streamlit as st
+
+from api_client import ApiClient
+from poster_store import CACHE_DIR, PosterStore
+from trending import TrendingFeed, fetch_trending
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+# On-disk poster thumbnail and metadata cache shared by all sessions and worker processes
+@st.cache_resource(show_spinner=False)
+def load_poster_store():
+    # The thumbnail variant needs PIL, which only the recommendation page imports
+    from thumbnails import THUMBNAIL_VARIANT
+    return PosterStore(os.path.join(CACHE_DIR, THUMBNAIL_VARIANT))
+
+
+# Cache of API data that does not depend on the thumbnail size or format, like the trending list
+@st.cache_resource(show_spinner=False)
+def load_metadata_store():
+    return PosterStore(CACHE_DIR)
+
+
+# Pooled, rate-limited HTTP client for TMDB and OMDb shared by all sessions
+@st.cache_resource(show_spinner=False)
+def load_api_client():
+    return ApiClient()
+
+
+# The trending carousel, rendered once per process and refreshed in the background
+@st.cache_resource(show_spinner=False)
+def load_trending_feed(api_key):
+    api_client = load_api_client()
+    return TrendingFeed(lambda: fetch_trending(api_client, api_key), store=load_metadata_store())
+
+
+# The filter and recommendation logic lives in the engine, shared with the HTTP API (api.py).
+# It is cached once per process; the catalog files are memory-mapped, so cache_resource
+# shares them instead of pickling a copy on every rerun. A new catalog version published
+# to the store is picked up in the background. Workers started by `serving.py serve`
+# attach to the catalog and indexes its loader published.
+@st.cache_resource(show_spinner=False)
+def load_engine():
+    from engine import RecommendationEngine, open_live_catalog
+    return RecommendationEngine(open_live_catalog())
+
+
+def preload():
+    """Loads the trending payload, the catalog and its indexes; returns the seconds each took."""
+    timings = {}
+    start = time.perf_counter()
+    try:
+        api_key = st.secrets['tmdb_api']['api_key']
+    except (KeyError, FileNotFoundError):
+        api_key = None
+    if api_key is not None:
+        load_trending_feed(api_key).current()
+        timings['trending'] = time.perf_counter() - start
+    start = time.perf_counter()
+    load_engine().indexes()
+    timings['engine'] = time.perf_counter() - start
+    return timings
+
+
+def start_preload(after_server_start=False):
+    """
+    Runs preload() on a daemon thread and prints what it loaded. With
+    `after_server_start`, the thread first waits for the Streamlit server to
+    be up, so reading the secrets does not load its config before the
+    command-line options are applied.
+    """
+    def run():
+        if after_server_start:
+            from streamlit import runtime
+            while not runtime.exists():
+                time.sleep(0.05)
+        try:
+            timings = preload()
+        except Exception as error:
+            # The app loads whatever is missing on first use, as without a warm start
+            print(f"Warm start failed: {error!r}", file=sys.stderr, flush=True)
+            return
+        print('Warm start: ' + ', '.join(f"{name} in {seconds:.1f}s" for name, seconds in timings.items()),
+              flush=True)
+
+    thread = threading.Thread(target=run, name='warm-start', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    from streamlit.web import cli
+    # Through the module main.py imports, not this __main__ copy of it, so both use the same caches
+    import warm_start
+    warm_start.start_preload(after_server_start=True)
+    # The rest of the command line is passed to `streamlit run main.py`
+    sys.argv = ['streamlit', 'run', APP, *sys.argv[1:]]
+    cli.main()
+
+
+if __name__ == '__main__':
+    main()